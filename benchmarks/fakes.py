@@ -0,0 +1,263 @@
+"""Latency-injecting stand-ins for OpenAI, the vector store and Neo4j.
+
+Each fake draws its latency from a :class:`LatencyModel` (log-normal around a median, with a
+configurable p99), fails with a configurable error rate and enforces an optional requests-per-
+second limit by raising rate-limit errors, so benchmarks exercise the same retry and timeout
+paths the real services trigger.
+"""
+import math
+import random
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    from openai.error import RateLimitError, APIError
+except Exception:  # pragma: no cover - openai is a hard dependency of the app
+    class RateLimitError(Exception):
+        pass
+
+    class APIError(Exception):
+        pass
+
+
+class LatencyModel:
+    """Samples request latency and injects errors / rate limits.
+
+    ``median_ms`` and ``p99_ms`` define a log-normal distribution; ``error_rate`` is the chance a
+    call raises ``error_cls``; ``rate_limit_rps`` (if set) makes calls beyond that rate raise
+    ``RateLimitError`` like an HTTP 429.
+    """
+
+    def __init__(self, median_ms: float = 0.0, p99_ms: Optional[float] = None, error_rate: float = 0.0,
+                 rate_limit_rps: Optional[float] = None, seed: Optional[int] = None, error_cls=APIError):
+        self.median_ms = median_ms
+        self.p99_ms = p99_ms if p99_ms is not None else median_ms
+        self.error_rate = error_rate
+        self.rate_limit_rps = rate_limit_rps
+        self.error_cls = error_cls
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        # sigma so that median * exp(2.326 * sigma) == p99
+        ratio = self.p99_ms / self.median_ms if self.median_ms > 0 else 1.0
+        self._sigma = math.log(ratio) / 2.326 if ratio > 1 else 0.0
+
+    def sample_seconds(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            z = self._rng.gauss(0.0, 1.0)
+        return self.median_ms * math.exp(self._sigma * z) / 1000.0
+
+    def call(self):
+        """Account for one request: maybe reject it, sleep for its latency, maybe fail it."""
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit_rps:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start = now
+                    self._window_calls = 0
+                self._window_calls += 1
+                if self._window_calls > self.rate_limit_rps:
+                    self.rate_limited += 1
+                    raise RateLimitError("Rate limit reached (simulated 429)")
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+        delay = self.sample_seconds()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self._lock:
+                self.errors += 1
+            raise self.error_cls("simulated backend error")
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "rate_limited": self.rate_limited}
+
+
+def _fake_vector(text: str, dim: int) -> List[float]:
+    # deterministic per text so repeated texts embed identically
+    rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+    return rng.standard_normal(dim).astype(np.float32).tolist()
+
+
+class FakeOpenAI:
+    """Provides ``Embedding.create`` and ``ChatCompletion.create`` with the 0.x SDK response shapes."""
+
+    def __init__(self, embed_latency: LatencyModel = None, chat_ttft: LatencyModel = None,
+                 token_interval_ms: float = 0.0, answer_tokens: int = 50, dim: int = 64):
+        self.embed_latency = embed_latency or LatencyModel()
+        self.chat_ttft = chat_ttft or LatencyModel()
+        self.token_interval_ms = token_interval_ms
+        self.answer_tokens = answer_tokens
+        self.dim = dim
+        fake = self
+
+        class Embedding:
+            @staticmethod
+            def create(model=None, input=None, **kwargs):
+                fake.embed_latency.call()
+                texts = [input] if isinstance(input, str) else list(input)
+                tokens = sum(len(t.split()) for t in texts)
+                return {
+                    "data": [{"index": i, "embedding": _fake_vector(t, fake.dim)} for i, t in enumerate(texts)],
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                }
+
+        class ChatCompletion:
+            @staticmethod
+            def create(model=None, messages=None, stream=False, max_tokens=None, **kwargs):
+                fake.chat_ttft.call()
+                n = min(fake.answer_tokens, max_tokens or fake.answer_tokens)
+                if not stream:
+                    time.sleep(fake.token_interval_ms * n / 1000.0)
+                    content = " ".join(["token"] * n)
+                    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                return fake._stream(n)
+
+        self.Embedding = Embedding
+        self.ChatCompletion = ChatCompletion
+
+    def _stream(self, n: int):
+        yield {"choices": [{"delta": {"role": "assistant"}}]}
+        for i in range(n):
+            if i and self.token_interval_ms:
+                time.sleep(self.token_interval_ms / 1000.0)
+            yield {"choices": [{"delta": {"content": "token "}}]}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+
+
+class FakeVectorIndex:
+    """Vector store stand-in: stores ids/metadata, returns the first ``top_k`` ids it holds."""
+
+    def __init__(self, query_latency: LatencyModel = None, upsert_latency: LatencyModel = None):
+        self.query_latency = query_latency or LatencyModel()
+        self.upsert_latency = upsert_latency or LatencyModel()
+        self._lock = threading.Lock()
+        self.metadata = {}
+        self.dim = None
+
+    def upsert(self, vectors=None):
+        self.upsert_latency.call()
+        with self._lock:
+            for v in vectors:
+                vid, values, meta = (v["id"], v["values"], v.get("metadata", {})) if isinstance(v, dict) else v
+                self.dim = len(values)
+                self.metadata[vid] = meta
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector=None, top_k=3, include_metadata=True):
+        self.query_latency.call()
+        with self._lock:
+            ids = list(self.metadata)[:top_k]
+        return {"matches": [{"id": i, "score": 1.0 - 0.01 * n, "metadata": self.metadata[i] if include_metadata else {}}
+                            for n, i in enumerate(ids)]}
+
+    def delete(self, ids):
+        with self._lock:
+            for i in ids:
+                self.metadata.pop(i, None)
+
+    def describe_index_stats(self):
+        with self._lock:
+            n = len(self.metadata)
+        return {"dimension": self.dim, "total_vector_count": n, "namespaces": {"": {"vector_count": n}}}
+
+
+class _FakeRecord(dict):
+    def data(self):
+        return dict(self)
+
+
+class _FakeResult(list):
+    def consume(self):
+        return None
+
+
+class _FakeTx:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, params=None):
+        return self.driver._execute(query, params or {})
+
+
+class _FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, params=None):
+        self.driver.latency.call()
+        return self.driver._execute(getattr(query, "text", query), params or {})
+
+    def execute_write(self, fn):
+        self.driver.latency.call()
+        return fn(_FakeTx(self.driver))
+
+    write_transaction = execute_write
+    execute_read = execute_write
+
+
+class FakeNeo4jDriver:
+    """Cypher session stand-in: every session call pays one round trip of ``latency``.
+
+    Writes with ``$rows`` are counted; expansions over ``$ids`` return each seed with ``fanout``
+    neighbours; other reads return up to ``limit`` synthetic Location records.
+    """
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.queries = 0
+
+    def session(self, **kwargs):
+        return _FakeSession(self)
+
+    def close(self):
+        pass
+
+    def _execute(self, query, params):
+        with self._lock:
+            self.queries += 1
+            rows = params.get("rows")
+            if rows is not None:
+                self.rows_written += len(rows)
+                return _FakeResult()
+        seeds = params.get("ids")
+        if seeds is not None:
+            # graph expansion: each seed node with ``fanout`` synthetic neighbours
+            fanout = int(params.get("fanout", 0) or 0)
+            return _FakeResult(
+                _FakeRecord(id=str(i), name=f"Location {i}", description=f"Synthetic location {i}", neighbors=[
+                    {"id": f"{i}-{n}", "name": f"Neighbour {n}", "description": "", "hops": 1, "rel": "NEAR"}
+                    for n in range(fanout)
+                ])
+                for i in seeds
+            )
+        limit = int(params.get("limit", 3) or 3)
+        batch = params.get("queries")
+        if batch is not None:
+            # UNWIND over questions: every row is tagged with its question index
+            return _FakeResult(
+                _FakeRecord(i=q["i"], id=str(n), name=f"Location {n}", description=f"Synthetic location {n}",
+                            score=1.0 / (n + 1))
+                for q in batch for n in range(limit)
+            )
+        return _FakeResult(
+            _FakeRecord(id=str(i), name=f"Location {i}", description=f"Synthetic location {i}", score=1.0 / (i + 1))
+            for i in range(limit)
+        )
@@ -0,0 +1,70 @@
+"""Synthetic corpus and location generators.
+
+Rows are produced in chunks and appended to the CSV, so generating millions of rows needs
+only one chunk in memory. Output matches the column layout of ``data/docs.csv`` and
+``data/locations.csv``.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+_WORDS = np.array(
+    "park museum tower bridge river market square garden gallery theatre harbor cathedral "
+    "library station plaza monument island beach castle palace temple stadium zoo aquarium "
+    "historic modern famous quiet busy iconic scenic ancient central old new grand".split()
+)
+_TAGS = np.array(["park", "monument", "building", "landmark", "museum", "food", "nightlife", "nature"])
+
+
+def _sentences(rng: np.random.Generator, n: int, min_words: int, max_words: int) -> list:
+    lengths = rng.integers(min_words, max_words + 1, size=n)
+    words = rng.choice(_WORDS, size=int(lengths.sum()))
+    out, start = [], 0
+    for length in lengths:
+        out.append(" ".join(words[start:start + length]).capitalize() + ".")
+        start += length
+    return out
+
+
+def write_synthetic_docs(path: str, n: int, n_locations: int = None, seed: int = 0, chunk_size: int = 100000,
+                         min_words: int = 8, max_words: int = 60) -> str:
+    """Write ``n`` documents (id,text,metadata) whose metadata links to ``n_locations`` location ids."""
+    rng = np.random.default_rng(seed)
+    n_locations = n_locations or max(1, n // 4)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        texts = _sentences(rng, size, min_words, max_words)
+        links = rng.integers(1, n_locations + 1, size=size)
+        meta = [json.dumps({"source": "synthetic", "text_snippet": t[:60], "neo4j_id": str(l)})
+                for t, l in zip(texts, links)]
+        pd.DataFrame({"id": [f"doc{start + i + 1}" for i in range(size)], "text": texts, "metadata": meta}).to_csv(
+            path, mode="w" if start == 0 else "a", header=start == 0, index=False
+        )
+    return path
+
+
+def write_synthetic_locations(path: str, n: int, seed: int = 0, chunk_size: int = 100000,
+                              center=(40.75, -73.98), spread_deg: float = 0.5) -> str:
+    """Write ``n`` locations (id,name,lat,lon,description,tags) scattered around ``center``."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        ids = np.arange(start + 1, start + size + 1)
+        names = [f"{a.capitalize()} {b.capitalize()} {i}" for a, b, i in
+                 zip(rng.choice(_WORDS, size), rng.choice(_WORDS, size), ids)]
+        pd.DataFrame({
+            "id": ids,
+            "name": names,
+            "lat": np.round(center[0] + rng.uniform(-spread_deg, spread_deg, size), 6),
+            "lon": np.round(center[1] + rng.uniform(-spread_deg, spread_deg, size), 6),
+            "description": _sentences(rng, size, 4, 12),
+            "tags": rng.choice(_TAGS, size),
+        }).to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return path
+
+
+def synthetic_queries(n: int, seed: int = 0) -> list:
+    """Distinct natural-language questions, so per-query caches do not flatter the numbers."""
+    rng = np.random.default_rng(seed)
+    return [f"Tell me about the {' '.join(rng.choice(_WORDS, 3))} number {i}" for i in range(n)]
@@ -0,0 +1,310 @@
+"""Offline benchmark harness for the hybrid pipeline.
+
+Runs ``answer_query``, ``answer_queries``, ``upload_docs`` and ``load_locations`` against the latency-injecting
+fakes in ``benchmarks.fakes`` and reports QPS, p50/p99 latency and peak RSS as JSON. Results
+can be saved as a baseline and later runs compared against it::
+
+    python -m benchmarks.run --profile realistic --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --profile realistic --baseline benchmarks/baseline.json
+"""
+import os
+import io
+import json
+import sys
+import time
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from unittest import mock
+
+import numpy as np
+import openai
+
+from benchmarks.fakes import FakeNeo4jDriver, FakeOpenAI, FakeVectorIndex, LatencyModel
+from benchmarks.generators import synthetic_queries, write_synthetic_docs, write_synthetic_locations
+from src import tracing
+
+# name -> {backend: (median_ms, p99_ms, error_rate)}; chat also has a per-token interval
+PROFILES: Dict[str, dict] = {
+    "zero": {"embed": (0, 0, 0.0), "chat": (0, 0, 0.0), "token_ms": 0.0, "vector": (0, 0, 0.0),
+             "upsert": (0, 0, 0.0), "neo4j": (0, 0, 0.0)},
+    "realistic": {"embed": (80, 300, 0.0), "chat": (400, 1500, 0.0), "token_ms": 10.0, "vector": (30, 120, 0.0),
+                  "upsert": (60, 250, 0.0), "neo4j": (15, 80, 0.0)},
+    "flaky": {"embed": (80, 300, 0.02), "chat": (400, 1500, 0.01), "token_ms": 10.0, "vector": (30, 400, 0.02),
+              "upsert": (60, 250, 0.05), "neo4j": (15, 2000, 0.02)},
+}
+
+
+def _percentile_ms(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(np.asarray(values), q)) * 1000.0, 3)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far (None where ``resource`` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _latency(spec, seed, rate_limit_rps=None) -> LatencyModel:
+    median, p99, error_rate = spec
+    return LatencyModel(median, p99, error_rate, rate_limit_rps=rate_limit_rps, seed=seed)
+
+
+class OfflineBackends:
+    """Fake OpenAI, vector store and Neo4j wired into the pipeline modules for one benchmark run."""
+
+    def __init__(self, profile: str = "zero", workdir: Optional[str] = None, embed_rps: Optional[float] = None,
+                 caches: bool = False, seed: int = 0):
+        spec = PROFILES[profile]
+        self.workdir = workdir or tempfile.mkdtemp(prefix="bench-")
+        os.makedirs(self.workdir, exist_ok=True)
+        self.caches = caches
+        self.openai = FakeOpenAI(_latency(spec["embed"], seed, embed_rps), _latency(spec["chat"], seed + 1),
+                                 token_interval_ms=spec["token_ms"])
+        self.index = FakeVectorIndex(_latency(spec["vector"], seed + 2), _latency(spec["upsert"], seed + 3))
+        self.driver = FakeNeo4jDriver(_latency(spec["neo4j"], seed + 4))
+        self._stack = None
+
+    def _neo4j_client(self, *args, **kwargs):
+        # built without __init__ so no real driver is opened
+        client = object.__new__(self._client_cls)
+        client.driver = self.driver
+        return client
+
+    def __enter__(self):
+        import src.hybrid_chat as hc
+        from src.embedding_scheduler import EmbeddingScheduler
+        self.scheduler = EmbeddingScheduler()
+        from src.neo4j_loader import Neo4jClient
+        self._client_cls = Neo4jClient
+        stack = contextlib.ExitStack()
+        patches = [
+            mock.patch.object(openai, "Embedding", self.openai.Embedding),
+            mock.patch.object(openai, "ChatCompletion", self.openai.ChatCompletion),
+            mock.patch.dict(os.environ, {"OPENAI_API_KEY": "offline", "OPENAI_MODEL": "offline",
+                                         "PINECONE_UPLOAD_REPORT": os.path.join(self.workdir, "report.json")}),
+            mock.patch("src.hybrid_chat._get_vector_store", lambda: self.index),
+            mock.patch("src.hybrid_chat._get_neo4j_driver", lambda: self.driver),
+            mock.patch("src.pinecone_uploader.open_vector_store", lambda dim: self.index),
+            mock.patch("src.pinecone_uploader.RETRY_BACKOFF", 0.05),
+            mock.patch("src.embedding_scheduler.EMBED_RETRY_BACKOFF", 0.05),
+            # each run starts from a fresh rate limiter and controller
+            mock.patch("src.embedding_scheduler._scheduler", self.scheduler),
+            mock.patch("src.neo4j_loader.Neo4jClient", self._neo4j_client),
+            mock.patch("src.data_version.DATA_VERSION_PATH", os.path.join(self.workdir, "data_version.json")),
+            mock.patch("src.upload_manifest.UPLOAD_MANIFEST_PATH", os.path.join(self.workdir, "manifest.sqlite3")),
+            mock.patch("src.embedding_cache.EMBEDDING_CACHE_DIR", os.path.join(self.workdir, "embeddings")),
+            mock.patch("src.bm25_index.BM25_INDEX_PATH", os.path.join(self.workdir, "bm25_index.npz")),
+            mock.patch("src.pinecone_uploader.BM25_INDEX_PATH", os.path.join(self.workdir, "bm25_index.npz")),
+        ]
+        if not self.caches:
+            patches += [
+                mock.patch("src.embedding_cache.EMBEDDING_CACHE_ENABLED", False),
+                mock.patch("src.answer_cache.ANSWER_CACHE_ENABLED", False),
+            ]
+        for p in patches:
+            stack.enter_context(p)
+        hc.pinecone_search.cache_clear()
+        hc.neo4j_search.cache_clear()
+        hc.expand_graph.cache_clear()
+        self._stack = stack
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "embedding": self.openai.embed_latency.stats(),
+            "chat": self.openai.chat_ttft.stats(),
+            "vector_query": self.index.query_latency.stats(),
+            "vector_upsert": self.index.upsert_latency.stats(),
+            "neo4j": self.driver.latency.stats(),
+            "embedding_scheduler": self.scheduler.controller.snapshot(),
+        }
+
+
+def _result(scenario: str, params: dict, items: int, elapsed: float, latencies: List[float], errors: int,
+            backends: OfflineBackends) -> dict:
+    return {
+        "scenario": scenario,
+        "params": params,
+        "items": items,
+        "elapsed_s": round(elapsed, 3),
+        "qps": round(items / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p99_ms": _percentile_ms(latencies, 99),
+        "errors": errors,
+        "peak_rss_mb": peak_rss_mb(),
+        "backends": backends.stats(),
+    }
+
+
+def bench_answer_query(n_queries: int = 100, concurrency: int = 8, profile: str = "zero", **kwargs) -> dict:
+    from src.hybrid_chat import answer_query
+    queries = synthetic_queries(n_queries)
+    latencies, errors = [], 0
+
+    def one(q):
+        t0 = time.perf_counter()
+        answer_query(q)
+        return time.perf_counter() - t0
+
+    with OfflineBackends(profile, **kwargs) as backends:
+        backends.index.upsert([(f"doc{i}", [0.0], {"text_snippet": f"snippet {i}", "neo4j_id": str(i)})
+                               for i in range(10)])
+        backends.index.upsert_latency.calls = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(one, q) for q in queries]
+            for f in futures:
+                try:
+                    latencies.append(f.result())
+                except Exception:
+                    errors += 1
+        elapsed = time.perf_counter() - started
+    return _result("answer_query", {"queries": n_queries, "concurrency": concurrency, "profile": profile},
+                   n_queries, elapsed, latencies, errors, backends)
+
+
+def bench_answer_queries(n_queries: int = 100, concurrency: int = 8, profile: str = "zero", **kwargs) -> dict:
+    from src.hybrid_chat import answer_queries
+    queries = synthetic_queries(n_queries)
+    with OfflineBackends(profile, **kwargs) as backends:
+        backends.index.upsert([(f"doc{i}", [0.0], {"text_snippet": f"snippet {i}", "neo4j_id": str(i)})
+                               for i in range(10)])
+        tracing.metrics.reset()
+        started = time.perf_counter()
+        results = answer_queries(queries, concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        latencies = list(tracing.metrics.histograms["llm"].samples) if "llm" in tracing.metrics.histograms else []
+    errors = sum(1 for r in results if r.error)
+    return _result("answer_queries", {"queries": n_queries, "concurrency": concurrency, "profile": profile},
+                   n_queries, elapsed, latencies, errors, backends)
+
+
+def bench_upload_docs(n_docs: int = 10000, profile: str = "zero", **kwargs) -> dict:
+    from src.pinecone_uploader import upload_docs
+    with OfflineBackends(profile, **kwargs) as backends:
+        csv_path = write_synthetic_docs(os.path.join(backends.workdir, "docs.csv"), n_docs)
+        tracing.metrics.reset()
+        errors = 0
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                upload_docs(csv_path)
+        except Exception as e:
+            errors += 1
+            print(f"⚠️ upload_docs failed: {e}", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        latencies = list(tracing.metrics.histograms["upload_upsert"].samples) \
+            if "upload_upsert" in tracing.metrics.histograms else []
+    return _result("upload_docs", {"docs": n_docs, "profile": profile}, n_docs, elapsed, latencies, errors, backends)
+
+
+def bench_load_locations(n_locations: int = 10000, batch_size: int = 1000, workers: int = 2,
+                         profile: str = "zero", **kwargs) -> dict:
+    from src.neo4j_loader import load_locations
+    with OfflineBackends(profile, **kwargs) as backends:
+        csv_path = write_synthetic_locations(os.path.join(backends.workdir, "locations.csv"), n_locations)
+        tracing.metrics.reset()
+        errors = 0
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                load_locations(csv_path, batch_size=batch_size, workers=workers)
+        except Exception as e:
+            errors += 1
+            print(f"⚠️ load_locations failed: {e}", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+        latencies = list(tracing.metrics.histograms["neo4j_write_batch"].samples) \
+            if "neo4j_write_batch" in tracing.metrics.histograms else []
+    return _result("load_locations", {"locations": n_locations, "batch_size": batch_size, "workers": workers,
+                                      "profile": profile}, n_locations, elapsed, latencies, errors, backends)
+
+
+SCENARIOS = {
+    "answer_query": bench_answer_query,
+    "answer_queries": bench_answer_queries,
+    "upload_docs": bench_upload_docs,
+    "load_locations": bench_load_locations,
+}
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float = 0.2) -> List[str]:
+    """Return human-readable regressions: QPS below or p99 above the baseline by more than ``tolerance``."""
+    base = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(r["scenario"])
+        if b is None:
+            continue
+        if b.get("qps") and r.get("qps") is not None and r["qps"] < b["qps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: qps {r['qps']} < baseline {b['qps']} (-{tolerance:.0%})")
+        if b.get("p99_ms") and r.get("p99_ms") is not None and r["p99_ms"] > b["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p99 {r['p99_ms']}ms > baseline {b['p99_ms']}ms (+{tolerance:.0%})")
+        if r.get("errors", 0) > b.get("errors", 0):
+            regressions.append(f"{r['scenario']}: {r['errors']} errors (baseline {b.get('errors', 0)})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run offline benchmarks against simulated backends")
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--profile", choices=list(PROFILES), default="realistic")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--locations", type=int, default=10000)
+    parser.add_argument("--embed-rps", type=float, default=None, help="Simulated embeddings rate limit (requests/s)")
+    parser.add_argument("--caches", action="store_true", help="Keep the embedding/answer caches enabled")
+    parser.add_argument("--out", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", default=None, help="Also store the results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    common = {"profile": args.profile, "embed_rps": args.embed_rps, "caches": args.caches}
+    runs = {
+        "answer_query": lambda: bench_answer_query(args.queries, args.concurrency, **common),
+        "answer_queries": lambda: bench_answer_queries(args.queries, args.concurrency, **common),
+        "upload_docs": lambda: bench_upload_docs(args.docs, **common),
+        "load_locations": lambda: bench_load_locations(args.locations, **common),
+    }
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in names:
+        result = runs[name]()
+        results.append(result)
+        print(f"{name:15s} qps={result['qps']} p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+              f"errors={result['errors']} peak_rss={result['peak_rss_mb']}MB")
+
+    for path in filter(None, [args.out, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from src.data_version import current_version
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1").lower() not in ("0", "false", "no", "off")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1024))
+# a stored question this similar (under the same key) is the same question: store replaces it
+_SAME_QUESTION = 0.9999
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CachedAnswer:
+    __slots__ = ("query", "answer", "docs", "graph", "created", "key")
+
+    def __init__(self, query: str, answer: str, docs: List[dict], graph: List[dict], created: float,
+                 key: Hashable = None):
+        self.query = query
+        self.answer = answer
+        self.docs = docs
+        self.graph = graph
+        self.created = created
+        self.key = key
+
+
+class SemanticAnswerCache:
+    """Answer-level cache keyed by query embedding.
+
+    A lookup returns the stored answer (and its citations) for the most similar cached question
+    if the cosine similarity is at least ``threshold`` and it was stored under the same ``key``
+    (the answer settings: model, ``top_k``, ``limit``). Entries expire after ``ttl`` seconds, the
+    least recently used entry is evicted beyond ``max_entries``, and the whole cache is dropped
+    whenever the loaders' data-version stamp changes. Storing the same question again under the
+    same key replaces its entry; a lookup whose embedding has a different dimension than the
+    stored ones (the embedding model changed) is a miss and drops them.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, version_fn: Callable[[], str] = current_version):
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = ANSWER_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or ANSWER_CACHE_MAX_ENTRIES
+        self.version_fn = version_fn
+        self._version = version_fn()
+        self._lock = threading.Lock()
+        self._matrix = None  # (max_entries, dim) unit vectors, one row per slot
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()  # slot -> entry, LRU order
+        self._free: List[int] = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._free = list(range(self.max_entries)) if self._matrix is not None else []
+
+    def _similarities(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+        return slots, self._matrix[slots] @ q
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _remove(self, slot: int):
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def lookup(self, vector: Sequence[float], key: Hashable = None) -> Optional[Tuple[CachedAnswer, float]]:
+        """Return ``(entry, similarity)`` for the closest live entry stored under ``key``, or None.
+
+        Entries are shared between threads and never modified here.
+        """
+        with self._lock:
+            self._check_version()
+            if not self._entries:
+                self.misses += 1
+                return None
+            q = np.asarray(vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            if self._matrix.shape[1] != q.shape[0]:
+                # stored under another embedding model: none of it can match any more
+                self._matrix = None
+                self._clear()
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            slots, sims = self._similarities(q)
+            now = time.time()
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                slot = int(slots[i])
+                entry = self._entries[slot]
+                if now - entry.created > self.ttl:
+                    self._remove(slot)
+                    continue
+                if entry.key != key:
+                    continue
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return entry, float(sims[i])
+            self.misses += 1
+            return None
+
+    def store(self, vector: Sequence[float], query: str, answer: str, docs: List[dict], graph: List[dict],
+              key: Hashable = None):
+        with self._lock:
+            self._check_version()
+            q = np.asarray(vector, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self._matrix = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free = list(range(self.max_entries))
+            if self._entries:
+                # concurrent misses on the same question each store it; keep one entry
+                slots, sims = self._similarities(q)
+                for slot in slots[sims >= _SAME_QUESTION]:
+                    if self._entries[int(slot)].key == key:
+                        self._remove(int(slot))
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+            slot = self._free.pop()
+            self._matrix[slot] = q
+            self._entries[slot] = CachedAnswer(query, answer, docs, graph, time.time(), key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """Return the process-wide answer cache, or None when ANSWER_CACHE is disabled."""
+    global _cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
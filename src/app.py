@@ -1,7 +1,44 @@
 import os
 import streamlit as st
-from src.hybrid_chat import answer_query, pinecone_search, neo4j_search
-import time
+from src.hybrid_chat import stream_answer, pinecone_search, neo4j_search, expand_graph
+from src.hybrid_chat import prewarm as prewarm_clients
+from src.answer_cache import get_answer_cache
+from src.graph_viz import export_view, graph_version
+from src import tracing
+
+
+@st.cache_data(show_spinner="Rendering graph...", max_entries=64)
+def _graph_view_html(version, page=0, center=None, depth=1):
+    # ``version`` is part of the cache key: a graph reload renders fresh views
+    with open(export_view(page=page, center=center, depth=depth), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@st.cache_resource(show_spinner="Connecting to the vector store and Neo4j...")
+def _prewarmed_clients():
+    # the clients themselves are module-level singletons in hybrid_chat; this runs their setup once
+    return prewarm_clients()
+
+
+@st.cache_resource
+def _graph_view_failures():
+    # data version -> error of a failed live render; st.cache_data does not cache exceptions, so
+    # without this every rerun would wait on an unreachable Neo4j again before falling back
+    return {}
+
+
+@st.cache_data(max_entries=1)
+def _exported_html(path, mtime_ns):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _show_exported_graph():
+    # no Neo4j connection here: fall back to an HTML exported by `neo4j_loader.py --visualize`
+    viz_path = os.path.join("visualization", "neo4j_graph.html")
+    if os.path.exists(viz_path):
+        st.components.v1.html(_exported_html(viz_path, os.stat(viz_path).st_mtime_ns), height=700)
+
 
 st.set_page_config(page_title="Blue Enigma Hybrid Chat", page_icon="🧠")
 st.title("🧠 Blue Enigma — Hybrid AI Chat")
@@ -9,72 +46,101 @@ st.title("🧠 Blue Enigma — Hybrid AI Chat")
 st.sidebar.header("Settings")
 top_k = st.sidebar.slider("Pinecone top_k", min_value=1, max_value=10, value=3)
 show_visual = st.sidebar.checkbox("Show graph visualization (if generated)", value=True)
-prewarm = st.sidebar.checkbox("Pre-warm Pinecone & Neo4j clients (reduces first-query latency)", value=False)
+if show_visual:
+    viz_center = st.sidebar.text_input("Graph: show neighbourhood of location (id or name)", value="").strip()
+    viz_depth = st.sidebar.slider("Graph: neighbourhood hops", min_value=1, max_value=3, value=1)
+    viz_page = st.sidebar.number_input("Graph: overview page", min_value=1, value=1, step=1)
+prewarm = st.sidebar.checkbox("Pre-warm vector store & Neo4j clients (reduces first-query latency)", value=False)
 clear_cache = st.sidebar.button("Clear in-memory caches")
+show_metrics = st.sidebar.checkbox("Show pipeline metrics (p50/p95/p99)", value=False)
 
 query = st.text_input("Ask your question about any location:")
 if prewarm:
-    # attempt to initialize external clients once to reduce latency on first query
-    try:
-        from src.hybrid_chat import _get_pinecone_index, _get_neo4j_driver
-        _get_pinecone_index()
-        _get_neo4j_driver()
+    # initialize external clients once per server process, not on every rerun
+    failures = {name: error for name, error in _prewarmed_clients().items() if error}
+    if failures:
+        _prewarmed_clients.clear()  # retry on the next rerun
+        if failures.get("neo4j"):
+            _graph_view_failures()[graph_version()] = failures["neo4j"]
+        st.sidebar.error(f"Pre-warm failed: {failures}")
+    else:
         st.sidebar.info("Clients pre-warmed")
-    except Exception as e:
-        st.sidebar.error(f"Pre-warm failed: {e}")
 
 if clear_cache:
     try:
         pinecone_search.cache_clear()
         neo4j_search.cache_clear()
+        expand_graph.cache_clear()
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.clear()
         st.sidebar.success("Caches cleared")
     except Exception as e:
         st.sidebar.error(f"Failed to clear caches: {e}")
 if st.button("Ask") and query:
-    with st.spinner("Thinking..."):
+    result = None
+    with tracing.trace() as request_trace:
         try:
-            # measure latency
-            start = time.perf_counter()
-            answer = answer_query(query)
-            elapsed = time.perf_counter() - start
+            with st.spinner("Retrieving context..."):
+                stream = stream_answer(query, top_k=top_k)
+            st.markdown("### 🤖 Answer:")
+            placeholder = st.empty()
+            partial = ""
+            for token in stream:
+                partial += token
+                placeholder.markdown(partial + "▌")
+            placeholder.markdown(partial)
         except Exception as e:
             st.error(f"Error while answering: {e}")
-            answer = None
-            elapsed = None
+            stream = None
+    if stream is not None:
+        result = stream.result(request_trace)
 
-    if answer:
-        st.markdown("### 🤖 Answer:")
-        st.write(answer)
-        if elapsed is not None:
-            st.info(f"Query latency: {elapsed:.2f} seconds")
+    if result is not None and result.answer:
+        if result.ttft is not None:
+            source = " (answer cache)" if result.cached else ""
+            st.info(f"Time to first token: {result.ttft:.2f}s · total: {result.total_time:.2f}s{source}")
+        if result.dropped:
+            st.warning(f"Answered without: {', '.join(sorted(result.dropped))}")
+        if result.timings:
+            with st.expander("⏱️ Per-stage latency"):
+                st.table([{"stage": k, "ms": round(v * 1000, 1)} for k, v in result.timings.items()])
+                if result.counters:
+                    st.json(result.counters)
 
-        # Show supporting documents from Pinecone (best-effort)
-        try:
-            docs = pinecone_search(query, top_k=top_k)
-            if docs:
-                st.markdown("#### 📄 Supporting documents (Pinecone):")
-                for d in docs:
-                    meta = d.get('metadata', {})
-                    st.write(f"- {meta.get('text_snippet', meta.get('source',''))} (id: {d.get('id')}, score: {d.get('score')})")
-        except Exception:
-            # ignore failures to query Pinecone; user may not have API keys locally
-            pass
-
-        # Show Neo4j graph search results (best-effort)
+        # the exact context the answer was built from; no further backend calls
+        if result.docs:
+            st.markdown("#### 📄 Supporting documents:")
+            for d in result.docs:
+                meta = d.get('metadata', {})
+                st.write(f"- {meta.get('text_snippet', meta.get('source',''))} (id: {d.get('id')}, score: {d.get('score')})")
+        if result.graph:
+            st.markdown("#### 🗺️ Graph facts (Neo4j):")
+            for g in result.graph:
+                st.write(f"- {g.get('name')} — {g.get('description')} (id: {g.get('id')})")
+
+if show_visual:
+    st.markdown("#### 🌐 Graph visualization")
+    version = graph_version()
+    view_failures = _graph_view_failures()
+    if version in view_failures:
+        # live rendering already failed for this data version; a reload retries it
+        _show_exported_graph()
+    else:
         try:
-            graph_hits = neo4j_search(query)
-            if graph_hits:
-                st.markdown("#### 🗺️ Graph hits (Neo4j):")
-                for g in graph_hits:
-                    st.write(f"- {g.get('name')} — {g.get('description')} (id: {g.get('id')})")
-        except Exception:
-            pass
-
-    # optionally embed the pyvis HTML visualization
-    if show_visual:
-        viz_path = os.path.join("visualization", "neo4j_graph.html")
-        if os.path.exists(viz_path):
-            st.markdown("#### 🌐 Graph visualization")
-            with open(viz_path, 'r', encoding='utf-8') as f:
-                html = f.read()
+            if viz_center:
+                html = _graph_view_html(version, center=viz_center, depth=viz_depth)
+            else:
+                html = _graph_view_html(version, page=int(viz_page) - 1)
             st.components.v1.html(html, height=700)
+        except KeyError as e:
+            st.warning(e.args[0])
+        except Exception as e:
+            view_failures[version] = e
+            _show_exported_graph()
+
+if show_metrics:
+    st.markdown("#### 📊 Pipeline metrics")
+    st.json(tracing.metrics.snapshot())
+    with st.expander("Prometheus exposition"):
+        st.code(tracing.metrics.to_prometheus(), language="text")
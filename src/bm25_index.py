@@ -0,0 +1,270 @@
+import os
+import json
+import math
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from src.text_utils import tokenize
+
+load_dotenv()
+
+BM25_ENABLED = os.getenv("BM25_INDEX", "1").lower() not in ("0", "false", "no", "off")
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(".cache", "bm25_index.npz"))
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# reciprocal rank fusion constant (score = sum 1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", 60))
+# Skip the embedding + vector query when the best lexical hit matches every query term and
+# beats the runner-up by this factor. 0 disables the short-circuit.
+BM25_SHORTCIRCUIT_RATIO = float(os.getenv("BM25_SHORTCIRCUIT_RATIO", 0))
+
+# the metadata fields the answer path reads from a doc hit; nothing else is kept in the index
+_HIT_FIELDS = ("text_snippet", "source", "neo4j_id")
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+class StringTable:
+    """Strings packed into one UTF-8 byte buffer: entry ``i`` is ``blob[offsets[i]:offsets[i + 1]]``.
+
+    Unlike a numpy string array (4 bytes per character, every row padded to the longest), the
+    table costs the encoded bytes plus one offset per entry. Entries are decoded on access.
+    """
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringTable":
+        encoded = [str(s).encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.blob.nbytes + self.offsets.nbytes)
+
+
+class BM25Index:
+    """Okapi BM25 over the document corpus, stored as flat arrays.
+
+    Postings are in CSR form: the documents of term ``t`` are
+    ``postings_doc[indptr[t]:indptr[t + 1]]`` with term frequencies in ``postings_tf``. Doc ids,
+    the few metadata fields a hit needs (``_HIT_FIELDS``, as JSON) and the sorted vocabulary
+    (terms are looked up by binary search) are :class:`StringTable` columns, so the whole
+    index is a handful of flat numpy arrays that round-trip through one ``.npz`` file.
+    """
+
+    def __init__(self, doc_ids: StringTable, metadata: StringTable, vocab: StringTable, indptr: np.ndarray,
+                 postings_doc: np.ndarray, postings_tf: np.ndarray, doc_len: np.ndarray,
+                 k1: Optional[float] = None, b: Optional[float] = None):
+        self.doc_ids = doc_ids
+        self.metadata = metadata
+        self.vocab = vocab
+        self.indptr = indptr
+        self.postings_doc = postings_doc
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.k1 = BM25_K1 if k1 is None else k1
+        self.b = BM25_B if b is None else b
+        n = len(doc_ids)
+        self.avg_len = float(doc_len.mean()) if n else 0.0
+        df = np.diff(indptr).astype(np.float64)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        # per-document length normalization, precomputed once
+        self._norm = (self.k1 * (1 - self.b + self.b * doc_len / (self.avg_len or 1.0))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def _term_ids(self, terms: Sequence[str]) -> List[int]:
+        found = []
+        for t in terms:
+            p = bisect.bisect_left(self.vocab, t)
+            if p < len(self.vocab) and self.vocab[p] == t:
+                found.append(p)
+        return found
+
+    def search(self, query: str, top_k: int = 3) -> Tuple[List[dict], float, bool]:
+        """Return ``(hits, ratio, full_match)``.
+
+        ``hits`` have the vector-store shape (``id``, ``score``, ``metadata``); ``ratio`` is the
+        top score over the runner-up's (inf when only one doc matches) and ``full_match``
+        whether the top doc contains every query term, the inputs to the short-circuit.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        term_ids = self._term_ids(terms)
+        if not term_ids or top_k <= 0:
+            return [], 0.0, False
+        docs, scores = [], []
+        for t in term_ids:
+            lo, hi = self.indptr[t], self.indptr[t + 1]
+            d = self.postings_doc[lo:hi]
+            tf = self.postings_tf[lo:hi].astype(np.float32)
+            docs.append(d)
+            scores.append(self.idf[t] * tf * (self.k1 + 1) / (tf + self._norm[d]))
+        docs = np.concatenate(docs)
+        unique, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        matched = np.bincount(inverse)
+        k = min(top_k, len(unique))
+        top = np.argpartition(-totals, k - 1)[:k] if k < len(unique) else np.arange(len(unique))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        hits = [{
+            "id": self.doc_ids[int(unique[i])],
+            "score": float(totals[i]),
+            "metadata": json.loads(self.metadata[int(unique[i])]),
+        } for i in top]
+        if len(unique) > 1:
+            runner_up = np.partition(totals, len(totals) - 2)[-2]
+            ratio = float(totals[top[0]] / runner_up) if runner_up > 0 else math.inf
+        else:
+            ratio = math.inf
+        full_match = int(matched[top[0]]) == len(terms)
+        return hits, ratio, full_match
+
+    def save(self, path: Optional[str] = None):
+        path = path or BM25_INDEX_PATH
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        tables = {f"{name}_{part}": getattr(getattr(self, name), part)
+                  for name in _STRING_COLUMNS for part in ("blob", "offsets")}
+        np.savez(tmp, indptr=self.indptr, postings_doc=self.postings_doc, postings_tf=self.postings_tf,
+                 doc_len=self.doc_len, **tables)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "BM25Index":
+        with np.load(path or BM25_INDEX_PATH, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        for name in _STRING_COLUMNS:
+            if name in arrays:
+                # written before the string columns were packed: convert on load
+                arrays[name] = StringTable.from_strings(arrays[name].tolist())
+            else:
+                arrays[name] = StringTable(arrays.pop(f"{name}_blob"), arrays.pop(f"{name}_offsets"))
+        return cls(**arrays)
+
+
+_STRING_COLUMNS = ("doc_ids", "metadata", "vocab")
+
+
+class BM25Builder:
+    """Accumulates documents batch by batch and assembles the CSR arrays once at the end."""
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._terms: List[np.ndarray] = []
+        self._docs: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self._ids: List[str] = []
+        self._metadata: List[str] = []
+        self._lengths: List[int] = []
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadata: Sequence[dict]):
+        terms, docs, tfs = [], [], []
+        for doc_id, text, meta in zip(ids, texts, metadata):
+            doc = len(self._ids)
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                terms.append(self._vocab.setdefault(term, len(self._vocab)))
+                docs.append(doc)
+                tfs.append(tf)
+            self._ids.append(str(doc_id))
+            self._metadata.append(json.dumps({k: v for k, v in (meta or {}).items() if k in _HIT_FIELDS}))
+            self._lengths.append(len(tokens))
+        self._terms.append(np.asarray(terms, dtype=np.int64))
+        self._docs.append(np.asarray(docs, dtype=np.int32))
+        self._tfs.append(np.asarray(tfs, dtype=np.uint16 if not tfs or max(tfs) < 65535 else np.uint32))
+
+    def tap(self, batches: Iterable):
+        """Pass ``(ids, texts, metadata)`` batches through unchanged while indexing them."""
+        for batch in batches:
+            self.add(*batch)
+            yield batch
+
+    def build(self) -> BM25Index:
+        n_terms = len(self._vocab)
+        terms = np.concatenate(self._terms) if self._terms else np.zeros(0, dtype=np.int64)
+        docs = np.concatenate(self._docs) if self._docs else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate([t.astype(np.uint32) for t in self._tfs]) if self._tfs else np.zeros(0, dtype=np.uint32)
+        # renumber terms alphabetically so the vocabulary can be binary searched
+        words = list(self._vocab)
+        alpha = sorted(range(n_terms), key=words.__getitem__)
+        rank = np.empty(n_terms, dtype=np.int64)
+        rank[alpha] = np.arange(n_terms)
+        terms = rank[terms]
+        order = np.argsort(terms, kind="stable")
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+        return BM25Index(
+            doc_ids=StringTable.from_strings(self._ids),
+            metadata=StringTable.from_strings(self._metadata),
+            vocab=StringTable.from_strings(words[i] for i in alpha),
+            indptr=indptr,
+            postings_doc=docs[order],
+            postings_tf=tfs[order],
+            doc_len=np.asarray(self._lengths, dtype=np.float32),
+        )
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[dict]], top_k: int, k: Optional[int] = None) -> List[dict]:
+    """Merge ranked hit lists by ``sum(1 / (k + rank))``; each hit keeps the first list's payload."""
+    k = RRF_K if k is None else k
+    fused: Dict[str, float] = {}
+    payload: Dict[str, dict] = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (k + rank)
+            payload.setdefault(hit["id"], hit)
+    ranked = sorted(fused, key=lambda i: -fused[i])[:top_k]
+    return [dict(payload[i], score=round(fused[i], 6)) for i in ranked]
+
+
+def get_bm25_index() -> Optional[BM25Index]:
+    """Return the persisted index (reloaded after ``upload_docs`` rewrites it); None if disabled or not built."""
+    global _index, _index_key
+    if not BM25_ENABLED:
+        return None
+    try:
+        st = os.stat(BM25_INDEX_PATH)
+        # save() replaces the file, so a rebuild always changes the inode/mtime
+        key = (BM25_INDEX_PATH, st.st_mtime_ns, st.st_ino)
+    except OSError:
+        key = (BM25_INDEX_PATH, None, None)
+    if _index_key == key:
+        return _index
+    with _index_lock:
+        if _index_key != key:
+            _index = BM25Index.load(BM25_INDEX_PATH) if key[1] is not None else None
+            _index_key = key
+        return _index
+
+
+def lexical_search(query: str, top_k: int = 3) -> Tuple[List[dict], bool]:
+    """BM25 hits for ``query`` and whether they are confident enough to skip vector search."""
+    index = get_bm25_index()
+    if index is None:
+        return [], False
+    hits, ratio, full_match = index.search(query, top_k)
+    confident = bool(hits) and BM25_SHORTCIRCUIT_RATIO > 0 and full_match and ratio >= BM25_SHORTCIRCUIT_RATIO
+    return hits, confident
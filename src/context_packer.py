@@ -0,0 +1,184 @@
+import os
+import math
+import functools
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+from src.text_utils import tokenize
+
+load_dotenv()
+
+# Prompt-side limits: the model's context window, tokens reserved for the answer, and an upper
+# bound on the retrieved context (docs + graph facts) regardless of how much room is left.
+MODEL_CONTEXT_WINDOW = int(os.getenv("MODEL_CONTEXT_WINDOW", 8192))
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", 400))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# an entry sharing at least this fraction of its words with a higher-ranked entry is dropped
+DEDUP_CONTAINMENT = float(os.getenv("CONTEXT_DEDUP_CONTAINMENT", 0.8))
+# a partially fitting entry is truncated only if at least this many tokens of it fit
+_MIN_TRUNCATED_TOKENS = 16
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # tiktoken is optional; fall back to the ~4 characters per token rule of thumb
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of ``text`` with the model's tokenizer (tiktoken), or an estimate without it."""
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens (at a word boundary), marking the cut with "…"."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    enc = _encoding()
+    budget = max(0, max_tokens - 1)  # room for the ellipsis
+    if enc is not None:
+        cut = enc.decode(enc.encode(text, disallowed_special=())[:budget])
+    else:
+        cut = text[:budget * 4]
+    if " " in cut.strip():
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def split_tokens(text: str, max_tokens: int) -> List[str]:
+    """Split ``text`` into consecutive pieces of at most ``max_tokens`` tokens each."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    enc = _encoding()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        return [enc.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens)]
+    pieces, width = [], max_tokens * 4
+    while text:
+        cut = text[:width]
+        if len(text) > width and " " in cut.strip():
+            cut = cut.rsplit(" ", 1)[0] + " "
+        pieces.append(cut)
+        text = text[len(cut):]
+    return pieces
+
+
+def prompt_budget(fixed_text: str, max_output_tokens: Optional[int] = None, budget: Optional[int] = None) -> int:
+    """Tokens available for context once ``fixed_text`` (template + question) and the answer are accounted for."""
+    max_output_tokens = ANSWER_MAX_TOKENS if max_output_tokens is None else max_output_tokens
+    room = MODEL_CONTEXT_WINDOW - max_output_tokens - count_tokens(fixed_text)
+    return max(0, min(CONTEXT_TOKEN_BUDGET if budget is None else budget, room))
+
+
+class ContextItem:
+    __slots__ = ("kind", "id", "tag", "body", "rank", "tier", "link", "words", "tokens")
+
+    def __init__(self, kind: str, id: str, line: str, rank: int, tier: int, link: Optional[str] = None):
+        self.kind = kind
+        self.id = id
+        # "[doc:1] text" -> tag "[doc:1]", body "text"; the tag is never truncated
+        self.tag, _, self.body = line.partition("] ")
+        self.tag += "]"
+        self.rank = rank
+        self.tier = tier
+        self.link = link
+        self.words = set(tokenize(self.body))
+        self.tokens = count_tokens(self.line)
+
+    @property
+    def line(self) -> str:
+        return f"{self.tag} {self.body}"
+
+
+class PackedContext:
+    """Result of :func:`pack_context`: the kept lines per section plus token accounting."""
+
+    __slots__ = ("doc_lines", "graph_lines", "tokens_before", "tokens_after", "deduplicated", "dropped", "truncated")
+
+    def __init__(self):
+        self.doc_lines: List[str] = []
+        self.graph_lines: List[str] = []
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.truncated = 0
+
+    @property
+    def saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> dict:
+        return {"tokens_before": self.tokens_before, "tokens_after": self.tokens_after, "saved": self.saved,
+                "deduplicated": self.deduplicated, "dropped": self.dropped, "truncated": self.truncated}
+
+
+def _redundant(item: ContextItem, kept: List[ContextItem]) -> bool:
+    for other in kept:
+        if other.kind == item.kind and other.id == item.id:
+            return True
+        if not item.words:
+            continue
+        shared = len(item.words & other.words) / len(item.words)
+        linked = item.link is not None and item.link in (other.id, other.link)
+        # a doc and the node it links to often say the same thing; be a little more eager there
+        if shared >= DEDUP_CONTAINMENT or (linked and shared >= DEDUP_CONTAINMENT * 0.75):
+            return True
+    return False
+
+
+def pack_context(docs: List[dict], graph: List[dict], budget: int,
+                 doc_line: Callable[[dict], str], graph_line: Callable[[dict], str]) -> PackedContext:
+    """Deduplicate, rank and truncate retrieved entries so their lines fit in ``budget`` tokens.
+
+    Ranking interleaves docs (by retrieval order) with graph facts (linked/named nodes before
+    their neighbours), so both sources stay represented when the budget is tight. An entry that
+    repeats a higher-ranked one (same id, mostly the same words, or a doc restating the node
+    its ``neo4j_id`` points to) is dropped; the first entry that does not fit is truncated if a
+    useful part of it fits, the rest are left out. Citation tags are never altered.
+    """
+    items: List[ContextItem] = []
+    for rank, d in enumerate(docs):
+        link = str((d.get('metadata') or {}).get('neo4j_id') or "") or None
+        items.append(ContextItem("doc", str(d['id']), doc_line(d), rank, 0, link))
+    for rank, g in enumerate(graph):
+        tier = 0 if not g.get('hops') else 1
+        items.append(ContextItem("graph", str(g['id']), graph_line(g), rank, tier, str(g['id'])))
+
+    packed = PackedContext()
+    packed.tokens_before = sum(item.tokens for item in items)
+    kept: List[ContextItem] = []
+    remaining = budget
+    for item in sorted(items, key=lambda i: (i.tier, i.rank, i.kind != "doc")):
+        if _redundant(item, kept):
+            packed.deduplicated += 1
+            continue
+        if item.tokens <= remaining:
+            kept.append(item)
+            remaining -= item.tokens
+            continue
+        room = remaining - count_tokens(item.tag + " ")
+        if room >= _MIN_TRUNCATED_TOKENS:
+            item.body = truncate_tokens(item.body, room)
+            item.tokens = count_tokens(item.line)
+            kept.append(item)
+            remaining -= item.tokens
+            packed.truncated += 1
+        else:
+            packed.dropped += 1
+
+    # sections keep their original (retrieval) order
+    for item in sorted(kept, key=lambda i: i.rank):
+        (packed.doc_lines if item.kind == "doc" else packed.graph_lines).append(item.line)
+    packed.tokens_after = sum(item.tokens for item in kept)
+    return packed
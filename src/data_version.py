@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_VERSION_PATH = os.getenv("DATA_VERSION_PATH", os.path.join(".cache", "data_version.json"))
+
+_lock = threading.Lock()
+_cached = {"mtime": None, "path": None, "stamps": {}}
+
+
+def read_stamps(path: str = None) -> Dict[str, str]:
+    """Return {source: stamp} as written by the loaders. Re-reads the file only when its mtime changes."""
+    path = path or DATA_VERSION_PATH
+    try:
+        st = os.stat(path)
+        # bump() replaces the file, so the inode changes even within one mtime tick
+        mtime = (st.st_mtime_ns, st.st_ino)
+    except OSError:
+        return {}
+    with _lock:
+        if _cached["mtime"] == mtime and _cached["path"] == path:
+            return _cached["stamps"]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stamps = json.load(f)
+        except Exception:
+            stamps = {}
+        _cached.update(mtime=mtime, path=path, stamps=stamps)
+        return stamps
+
+
+def current_version(path: str = None) -> str:
+    """One string that changes whenever any source (docs, locations, ...) is reloaded."""
+    stamps = read_stamps(path)
+    return "|".join(f"{k}={stamps[k]}" for k in sorted(stamps))
+
+
+def bump(source: str, path: str = None) -> str:
+    """Record that ``source`` changed; called by the loaders after a successful write."""
+    path = path or DATA_VERSION_PATH
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    with _lock:
+        stamps = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    stamps = json.load(f)
+            except Exception:
+                stamps = {}
+        stamps[source] = stamp
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stamps, f, indent=2)
+        os.replace(tmp, path)
+    return stamp
+
+
+class StampedSnapshot:
+    """A value derived from one source's data, rebuilt off the request path after a reload.
+
+    :meth:`get` starts ``build(previous)`` in a background thread when the source's stamp
+    differs from the one the current value was built for, and meanwhile returns the previous
+    value (None until the first build finishes) unless ``wait`` is set. A build that raises
+    keeps the previous value and is retried after ``retry_seconds``, or as soon as the stamp
+    changes again; ``error`` holds its message until a build succeeds.
+    """
+
+    def __init__(self, source: str, build: Callable[[Any], Any], name: str, retry_seconds: float = 30.0):
+        self.source = source
+        self.build = build
+        self.name = name
+        self.retry_seconds = retry_seconds
+        self.value = None
+        self.stamp: Optional[str] = None
+        self.built = False
+        self.error: Optional[str] = None
+        self._failed = None  # (stamp, monotonic time) of the last failed build
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _stale(self, stamp) -> bool:
+        if self.built and self.stamp == stamp:
+            return False
+        failed = self._failed
+        return not (failed is not None and failed[0] == stamp and time.monotonic() - failed[1] < self.retry_seconds)
+
+    def get(self, wait: bool = False):
+        stamp = read_stamps().get(self.source)
+        thread = None
+        if self._stale(stamp):
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    if not self._stale(stamp):
+                        return self.value
+                    self._thread = threading.Thread(target=self._run, args=(stamp,), name=f"{self.name}-build",
+                                                    daemon=True)
+                    self._thread.start()
+                thread = self._thread
+        elif wait:
+            thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+        return self.value
+
+    def _run(self, stamp):
+        try:
+            value = self.build(self.value)
+        except Exception as e:
+            self.error = str(e)
+            self._failed = (stamp, time.monotonic())
+            print(f"⚠️ {self.name} unavailable ({e}); retrying in {self.retry_seconds:g}s")
+            return
+        self.value, self.stamp, self.built = value, stamp, True
+        self.error, self._failed = None, None
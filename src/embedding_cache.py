@@ -0,0 +1,230 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+from src.vector_file import VectorFile
+
+load_dotenv()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1").lower() not in ("0", "false", "no", "off")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 2048))
+# in-memory hits whose last_used is written back to SQLite in one batch
+_TOUCH_BATCH = 256
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-memory LRU in front of SQLite + memory-mapped vectors.
+
+    Entries are keyed on sha256(model, text). SQLite holds the key -> (dim, slot) mapping and
+    last-use time; the vectors themselves live in one float32 memmap file per dimension.
+    When the number of entries exceeds ``max_entries`` the least recently used ones are
+    evicted and their slots reused. Slots are allocated inside the SQLite write transaction
+    that records them, so instances or processes sharing a directory never hand out the same
+    slot.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None, memory_items: Optional[int] = None):
+        self.path = path or EMBEDDING_CACHE_DIR
+        self.max_entries = max_entries or EMBEDDING_CACHE_MAX_ENTRIES
+        self.memory_items = EMBEDDING_CACHE_MEMORY_ITEMS if memory_items is None else memory_items
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        # autocommit mode: put_many opens its own BEGIN IMMEDIATE transactions
+        self._db = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, model TEXT, dim INTEGER, slot INTEGER, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS free_slots (dim INTEGER, slot INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS slot_sequence (dim INTEGER PRIMARY KEY, next_slot INTEGER)")
+        self._files: Dict[int, VectorFile] = {}
+        self._touched: Dict[str, float] = {}
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _file(self, dim: int) -> VectorFile:
+        vf = self._files.get(dim)
+        if vf is None:
+            vf = VectorFile(os.path.join(self.path, f"vectors_{dim}.f32"), dim)
+            self._files[dim] = vf
+        return vf
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """Write the last-use times of in-memory hits back to SQLite (they drive eviction)."""
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for every text in ``texts`` that is cached."""
+        found: Dict[int, np.ndarray] = {}
+        with self._lock:
+            pending: Dict[str, List[int]] = {}
+            for i, text in enumerate(texts):
+                k = self.key(model, text)
+                vec = self._memory.get(k)
+                if vec is not None:
+                    self._memory.move_to_end(k)
+                    self._touched[k] = time.time()
+                    found[i] = vec
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(k, []).append(i)
+            if pending:
+                keys = list(pending)
+                rows = []
+                for start in range(0, len(keys), 500):
+                    part = keys[start:start + 500]
+                    marks = ",".join("?" * len(part))
+                    rows.extend(self._db.execute(f"SELECT key, dim, slot FROM entries WHERE key IN ({marks})", part).fetchall())
+                for k, dim, slot in rows:
+                    vec = self._file(dim).read(slot)
+                    self._remember(k, vec)
+                    for i in pending[k]:
+                        found[i] = vec
+                now = time.time()
+                self._touched.update((r[0], now) for r in rows)
+            if self._touched and (pending or len(self._touched) >= _TOUCH_BATCH):
+                self._flush_touched()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_entries(model, texts, vectors)
+                self._flush_touched()
+                self._evict_if_needed()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _write_entries(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        now = time.time()
+        touched = set()
+        for text, vector in zip(texts, vectors):
+            k = self.key(model, text)
+            vec = np.asarray(vector, dtype=np.float32)
+            dim = int(vec.shape[0])
+            row = self._db.execute("SELECT dim, slot FROM entries WHERE key = ?", (k,)).fetchone()
+            if row is not None and row[0] == dim:
+                slot = row[1]
+            else:
+                if row is not None:
+                    self._db.execute("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", row)
+                slot = self._allocate_slot(dim)
+            self._file(dim).write(slot, vec)
+            touched.add(dim)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, model, dim, slot, last_used) VALUES (?, ?, ?, ?, ?)",
+                (k, model, dim, slot, now),
+            )
+            self._remember(k, vec)
+        # vectors reach the file before the transaction makes their rows visible
+        for dim in touched:
+            self._file(dim).flush()
+
+    def _allocate_slot(self, dim: int) -> int:
+        """Next free slot for ``dim``; runs inside put_many's write transaction, so the slot is
+        unique across every process sharing the cache directory."""
+        row = self._db.execute("SELECT rowid, slot FROM free_slots WHERE dim = ? LIMIT 1", (dim,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM free_slots WHERE rowid = ?", (row[0],))
+            return row[1]
+        row = self._db.execute("SELECT next_slot FROM slot_sequence WHERE dim = ?", (dim,)).fetchone()
+        if row is not None:
+            slot = row[0]
+        else:
+            # first allocation for this dim (or a cache written before the sequence table existed)
+            (slot,) = self._db.execute(
+                "SELECT COALESCE(MAX(slot) + 1, 0) FROM (SELECT slot FROM entries WHERE dim = ? UNION ALL SELECT slot FROM free_slots WHERE dim = ?)",
+                (dim, dim),
+            ).fetchone()
+        self._db.execute("INSERT OR REPLACE INTO slot_sequence (dim, next_slot) VALUES (?, ?)", (dim, slot + 1))
+        return slot
+
+    def _evict_if_needed(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        victims = self._db.execute("SELECT key, dim, slot FROM entries ORDER BY last_used LIMIT ?", (excess,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(v[0],) for v in victims])
+        self._db.executemany("INSERT INTO free_slots (dim, slot) VALUES (?, ?)", [(v[1], v[2]) for v in victims])
+        for v in victims:
+            self._memory.pop(v[0], None)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM free_slots")
+            self._db.execute("DELETE FROM slot_sequence")
+            self._memory.clear()
+            self._touched.clear()
+
+    def close(self):
+        with self._lock:
+            for vf in self._files.values():
+                vf.flush()
+            self._files.clear()
+            self._flush_touched()
+            self._db.close()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide embedding cache, or None when EMBEDDING_CACHE is disabled."""
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
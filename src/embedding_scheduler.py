@@ -0,0 +1,292 @@
+import os
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from src.context_packer import count_tokens, split_tokens
+from src import tracing
+
+load_dotenv()
+
+# Provider limits: tokens per input, tokens and inputs per request, requests and tokens per
+# minute (0 disables that bucket).
+EMBED_MAX_INPUT_TOKENS = int(os.getenv("EMBED_MAX_INPUT_TOKENS", 8191))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", 300000))
+EMBED_MAX_BATCH_ITEMS = int(os.getenv("EMBED_MAX_BATCH_ITEMS", 2048))
+EMBED_RPM = int(os.getenv("EMBED_RPM", 3000))
+EMBED_TPM = int(os.getenv("EMBED_TPM", 1000000))
+# Starting point of the adaptive controller: tokens per request and concurrent requests. Both
+# grow while requests are fast and shrink on slow responses and 429s.
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", 50000))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", 16))
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", 5.0))
+EMBED_RETRY_MAX = int(os.getenv("EMBED_RETRY_MAX", 6))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", 1.0))
+
+# a bucket holds this many seconds of its per-minute allowance, so bursts stay short
+_BURST_SECONDS = 10.0
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Refills at ``per_minute / 60`` units per second up to ``capacity``.
+
+    :meth:`reserve` takes the units immediately, letting the balance go negative, and returns
+    how long the caller must wait for it to be paid back; callers are served in the order
+    they reserve and nobody spins.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate * _BURST_SECONDS)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # a single request larger than the bucket still goes through, after a full refill
+            self.tokens -= min(amount, self.capacity)
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets shared by every embedding request,
+    plus a common pause after a 429 (the server's Retry-After, when it sends one)."""
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        rpm = EMBED_RPM if rpm is None else rpm
+        tpm = EMBED_TPM if tpm is None else tpm
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self._clock = clock
+        self._sleep = sleep
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int) -> float:
+        """Block until one request of ``tokens`` tokens may be sent; returns the seconds waited."""
+        wait = max(
+            self.requests.reserve(1) if self.requests else 0.0,
+            self.tokens.reserve(tokens) if self.tokens else 0.0,
+            self._paused_until - self._clock(),
+        )
+        if wait > 0:
+            tracing.record("embedding_rate_wait", wait)
+            self._sleep(wait)
+        return max(0.0, wait)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class AdaptiveController:
+    """AIMD control of request size and concurrency.
+
+    Every request that finishes within ``target_latency`` adds ``step`` tokens to the batch
+    budget, and each round of fast requests (one per concurrent slot) adds a slot. A slow
+    request shrinks the budget by a quarter; a 429 halves both the budget and the slots.
+    """
+
+    def __init__(self, batch_tokens: Optional[int] = None, concurrency: Optional[int] = None,
+                 max_batch_tokens: Optional[int] = None, min_batch_tokens: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, target_latency: Optional[float] = None):
+        self.max_batch_tokens = max_batch_tokens or EMBED_MAX_BATCH_TOKENS
+        self.min_batch_tokens = min(min_batch_tokens or EMBED_MAX_INPUT_TOKENS, self.max_batch_tokens)
+        self.batch_tokens = min(self.max_batch_tokens, max(self.min_batch_tokens, batch_tokens or EMBED_BATCH_TOKENS))
+        self.max_concurrency = max(1, max_concurrency or EMBED_MAX_CONCURRENCY)
+        self.concurrency = min(self.max_concurrency, max(1, concurrency or EMBED_CONCURRENCY))
+        self.target_latency = target_latency or EMBED_TARGET_LATENCY
+        self.step = max(1, self.min_batch_tokens // 2)
+        self.in_flight = 0
+        self._fast_streak = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the ``concurrency`` request slots for the duration of a request."""
+        with self._cond:
+            while self.in_flight >= self.concurrency:
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        with self._cond:
+            if latency <= self.target_latency:
+                self.batch_tokens = min(self.max_batch_tokens, self.batch_tokens + self.step)
+                self._fast_streak += 1
+                if self._fast_streak >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._fast_streak = 0
+                    self._cond.notify_all()
+            else:
+                self.batch_tokens = max(self.min_batch_tokens, int(self.batch_tokens * 0.75))
+                self._fast_streak = 0
+
+    def on_rate_limit(self):
+        with self._cond:
+            self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+            self.concurrency = max(1, self.concurrency // 2)
+            self._fast_streak = 0
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"batch_tokens": self.batch_tokens, "concurrency": self.concurrency, "in_flight": self.in_flight}
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    try:
+        from openai.error import RateLimitError
+        if isinstance(error, RateLimitError):
+            return True
+    except Exception:
+        pass
+    return getattr(error, "http_status", None) == 429
+
+
+def _retry_after(error: Exception, attempt: int) -> float:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        base = EMBED_RETRY_BACKOFF * (2 ** attempt)
+        return base + random.uniform(0, base / 2)
+
+
+def pack_batches(items: Sequence[Tuple[int, str, int]], max_tokens: int, max_items: int) -> List[list]:
+    """Group ``(position, text, tokens)`` items, in order, into batches within both limits."""
+    batches, current, used = [], [], 0
+    for item in items:
+        if current and (used + item[2] > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += item[2]
+    if current:
+        batches.append(current)
+    return batches
+
+
+def token_batches(batches: Iterable[Tuple[List[str], List[str], List[dict]]], max_rows: int,
+                  max_tokens: Callable[[], int]) -> Iterator[Tuple[List[str], List[str], List[dict]]]:
+    """Re-pack (ids, texts, metadata) batches so none exceeds ``max_rows`` rows or ``max_tokens()``
+    estimated tokens (read per batch, so it follows the scheduler's current budget)."""
+    ids, texts, metadata, used = [], [], [], 0
+    for batch in batches:
+        for i, t, m in zip(*batch):
+            n = min(count_tokens(t), EMBED_MAX_INPUT_TOKENS)
+            if ids and (len(ids) >= max_rows or used + n > max_tokens()):
+                yield ids, texts, metadata
+                ids, texts, metadata, used = [], [], [], 0
+            ids.append(i)
+            texts.append(t)
+            metadata.append(m)
+            used += n
+    if ids:
+        yield ids, texts, metadata
+
+
+class EmbeddingScheduler:
+    """Turns one ``get_embeddings`` call into rate-limited, adaptively sized requests.
+
+    Texts longer than ``max_input_tokens`` are split into chunks whose vectors are averaged
+    (weighted by token count) and re-normalized. Chunks are packed into requests by estimated
+    tokens (at most the controller's current budget and ``max_items`` inputs), sent
+    concurrently within the controller's slots after the shared limiter admits them, and
+    retried after 429s. ``request(model, inputs)`` performs one API call and returns
+    ``(vectors, total_tokens)``.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, controller: Optional[AdaptiveController] = None,
+                 max_input_tokens: Optional[int] = None, max_items: Optional[int] = None):
+        self.limiter = limiter or RateLimiter()
+        self.controller = controller or AdaptiveController()
+        self.max_input_tokens = max_input_tokens or EMBED_MAX_INPUT_TOKENS
+        self.max_items = max_items or EMBED_MAX_BATCH_ITEMS
+
+    @property
+    def batch_tokens(self) -> int:
+        return self.controller.batch_tokens
+
+    def _send(self, request: Callable, model: str, batch: list) -> List[List[float]]:
+        inputs = [text for _, text, _ in batch]
+        tokens = sum(n for _, _, n in batch)
+        for attempt in range(EMBED_RETRY_MAX + 1):
+            self.limiter.acquire(tokens)
+            with self.controller.slot():
+                started = time.perf_counter()
+                try:
+                    with tracing.span("embedding_api"):
+                        vectors, used = request(model, inputs)
+                except Exception as e:
+                    if not _is_rate_limit(e) or attempt == EMBED_RETRY_MAX:
+                        raise
+                    tracing.incr("embedding_rate_limited")
+                    self.controller.on_rate_limit()
+                    self.limiter.pause(_retry_after(e, attempt))
+                    continue
+                self.controller.on_success(time.perf_counter() - started)
+            tracing.incr("embedding_requests")
+            tracing.incr("embedding_tokens", used if used is not None else tokens)
+            return vectors
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    def embed(self, texts: Sequence[str], model: str, request: Callable) -> List[List[float]]:
+        pieces = []
+        for pos, text in enumerate(texts):
+            chunks = split_tokens(text, self.max_input_tokens) if text else [text]
+            if len(chunks) > 1:
+                tracing.incr("embedding_chunked_inputs")
+            for chunk in chunks:
+                pieces.append((pos, chunk, max(1, min(count_tokens(chunk), self.max_input_tokens))))
+        batches = pack_batches(pieces, self.controller.batch_tokens, self.max_items)
+        if len(batches) == 1:
+            results = [self._send(request, model, batches[0])]
+        else:
+            workers = min(len(batches), self.controller.max_concurrency)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+                futures = [pool.submit(tracing.bind_context(self._send), request, model, b) for b in batches]
+                results = [f.result() for f in futures]
+
+        parts: List[list] = [[] for _ in texts]
+        for batch, vectors in zip(batches, results):
+            for (pos, _, n), vec in zip(batch, vectors):
+                parts[pos].append((vec, n))
+        out = []
+        for chunks in parts:
+            if len(chunks) == 1:
+                out.append(chunks[0][0])
+                continue
+            # long input: token-weighted mean of its chunk vectors, back on the unit sphere
+            mean = sum(np.asarray(vec, dtype=np.float64) * n for vec, n in chunks) / sum(n for _, n in chunks)
+            out.append((mean / (math.sqrt(float(mean @ mean)) or 1.0)).tolist())
+        return out
+
+
+def get_scheduler() -> EmbeddingScheduler:
+    """Process-wide scheduler, so every caller shares one rate limiter and controller."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = EmbeddingScheduler()
+    return _scheduler
@@ -1,19 +1,52 @@
 import os
 import openai
 from dotenv import load_dotenv
+from src.embedding_cache import get_embedding_cache
+from src.embedding_scheduler import get_scheduler
+from src import tracing
 
 load_dotenv()
 
-def get_embeddings(texts, model="text-embedding-3-small"):
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def get_embeddings(texts, model=EMBEDDING_MODEL):
     """Return embeddings for a list of texts.
 
     This function sets the OpenAI API key at call time (not import time)
     so importing this module won't fail during tests when the env var
     isn't present.
+
+    Texts already in the embedding cache are served locally; only the misses
+    (deduplicated) are sent to the API, and their vectors are written back. Requests go
+    through :mod:`src.embedding_scheduler`: batched by estimated tokens, long texts chunked
+    and averaged, and paced to the provider's request and token limits.
     """
     if isinstance(texts, str):
         texts = [texts]
+    texts = list(texts)
+    results = [None] * len(texts)
+    cache = get_embedding_cache()
+    if cache is not None:
+        found = cache.get_many(model, texts)
+        for i, vec in found.items():
+            results[i] = vec.tolist()
+        tracing.incr("embedding_cache_hits", len(found))
+        tracing.incr("embedding_cache_misses", len(texts) - len(found))
+    missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    if not missing:
+        return results
     openai.api_key = os.getenv("OPENAI_API_KEY")
+    # requests are packed by tokens, rate limited and sized by the shared scheduler
+    fetched = dict(zip(missing, get_scheduler().embed(missing, model, _request)))
+    if cache is not None:
+        cache.put_many(model, missing, [fetched[t] for t in missing])
+    return [r if r is not None else fetched[t] for t, r in zip(texts, results)]
+
+
+def _request(model, inputs):
     # OpenAI Python client new style: openai.Embedding.create
-    resp = openai.Embedding.create(model=model, input=texts)
-    return [r['embedding'] for r in resp['data']]
+    resp = openai.Embedding.create(model=model, input=inputs)
+    usage = resp.get('usage') or {}
+    data = sorted(resp['data'], key=lambda r: r.get('index', 0))
+    return [r['embedding'] for r in data], usage.get('total_tokens')
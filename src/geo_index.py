@@ -0,0 +1,308 @@
+import os
+import re
+import math
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from src.data_version import StampedSnapshot
+from src.text_utils import normalize_text, tokenize
+
+load_dotenv()
+
+GEO_INDEX_ENABLED = os.getenv("GEO_INDEX", "1").lower() not in ("0", "false", "no", "off")
+# where the in-memory index is built from: "neo4j", "csv" or "auto" (Neo4j, else the CSV)
+GEO_SOURCE = os.getenv("GEO_SOURCE", "auto").lower()
+LOCATIONS_CSV = os.getenv("LOCATIONS_CSV", os.path.join("data", "locations.csv"))
+# grid cell edge in degrees (~5.5 km of latitude at 0.05)
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", 0.05))
+GEO_NEAR_K = int(os.getenv("GEO_NEAR_K", 5))
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEG_LAT = 111.32
+
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points (vectorized)."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def cell_deg_for_radius(km: float, min_deg: float = 0.002) -> float:
+    """Grid cell edge (degrees) spanning ``km`` of latitude, so a join at that radius only
+    reaches the adjacent cells; never below ``min_deg`` (~220 m) to bound the number of cells."""
+    return max(min_deg, km / _KM_PER_DEG_LAT)
+
+
+class GeoIndex:
+    """Uniform lat/lon grid over the locations with vectorized haversine refinement.
+
+    Points are sorted by grid cell so each cell is one contiguous slice of the coordinate
+    arrays; a query gathers the slices of the cells overlapping its bounding box and filters
+    them by exact distance. Longitude wraps at the antimeridian.
+    """
+
+    def __init__(self, ids: Sequence, names: Sequence, lats: Sequence, lons: Sequence,
+                 descriptions: Optional[Sequence] = None, cell_deg: Optional[float] = None):
+        self.cell_deg = cell_deg or GEO_CELL_DEG
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        valid = np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+        keep = np.flatnonzero(valid)
+        self._n_cols = int(math.ceil(360.0 / self.cell_deg))
+        rows, cols = self._cell(lats[keep], lons[keep])
+        keys = rows * self._n_cols + cols
+        order = np.argsort(keys, kind="stable")
+        keep, keys = keep[order], keys[order]
+
+        self.lats = lats[keep]
+        self.lons = lons[keep]
+        self.ids = [str(ids[i]) for i in keep]
+        self.names = [str(names[i]) for i in keep]
+        self.descriptions = [str(descriptions[i]) for i in keep] if descriptions is not None else None
+        unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        self._cells: Dict[int, Tuple[int, int]] = {
+            int(k): (int(s), int(s + c)) for k, s, c in zip(unique, starts, counts)
+        }
+        self._by_name: Dict[str, int] = {}
+        self._by_token: Dict[str, List[int]] = {}
+        for i, name in enumerate(self.names):
+            self._by_name.setdefault(normalize_text(name), i)
+            for token in set(tokenize(name)):
+                self._by_token.setdefault(token, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cell(self, lats, lons):
+        rows = np.floor((np.asarray(lats) + 90.0) / self.cell_deg).astype(np.int64)
+        cols = np.floor((np.asarray(lons) + 180.0) / self.cell_deg).astype(np.int64) % self._n_cols
+        return rows, cols
+
+    @classmethod
+    def from_csv(cls, path: str = None, chunksize: int = 200000, **kwargs) -> "GeoIndex":
+        """Build from the locations CSV, reading only the needed columns in chunks."""
+        path = path or LOCATIONS_CSV
+        usecols = lambda c: c in ("id", "name", "lat", "lon", "description")
+        parts = list(pd.read_csv(path, usecols=usecols, dtype={"id": str}, chunksize=chunksize))
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["id", "name", "lat", "lon"])
+        descriptions = df["description"].fillna("").astype(str).tolist() if "description" in df else None
+        return cls(df["id"].astype(str).tolist(), df["name"].fillna("").astype(str).tolist(),
+                   pd.to_numeric(df["lat"], errors="coerce").to_numpy(),
+                   pd.to_numeric(df["lon"], errors="coerce").to_numpy(), descriptions, **kwargs)
+
+    @classmethod
+    def from_neo4j(cls, driver, **kwargs) -> "GeoIndex":
+        """Build from the :Location nodes, preferring the ``location`` point property when present."""
+        query = """
+        MATCH (l:Location)
+        RETURN l.id AS id, l.name AS name, l.description AS description,
+               coalesce(l.location.latitude, l.lat) AS lat, coalesce(l.location.longitude, l.lon) AS lon
+        """
+        ids, names, descriptions, lats, lons = [], [], [], [], []
+        with driver.session() as session:
+            for record in session.run(query):
+                ids.append(record["id"])
+                names.append(record["name"] or "")
+                descriptions.append(record["description"] or "")
+                lats.append(record["lat"] if record["lat"] is not None else np.nan)
+                lons.append(record["lon"] if record["lon"] is not None else np.nan)
+        return cls(ids, names, lats, lons, descriptions, **kwargs)
+
+    def _candidates(self, lat: float, lon: float, km: float) -> np.ndarray:
+        dlat = km / _KM_PER_DEG_LAT
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlon = km / (_KM_PER_DEG_LAT * cos_lat) if cos_lat > 0 else 360.0
+        r0 = int(math.floor((max(-90.0, lat - dlat) + 90.0) / self.cell_deg))
+        r1 = int(math.floor((min(90.0, lat + dlat) + 90.0) / self.cell_deg))
+        if dlon >= 180:
+            cols = range(self._n_cols)
+        else:
+            first = int(math.floor((lon - dlon + 180.0) / self.cell_deg))
+            last = int(math.floor((lon + dlon + 180.0) / self.cell_deg))
+            cols = [c % self._n_cols for c in range(first, last + 1)]
+        if (r1 - r0 + 1) * len(cols) > len(self._cells):
+            # box covers more cells than are occupied: scanning every point is cheaper
+            return np.arange(len(self))
+        slices = []
+        for row in range(r0, r1 + 1):
+            base = row * self._n_cols
+            for col in cols:
+                span = self._cells.get(base + col)
+                if span is not None:
+                    slices.append(np.arange(*span))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def cell_blocks(self, km: float) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """For each occupied grid cell, yield ``(positions in the cell, positions of every point in
+        a cell that ``km`` can reach from it)``, the candidates for an all-pairs radius join."""
+        dr = int(math.ceil(km / _KM_PER_DEG_LAT / self.cell_deg))
+        for key, (start, end) in self._cells.items():
+            row, col = divmod(key, self._n_cols)
+            # the widest longitude span the radius covers within the reachable latitude band
+            edge_lat = min(89.9, max(abs(row * self.cell_deg - 90.0), abs((row + 1) * self.cell_deg - 90.0))
+                           + km / _KM_PER_DEG_LAT)
+            dlon = km / (_KM_PER_DEG_LAT * max(math.cos(math.radians(edge_lat)), 1e-6))
+            dc = min(self._n_cols // 2, int(math.ceil(dlon / self.cell_deg)))
+            spans = []
+            for r in range(row - dr, row + dr + 1):
+                base = r * self._n_cols
+                for c in range(col - dc, col + dc + 1):
+                    span = self._cells.get(base + c % self._n_cols) if 0 <= r else None
+                    if span is not None:
+                        spans.append(np.arange(*span))
+            yield np.arange(start, end), np.unique(np.concatenate(spans))
+
+    def radius(self, lat: float, lon: float, km: float, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """``(position, distance_km)`` of every point within ``km``, nearest first."""
+        candidates = self._candidates(lat, lon, km)
+        if not len(candidates):
+            return []
+        dist = haversine_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = dist <= km
+        candidates, dist = candidates[inside], dist[inside]
+        order = np.argsort(dist, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(int(candidates[i]), float(dist[i])) for i in order]
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[int, float]]:
+        """The ``k`` closest points: grow a radius search until it holds ``k`` points."""
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        km = self.cell_deg * _KM_PER_DEG_LAT
+        while km < math.pi * EARTH_RADIUS_KM:
+            hits = self.radius(lat, lon, km, limit=k)
+            # every point closer than the k-th hit is inside the searched radius, so this is exact
+            if len(hits) >= k:
+                return hits
+            km *= 2
+        dist = haversine_km(lat, lon, self.lats, self.lons)
+        order = np.argsort(dist, kind="stable")[:k]
+        return [(int(i), float(dist[i])) for i in order]
+
+    def find_place(self, text: str) -> Optional[int]:
+        """Position of the location named by ``text``: exact name, else the best token overlap.
+
+        An overlap must share at least two tokens with the name, so a common word alone
+        ("park", "street") never picks an anchor.
+        """
+        exact = self._by_name.get(normalize_text(text))
+        if exact is not None:
+            return exact
+        scores: Dict[int, int] = {}
+        for token in set(tokenize(text)):
+            for i in self._by_token.get(token, ()):
+                scores[i] = scores.get(i, 0) + 1
+        scores = {i: n for i, n in scores.items() if n >= 2}
+        if not scores:
+            return None
+        # most shared tokens, then the shortest name (fewest unmatched words)
+        return max(scores, key=lambda i: (scores[i], -len(self.names[i])))
+
+    def record(self, pos: int, distance_km: Optional[float] = None) -> dict:
+        out = {"id": self.ids[pos], "name": self.names[pos], "lat": float(self.lats[pos]), "lon": float(self.lons[pos])}
+        if self.descriptions is not None:
+            out["description"] = self.descriptions[pos]
+        if distance_km is not None:
+            out["distance_km"] = round(distance_km, 3)
+        return out
+
+
+_UNITS_KM = {"km": 1.0, "kilometer": 1.0, "kilometre": 1.0, "m": 0.001, "meter": 0.001, "metre": 0.001,
+             "mi": 1.609344, "mile": 1.609344}
+_WITHIN_RE = re.compile(
+    r"within\s+(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>km|kilomet(?:er|re)s?|m|met(?:er|re)s?|mi|miles?)\s+(?:of|from)\s+(?P<place>.+)",
+    re.IGNORECASE,
+)
+_NEAR_RE = re.compile(
+    r"\b(?:near(?:by)?|close to|around|next to|walking distance (?:of|from)|nearest to|closest to)\s+(?P<place>.+)",
+    re.IGNORECASE,
+)
+
+
+def parse_proximity(query: str) -> Optional[dict]:
+    """Detect a proximity question and return ``{"place", "radius_km"}`` (radius None for "near X")."""
+    if not query:
+        return None
+    match = _WITHIN_RE.search(query)
+    radius = None
+    if match:
+        unit = match.group("unit").lower().rstrip("s")
+        radius = float(match.group("value")) * _UNITS_KM.get(unit, 1.0)
+    else:
+        match = _NEAR_RE.search(query)
+    if not match:
+        return None
+    place = re.sub(r"^(?:the)\s+", "", match.group("place").strip(), flags=re.IGNORECASE).strip(" ?!.,")
+    if not tokenize(place):
+        return None
+    return {"place": place, "radius_km": radius}
+
+
+def _build_index() -> GeoIndex:
+    if GEO_SOURCE in ("neo4j", "auto"):
+        try:
+            from src.hybrid_chat import _get_neo4j_driver
+            index = GeoIndex.from_neo4j(_get_neo4j_driver())
+            if len(index) or GEO_SOURCE == "neo4j":
+                return index
+        except Exception:
+            if GEO_SOURCE == "neo4j":
+                raise
+    return GeoIndex.from_csv(LOCATIONS_CSV)
+
+
+def _build_snapshot(previous: Optional[GeoIndex]) -> GeoIndex:
+    index = _build_index()
+    print(f"📍 Geo index: {len(index)} locations")
+    return index
+
+
+_snapshot = StampedSnapshot("locations", _build_snapshot, "Geo index")
+
+
+def get_geo_index(wait: bool = False) -> Optional[GeoIndex]:
+    """Return the shared index; None when disabled or not built yet.
+
+    The index is built in the background on first use and rebuilt after a locations reload,
+    so a request never waits on streaming the locations: it gets the previous index (or no
+    proximity facts before the first build) unless ``wait`` is set, as prewarming does.
+    """
+    if not GEO_INDEX_ENABLED:
+        return None
+    return _snapshot.get(wait=wait)
+
+
+def proximity_search(query: str, k: Optional[int] = None, index: Optional[GeoIndex] = None) -> List[dict]:
+    """Graph facts for a proximity question: the named place, then locations near it.
+
+    Returns [] when the question has no distance intent or the place is unknown. "within N km
+    of X" returns what is in range (up to ``k``); "near X" returns the ``k`` nearest with their
+    distances, so the model can judge what counts as near.
+    """
+    intent = parse_proximity(query)
+    if intent is None:
+        return []
+    index = index or get_geo_index()
+    if index is None:
+        return []
+    anchor = index.find_place(intent["place"])
+    if anchor is None:
+        return []
+    k = k or GEO_NEAR_K
+    lat, lon = float(index.lats[anchor]), float(index.lons[anchor])
+    if intent["radius_km"] is not None:
+        hits = index.radius(lat, lon, intent["radius_km"], limit=k + 1)
+    else:
+        hits = index.nearest(lat, lon, k + 1)
+    out = [dict(index.record(anchor), hops=0)]
+    for pos, dist in hits:
+        if pos != anchor and len(out) <= k:
+            out.append(dict(index.record(pos, dist), hops=1, near=index.ids[anchor]))
+    return out
@@ -0,0 +1,290 @@
+"""Precomputed relationships between locations, derived at load time.
+
+``NEAR`` links each location to its nearest neighbours within a radius (grid-bucketed,
+vectorized haversine); ``SIMILAR_TO`` links locations whose embeddings and tags agree. Both
+are bulk-written with ``UNWIND`` batches and capped per location so graph expansion at query
+time fans out over a bounded number of meaningful edges.
+"""
+import os
+import math
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from src.geo_index import EARTH_RADIUS_KM, GeoIndex, cell_deg_for_radius
+from src.text_utils import tokenize
+from src import tracing
+
+load_dotenv()
+
+# NEAR: each location links to at most NEAR_MAX_PER_NODE of its nearest neighbours within NEAR_RADIUS_KM
+LOCATION_RELATIONS = os.getenv("LOCATION_RELATIONS", "1").lower() not in ("0", "false", "no", "off")
+NEAR_RADIUS_KM = float(os.getenv("NEAR_RADIUS_KM", 2.0))
+NEAR_MAX_PER_NODE = int(os.getenv("NEAR_MAX_PER_NODE", 5))
+# SIMILAR_TO (off by default: needs an embedding per location): embedding kNN re-ranked with tag overlap
+SIMILAR_RELATIONS = os.getenv("SIMILAR_RELATIONS", "0").lower() not in ("0", "false", "no", "off")
+SIMILAR_MAX_PER_NODE = int(os.getenv("SIMILAR_MAX_PER_NODE", 5))
+SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", 0.75))
+SIMILAR_TAG_WEIGHT = float(os.getenv("SIMILAR_TAG_WEIGHT", 0.3))
+RELATION_BATCH_SIZE = int(os.getenv("RELATION_BATCH_SIZE", 10000))
+
+# rows x columns of a similarity block computed at once (bounds the temporary matrices)
+_BLOCK_ROWS = 2048
+_BLOCK_COLS = 8192
+# rows and columns of a distance block: haversine needs several float64 temporaries per entry
+_NEAR_BLOCK = 1024
+
+_MERGE_NEAR = """
+UNWIND $rows AS row
+MATCH (a:Location {id: row.a})
+MATCH (b:Location {id: row.b})
+MERGE (a)-[r:NEAR]->(b)
+SET r.distance_km = row.distance_km, r.version = row.version
+"""
+
+_MERGE_SIMILAR = """
+UNWIND $rows AS row
+MATCH (a:Location {id: row.a})
+MATCH (b:Location {id: row.b})
+MERGE (a)-[r:SIMILAR_TO]->(b)
+SET r.score = row.score, r.embedding_score = row.embedding_score, r.tag_overlap = row.tag_overlap,
+    r.version = row.version
+"""
+
+
+def _haversine_block(lat_a: np.ndarray, lon_a: np.ndarray, lat_b: np.ndarray, lon_b: np.ndarray) -> np.ndarray:
+    """Great-circle distances (km) between every point of ``a`` (rows) and ``b`` (columns)."""
+    la, lo_a = np.radians(lat_a)[:, None], np.radians(lon_a)[:, None]
+    lb, lo_b = np.radians(lat_b)[None, :], np.radians(lon_b)[None, :]
+    h = np.sin((lb - la) / 2) ** 2 + np.cos(la) * np.cos(lb) * np.sin((lo_b - lo_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def _running_top_k(tiles: Iterable[Tuple[np.ndarray, np.ndarray]], n_rows: int, k: int,
+                   largest: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row-wise best ``k`` over column tiles ``(block, column ids)`` without holding all columns.
+
+    Returns ``(rows, columns, values)`` of the picks; ``inf``/``-inf`` entries are never chosen.
+    """
+    best, best_cols = None, None
+    for block, cols in tiles:
+        cols = np.broadcast_to(cols, block.shape)
+        best = block if best is None else np.concatenate([best, block], axis=1)
+        best_cols = cols if best_cols is None else np.concatenate([best_cols, cols], axis=1)
+        if best.shape[1] > k:
+            top = np.argpartition(-best if largest else best, k - 1, axis=1)[:, :k]
+            best, best_cols = np.take_along_axis(best, top, axis=1), np.take_along_axis(best_cols, top, axis=1)
+    if best is None:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    rows = np.repeat(np.arange(n_rows), best.shape[1])
+    best, best_cols = best.ravel(), best_cols.ravel()
+    ok = np.isfinite(best)
+    return rows[ok], best_cols[ok], best[ok]
+
+
+def _undirected(src: np.ndarray, dst: np.ndarray, *values: np.ndarray):
+    """Collapse a->b / b->a duplicates into one edge stored as (min, max)."""
+    a, b = np.minimum(src, dst), np.maximum(src, dst)
+    if not len(a):
+        return (a, b) + values
+    _, first = np.unique(a.astype(np.int64) * (int(b.max()) + 1) + b, return_index=True)
+    return (a[first], b[first]) + tuple(v[first] for v in values)
+
+
+def cap_degree(a: np.ndarray, b: np.ndarray, rank_key: np.ndarray, k: int) -> np.ndarray:
+    """Mask of the undirected edges ``(a[i], b[i])`` to keep so no node has more than ``k``.
+
+    An edge survives only if it is among the ``k`` best (lowest ``rank_key``) edges of both of
+    its endpoints, which bounds every node's degree by ``k``.
+    """
+    n = len(a)
+    ends = np.concatenate([a, b])
+    edge = np.tile(np.arange(n), 2)
+    order = np.lexsort((np.tile(rank_key, 2), ends))
+    ends, edge = ends[order], edge[order]
+    rank = np.arange(2 * n) - np.searchsorted(ends, ends)
+    keep = np.ones(n, dtype=bool)
+    keep[edge[rank >= k]] = False
+    return keep
+
+
+def _capped(k: int, rank_key: np.ndarray, a: np.ndarray, b: np.ndarray, *values: np.ndarray):
+    keep = cap_degree(a, b, rank_key, k)
+    return (a[keep], b[keep]) + tuple(v[keep] for v in values)
+
+
+def near_index(csv_path: Optional[str] = None, radius_km: Optional[float] = None) -> GeoIndex:
+    """GeoIndex over the locations CSV with grid cells sized for a NEAR join at ``radius_km``."""
+    return GeoIndex.from_csv(csv_path, cell_deg=cell_deg_for_radius(NEAR_RADIUS_KM if radius_km is None else radius_km))
+
+
+def near_pairs(index: GeoIndex, radius_km: Optional[float] = None,
+               max_per_node: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pairs of locations within ``radius_km``; no location ends up with more than ``max_per_node``.
+
+    Works cell by cell over the index's grid (:meth:`GeoIndex.cell_blocks`; build it with
+    :func:`near_index` so cells match the radius): the points of one cell are compared only
+    with the points of the cells the radius can reach, in ``_NEAR_BLOCK`` square haversine
+    tiles with a running top-k, so memory stays bounded however dense a cell is. Each location
+    proposes its ``max_per_node`` nearest; the undirected union is then capped per endpoint
+    (:func:`cap_degree`), shortest edges first. Returns ``(a, b, distance_km)`` as index
+    positions with ``a < b``.
+    """
+    radius_km = NEAR_RADIUS_KM if radius_km is None else radius_km
+    max_per_node = max_per_node or NEAR_MAX_PER_NODE
+    if len(index) < 2 or radius_km <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    srcs, dsts, dists = [], [], []
+
+    def tiles(own, candidates):
+        for c0 in range(0, len(candidates), _NEAR_BLOCK):
+            cols = candidates[c0:c0 + _NEAR_BLOCK]
+            d = _haversine_block(index.lats[own], index.lons[own], index.lats[cols], index.lons[cols])
+            d[(d > radius_km) | (own[:, None] == cols[None, :])] = np.inf
+            yield d, cols
+
+    for cell, candidates in index.cell_blocks(radius_km):
+        for lo in range(0, len(cell), _NEAR_BLOCK):
+            own = cell[lo:lo + _NEAR_BLOCK]
+            r_idx, cols, d = _running_top_k(tiles(own, candidates), len(own), max_per_node, largest=False)
+            srcs.append(own[r_idx])
+            dsts.append(cols)
+            dists.append(d)
+    a, b, dist = _undirected(*(np.concatenate(x) for x in (srcs, dsts, dists)))
+    return _capped(max_per_node, dist, a, b, dist)
+
+
+def _tag_bits(tags: Sequence[str]) -> np.ndarray:
+    """One packed bitset row of tags per location (comma/space separated, case-insensitive)."""
+    vocab: Dict[str, int] = {}
+    sets = [sorted({vocab.setdefault(t, len(vocab)) for t in tokenize(str(s or ""))}) for s in tags]
+    dense = np.zeros((len(sets), max(1, len(vocab))), dtype=bool)
+    for i, cols in enumerate(sets):
+        dense[i, cols] = True
+    return np.packbits(dense, axis=1)
+
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def tag_overlap(bits: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Jaccard similarity of the tag sets of locations ``a[i]`` and ``b[i]`` (0 when both are empty)."""
+    inter = _POPCOUNT[bits[a] & bits[b]].sum(axis=1, dtype=np.int64)
+    union = _POPCOUNT[bits[a] | bits[b]].sum(axis=1, dtype=np.int64)
+    return np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+
+
+def similar_pairs(vectors: np.ndarray, tags: Sequence[str], max_per_node: Optional[int] = None,
+                  min_score: Optional[float] = None, tag_weight: Optional[float] = None):
+    """Pairs of similar locations: embedding nearest neighbours re-ranked with tag overlap.
+
+    Each location's ``3 * max_per_node`` nearest neighbours by cosine (matrix products tiled
+    over rows and columns, so memory stays bounded for any n) are scored
+    ``(1 - tag_weight) * cosine + tag_weight * jaccard(tags)``; each location proposes its best
+    ``max_per_node`` scoring at least ``min_score`` and the undirected union is capped per
+    endpoint (:func:`cap_degree`), highest scores first. Returns
+    ``(a, b, score, cosine, jaccard)`` with ``a < b``.
+    """
+    max_per_node = max_per_node or SIMILAR_MAX_PER_NODE
+    min_score = SIMILAR_MIN_SCORE if min_score is None else min_score
+    tag_weight = SIMILAR_TAG_WEIGHT if tag_weight is None else tag_weight
+    if len(tags) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0), np.zeros(0)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    n = matrix.shape[0]
+    m = min(3 * max_per_node, n - 1)
+    bits = _tag_bits(tags)
+    srcs, dsts, scores, cosines, overlaps = [], [], [], [], []
+
+    def tiles(own):
+        for c0 in range(0, n, _BLOCK_COLS):
+            sims = matrix[own] @ matrix[c0:c0 + _BLOCK_COLS].T
+            diag = (own >= c0) & (own < c0 + sims.shape[1])
+            sims[np.flatnonzero(diag), own[diag] - c0] = -np.inf
+            yield sims, np.arange(c0, c0 + sims.shape[1])
+
+    for lo in range(0, n, _BLOCK_ROWS):
+        own = np.arange(lo, min(n, lo + _BLOCK_ROWS))
+        # running top-m per row over column tiles: at most rows x (m + _BLOCK_COLS) floats live
+        r_idx, b, cos = _running_top_k(tiles(own), len(own), m, largest=True)
+        a = own[r_idx]
+        jac = tag_overlap(bits, a, b)
+        score = (1 - tag_weight) * cos + tag_weight * jac
+        keep = score >= min_score
+        a, b, cos, jac, score = a[keep], b[keep], cos[keep], jac[keep], score[keep]
+        # best max_per_node per source row
+        order = np.lexsort((-score, a))
+        a, b, cos, jac, score = a[order], b[order], cos[order], jac[order], score[order]
+        rank = np.arange(len(a)) - np.searchsorted(a, a)
+        keep = rank < max_per_node
+        for out, values in ((srcs, a), (dsts, b), (scores, score), (cosines, cos), (overlaps, jac)):
+            out.append(values[keep])
+    a, b, score, cos, jac = _undirected(*(np.concatenate(x) for x in (srcs, dsts, scores, cosines, overlaps)))
+    return _capped(max_per_node, -score, a, b, score, cos, jac)
+
+
+def location_texts(df: pd.DataFrame) -> List[str]:
+    """Text embedded for SIMILAR_TO: name, description and tags."""
+    cols = [df[c].fillna("").astype(str) for c in ("name", "description", "tags") if c in df]
+    return (cols[0].str.cat(cols[1:], sep=". ") if cols else pd.Series([""] * len(df))).tolist()
+
+
+def _write(client, query: str, rows: List[dict], batch_size: int) -> int:
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        written += client.write_batch(query, rows[start:start + batch_size])
+    return written
+
+
+def _drop_stale(client, rel_type: str, version: str):
+    """Remove relationships of ``rel_type`` left over from earlier loads."""
+    try:
+        client.run(f"MATCH ()-[r:{rel_type}]->() WHERE r.version <> $version "
+                   "CALL { WITH r DELETE r } IN TRANSACTIONS OF 10000 ROWS", {"version": version})
+    except Exception:
+        # servers before 4.4 have no CALL ... IN TRANSACTIONS
+        client.run(f"MATCH ()-[r:{rel_type}]->() WHERE r.version <> $version DELETE r", {"version": version})
+
+
+def derive_relationships(csv_path: str, client, near: bool = True, similar: Optional[bool] = None,
+                         batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Compute NEAR (and optionally SIMILAR_TO) edges for the locations in ``csv_path`` and
+    bulk-write them with ``UNWIND`` batches; edges from earlier loads are removed afterwards.
+
+    Returns the number of edges written per relationship type.
+    """
+    similar = SIMILAR_RELATIONS if similar is None else similar
+    batch_size = batch_size or RELATION_BATCH_SIZE
+    version = uuid.uuid4().hex
+    counts = {}
+    if near:
+        with tracing.span("relations_near"):
+            index = near_index(csv_path)
+            a, b, dist = near_pairs(index)
+            rows = [{"a": index.ids[i], "b": index.ids[j], "distance_km": round(float(d), 3), "version": version}
+                    for i, j, d in zip(a.tolist(), b.tolist(), dist.tolist())]
+            counts["NEAR"] = _write(client, _MERGE_NEAR, rows, batch_size)
+            _drop_stale(client, "NEAR", version)
+        print(f"📍 Wrote {counts['NEAR']} NEAR relationships (≤{NEAR_RADIUS_KM} km, ≤{NEAR_MAX_PER_NODE} per location)")
+    if similar:
+        from src.embeddings import get_embeddings
+
+        with tracing.span("relations_similar"):
+            df = pd.read_csv(csv_path, dtype={"id": str})
+            vectors = np.asarray(get_embeddings(location_texts(df)), dtype=np.float32)
+            tags = df["tags"].fillna("").astype(str).tolist() if "tags" in df else [""] * len(df)
+            a, b, score, cos, jac = similar_pairs(vectors, tags)
+            ids = df["id"].astype(str).tolist()
+            rows = [{"a": ids[i], "b": ids[j], "score": round(float(s), 4), "embedding_score": round(float(c), 4),
+                     "tag_overlap": round(float(t), 4), "version": version}
+                    for i, j, s, c, t in zip(a.tolist(), b.tolist(), score.tolist(), cos.tolist(), jac.tolist())]
+            counts["SIMILAR_TO"] = _write(client, _MERGE_SIMILAR, rows, batch_size)
+            _drop_stale(client, "SIMILAR_TO", version)
+        print(f"🔗 Wrote {counts['SIMILAR_TO']} SIMILAR_TO relationships (score ≥ {SIMILAR_MIN_SCORE})")
+    return counts
@@ -0,0 +1,299 @@
+"""In-process read replica of the Location graph.
+
+The Location graph is small, read-mostly and only changes when ``load_locations`` runs, so
+``hybrid_chat`` can answer its graph lookups (free-text search and neighbour expansion) from a
+snapshot held in memory instead of a Neo4j round trip per question. Records are ``__slots__``
+objects with interned strings; edges are a CSR adjacency (``indptr`` / ``indices`` arrays)
+with each node's neighbours sorted closest first. When the loader's ``locations`` version
+stamp changes the snapshot is rebuilt in full (every node and relationship is read again and
+the arrays rebuilt; only the records of unchanged nodes are reused, to share memory) in a
+background thread, and lookups keep using the previous snapshot until it is ready. Neo4j
+stays the fallback whenever the replica is disabled or not built yet.
+"""
+import os
+import sys
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from src.data_version import StampedSnapshot
+from src.geo_index import LOCATIONS_CSV
+from src.text_utils import tokenize
+from src import tracing
+
+load_dotenv()
+
+GRAPH_REPLICA = os.getenv("GRAPH_REPLICA", "0").lower() not in ("0", "false", "no", "off")
+# where the replica is built from: auto (Neo4j, else the CSV) | neo4j | csv
+GRAPH_REPLICA_SOURCE = os.getenv("GRAPH_REPLICA_SOURCE", "auto").lower()
+# after a failed build, keep serving the previous replica (or Neo4j) this long before trying again
+GRAPH_REPLICA_RETRY_SECONDS = float(os.getenv("GRAPH_REPLICA_RETRY_SECONDS", "30"))
+# matches in the name count this much more than matches in the description / tags
+_NAME_BOOST = 2.0
+
+_NODES_QUERY = """
+MATCH (l:Location)
+RETURN l.id AS id, l.name AS name, l.description AS description, l.tags AS tags
+"""
+# lower weight = closer neighbour: NEAR by distance, SIMILAR_TO by (1 - score)
+_EDGES_QUERY = """
+MATCH (a:Location)-[r]->(b:Location)
+RETURN a.id AS a, b.id AS b, type(r) AS type, coalesce(r.distance_km, 1.0 - r.score, 0.0) AS weight
+"""
+
+
+def _intern(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return sys.intern(str(value))
+
+
+class LocationRecord:
+    """One :Location node; strings are interned so replicas and rebuilds share them."""
+
+    __slots__ = ("id", "name", "description", "tags")
+
+    def __init__(self, id: str, name: str, description: str, tags: str):
+        self.id = _intern(id)
+        self.name = _intern(name)
+        self.description = _intern(description)
+        self.tags = _intern(tags)
+
+    def key(self) -> Tuple[str, str, str, str]:
+        return self.id, self.name, self.description, self.tags
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "description": self.description}
+
+    def __repr__(self):
+        return f"LocationRecord(id={self.id!r}, name={self.name!r})"
+
+
+class GraphReplica:
+    """Location nodes, a token index over name/description/tags and an undirected CSR adjacency.
+
+    ``nodes`` is an iterable of ``(id, name, description, tags)``; ``edges`` of
+    ``(a_id, b_id, type, weight)``. Edges to unknown ids are skipped. Pass the replica being
+    replaced as ``previous`` to reuse its records for nodes whose fields did not change; the
+    postings and adjacency are always built from scratch.
+    """
+
+    def __init__(self, nodes: Iterable[Tuple], edges: Iterable[Tuple], previous: Optional["GraphReplica"] = None,
+                 source: str = ""):
+        self.source = source
+        old = previous._pos if previous is not None else {}
+        self.records: List[LocationRecord] = []
+        self._pos: Dict[str, int] = {}
+        self.reused = 0
+        for node in nodes:
+            record = LocationRecord(*node)
+            if record.id in self._pos or not record.id:
+                continue
+            prior = old.get(record.id)
+            if prior is not None and previous.records[prior].key() == record.key():
+                record = previous.records[prior]
+                self.reused += 1
+            self._pos[record.id] = len(self.records)
+            self.records.append(record)
+        self._build_postings()
+        self._build_adjacency(edges)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _build_postings(self):
+        name_post: Dict[str, List[int]] = {}
+        all_post: Dict[str, List[int]] = {}
+        for i, r in enumerate(self.records):
+            for token in set(tokenize(r.name)):
+                name_post.setdefault(token, []).append(i)
+            for token in set(tokenize(f"{r.name} {r.description} {r.tags}")):
+                all_post.setdefault(_intern(token), []).append(i)
+        self._name_postings = {t: np.asarray(p, dtype=np.int32) for t, p in name_post.items()}
+        self._postings = {t: np.asarray(p, dtype=np.int32) for t, p in all_post.items()}
+
+    def _build_adjacency(self, edges: Iterable[Tuple]):
+        self.rel_types: List[str] = []
+        codes: Dict[str, int] = {}
+        src, dst, rel, weight = [], [], [], []
+        for a, b, rel_type, w in edges:
+            i, j = self._pos.get(str(a)), self._pos.get(str(b))
+            if i is None or j is None or i == j:
+                continue
+            code = codes.get(rel_type)
+            if code is None:
+                code = codes[rel_type] = len(self.rel_types)
+                self.rel_types.append(_intern(rel_type))
+            # undirected: expansion follows relationships both ways, like the Cypher pattern
+            src += (i, j)
+            dst += (j, i)
+            rel += (code, code)
+            weight += (0.0 if w is None else float(w),) * 2
+        src = np.asarray(src, dtype=np.int32)
+        weight = np.asarray(weight, dtype=np.float32)
+        order = np.lexsort((weight, src))
+        self.indices = np.asarray(dst, dtype=np.int32)[order]
+        self.rel = np.asarray(rel, dtype=np.uint8)[order]
+        self.weight = weight[order]
+        self.indptr = np.zeros(len(self.records) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(self.records)), out=self.indptr[1:])
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices) // 2
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the adjacency and posting arrays (records and strings not included)."""
+        arrays = [self.indptr, self.indices, self.rel, self.weight]
+        return sum(a.nbytes for a in arrays) + sum(p.nbytes for d in (self._postings, self._name_postings)
+                                                   for p in d.values())
+
+    def stats(self) -> dict:
+        return {"nodes": len(self), "edges": self.n_edges, "source": self.source, "reused_records": self.reused,
+                "relationship_types": list(self.rel_types), "index_bytes": self.nbytes}
+
+    def get(self, id: str) -> Optional[LocationRecord]:
+        pos = self._pos.get(str(id))
+        return None if pos is None else self.records[pos]
+
+    def search(self, query: str, limit: int = 3) -> List[dict]:
+        """Ranked token lookup, the replica's stand-in for the Neo4j full-text index.
+
+        Each matched query token adds its IDF (``_NAME_BOOST`` times as much when it is in the
+        name). Returns ``[{id, name, description, score}]``, best first.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        hits, weights = [], []
+        n = max(1, len(self.records))
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            idf = math.log(1.0 + n / len(postings))
+            hits.append(postings)
+            weights.append(np.full(len(postings), idf, dtype=np.float64))
+            in_name = self._name_postings.get(token)
+            if in_name is not None:
+                hits.append(in_name)
+                weights.append(np.full(len(in_name), idf * (_NAME_BOOST - 1.0)))
+        if not hits:
+            return []
+        scores = np.bincount(np.concatenate(hits), weights=np.concatenate(weights), minlength=n)
+        top = np.flatnonzero(scores)
+        if len(top) > limit:
+            top = top[np.argpartition(-scores[top], limit - 1)[:limit]]
+        # best first; ties keep load order
+        top = top[np.lexsort((top, -scores[top]))]
+        return [dict(self.records[k].as_dict(), score=round(float(scores[k]), 4)) for k in top.tolist()]
+
+    def neighbors(self, pos: int, depth: int, fanout: int) -> List[dict]:
+        """Breadth-first neighbours of ``pos``: fewest hops first, closest first within a hop."""
+        out = []
+        seen = {pos}
+        frontier = [pos]
+        for hops in range(1, depth + 1):
+            following = []
+            for node in frontier:
+                start, end = self.indptr[node], self.indptr[node + 1]
+                for j, code in zip(self.indices[start:end].tolist(), self.rel[start:end].tolist()):
+                    if j in seen:
+                        continue
+                    seen.add(j)
+                    following.append(j)
+                    out.append(dict(self.records[j].as_dict(), hops=hops, rel=self.rel_types[code]))
+                    if len(out) >= fanout:
+                        return out
+            if not following:
+                break
+            frontier = following
+        return out
+
+    def expand(self, ids: Iterable[str], depth: int, fanout: int) -> Dict[str, List[dict]]:
+        """Same shape as ``hybrid_chat.expand_neighborhoods``: ``{seed_id: [seed, neighbour, ...]}``."""
+        out = {}
+        for seed_id in dict.fromkeys(str(i) for i in ids):
+            pos = self._pos.get(seed_id)
+            if pos is None:
+                continue
+            record = self.records[pos]
+            seed = dict(record.as_dict(), hops=0)
+            neighbors = self.neighbors(pos, depth, fanout) if depth > 0 and fanout > 0 else []
+            out[record.id] = [seed] + [dict(n, via=record.id) for n in neighbors]
+        return out
+
+    @classmethod
+    def from_neo4j(cls, driver, previous: Optional["GraphReplica"] = None) -> "GraphReplica":
+        """Stream the :Location nodes and the relationships between them in one session."""
+        with driver.session() as session:
+            nodes = [(r["id"], r["name"], r["description"], r["tags"]) for r in session.run(_NODES_QUERY)]
+            edges = [(r["a"], r["b"], r["type"], r["weight"]) for r in session.run(_EDGES_QUERY)]
+        return cls(nodes, edges, previous, source="neo4j")
+
+    @classmethod
+    def from_csv(cls, path: str = None, previous: Optional["GraphReplica"] = None,
+                 relations: Optional[bool] = None) -> "GraphReplica":
+        """Build from the locations CSV; NEAR edges are recomputed the way the loader derives them.
+
+        SIMILAR_TO edges need location embeddings and are only available from Neo4j.
+        """
+        from src.graph_relations import LOCATION_RELATIONS, near_index, near_pairs
+
+        path = path or LOCATIONS_CSV
+        df = pd.read_csv(path, dtype={"id": str})
+        text = {c: (df[c] if c in df else pd.Series([""] * len(df))).fillna("").astype(str).tolist()
+                for c in ("id", "name", "description", "tags")}
+        nodes = zip(text["id"], text["name"], text["description"], text["tags"])
+        edges = []
+        if LOCATION_RELATIONS if relations is None else relations:
+            index = near_index(path)
+            a, b, dist = near_pairs(index)
+            edges = [(index.ids[i], index.ids[j], "NEAR", d) for i, j, d in zip(a.tolist(), b.tolist(), dist.tolist())]
+        return cls(nodes, edges, previous, source="csv")
+
+
+def _build_replica(previous: Optional[GraphReplica]) -> GraphReplica:
+    if GRAPH_REPLICA_SOURCE in ("neo4j", "auto"):
+        try:
+            from src.hybrid_chat import _get_neo4j_driver
+            replica = GraphReplica.from_neo4j(_get_neo4j_driver(), previous)
+            if len(replica) or GRAPH_REPLICA_SOURCE == "neo4j":
+                return replica
+        except Exception:
+            if GRAPH_REPLICA_SOURCE == "neo4j":
+                raise
+    return GraphReplica.from_csv(LOCATIONS_CSV, previous)
+
+
+def _build_snapshot(previous: Optional[GraphReplica]) -> GraphReplica:
+    try:
+        with tracing.span("graph_replica_build"):
+            replica = _build_replica(previous)
+    except Exception:
+        tracing.incr("graph_replica_errors")
+        raise
+    print(f"✅ Graph replica: {len(replica)} locations, {replica.n_edges} relationships "
+          f"from {replica.source} ({replica.reused} unchanged)")
+    return replica
+
+
+def _new_snapshot() -> StampedSnapshot:
+    return StampedSnapshot("locations", _build_snapshot, "Graph replica", GRAPH_REPLICA_RETRY_SECONDS)
+
+
+_snapshot = _new_snapshot()
+
+
+def get_replica(wait: bool = False) -> Optional[GraphReplica]:
+    """Return the shared replica; None when disabled or not built yet (callers then use Neo4j).
+
+    The replica is built in a background thread on first use and rebuilt after a locations
+    reload; until a build finishes, the previous replica keeps being served. ``wait`` blocks
+    for a pending build, as prewarming does. A failed build is retried after
+    ``GRAPH_REPLICA_RETRY_SECONDS`` (or as soon as the locations change again).
+    """
+    if not GRAPH_REPLICA:
+        return None
+    return _snapshot.get(wait=wait)
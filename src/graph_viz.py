@@ -0,0 +1,316 @@
+import os
+import math
+import shutil
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from src.data_version import read_stamps
+from src import tracing
+
+load_dotenv()
+
+GRAPH_VIZ_DIR = os.getenv("GRAPH_VIZ_DIR", os.path.join(".cache", "graph_viz"))
+# cap on nodes pulled into the snapshot (0 = the whole graph) and on edges kept between them
+GRAPH_VIZ_MAX_NODES = int(os.getenv("GRAPH_VIZ_MAX_NODES", 20000))
+GRAPH_VIZ_MAX_EDGES = int(os.getenv("GRAPH_VIZ_MAX_EDGES", 100000))
+# nodes per rendered view (an overview page or a neighbourhood)
+GRAPH_VIZ_PAGE_SIZE = int(os.getenv("GRAPH_VIZ_PAGE_SIZE", 200))
+# force-directed placement (networkx) is only run for nodes without coordinates, up to this many nodes
+GRAPH_VIZ_SPRING_MAX = int(os.getenv("GRAPH_VIZ_SPRING_MAX", 2000))
+# the loaders whose version stamps change what the graph looks like
+GRAPH_SOURCES = ("locations",)
+
+_CANVAS = 1000.0
+
+_NODES_QUERY = """
+MATCH (l:Location)
+RETURN l.id AS id, l.name AS name, l.description AS description,
+       coalesce(l.location.latitude, l.lat) AS lat, coalesce(l.location.longitude, l.lon) AS lon
+ORDER BY l.id
+"""
+_EDGES_QUERY = "MATCH (a:Location)-[r]->(b:Location) RETURN a.id AS a, b.id AS b, type(r) AS type"
+
+_snapshot = None
+_snapshot_version = None
+_snapshot_lock = threading.Lock()
+
+
+def graph_version() -> str:
+    """Content version of the graph: changes whenever a loader in ``GRAPH_SOURCES`` rewrites it."""
+    stamps = read_stamps()
+    version = "|".join(f"{s}={stamps[s]}" for s in GRAPH_SOURCES if s in stamps)
+    return version or "unversioned"
+
+
+def _version_dir(version: str) -> str:
+    return os.path.join(GRAPH_VIZ_DIR, hashlib.sha1(version.encode("utf-8")).hexdigest()[:12])
+
+
+class GraphSnapshot:
+    """The Location graph as flat arrays with a precomputed layout.
+
+    Nodes are parallel arrays (``ids``, ``labels``, ``titles``, ``x``, ``y``); edges are index
+    pairs (``src``, ``dst``) with their relationship type. An undirected CSR adjacency and a
+    degree ranking are derived on construction, so paging and neighbourhood views never go
+    back to Neo4j.
+    """
+
+    def __init__(self, ids: np.ndarray, labels: np.ndarray, titles: np.ndarray, x: np.ndarray, y: np.ndarray,
+                 src: np.ndarray, dst: np.ndarray, rel: np.ndarray):
+        self.ids = ids
+        self.labels = labels
+        self.titles = titles
+        self.x = x
+        self.y = y
+        self.src = src
+        self.dst = dst
+        self.rel = rel
+        n = len(ids)
+        ends = np.concatenate([src, dst])
+        others = np.concatenate([dst, src])
+        order = np.argsort(ends, kind="stable")
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ends, minlength=n), out=self.indptr[1:])
+        self.neighbors = others[order]
+        degree = np.diff(self.indptr)
+        # overview pages show the best-connected nodes first
+        self.ranking = np.lexsort((np.arange(n), -degree))
+        self._positions = {str(i): p for p, i in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def pages(self, page_size: Optional[int] = None) -> int:
+        page_size = page_size or GRAPH_VIZ_PAGE_SIZE
+        return max(1, math.ceil(len(self) / page_size))
+
+    def page(self, page: int, page_size: Optional[int] = None) -> np.ndarray:
+        page_size = page_size or GRAPH_VIZ_PAGE_SIZE
+        start = max(0, page) * page_size
+        return np.sort(self.ranking[start:start + page_size])
+
+    def find(self, node: str) -> Optional[int]:
+        """Position of a node given its id or (case-insensitively) its name."""
+        node = str(node).strip()
+        if node in self._positions:
+            return self._positions[node]
+        matches = np.flatnonzero(np.char.lower(self.labels.astype(str)) == node.lower())
+        return int(matches[0]) if len(matches) else None
+
+    def neighborhood(self, center: int, depth: int = 1, max_nodes: Optional[int] = None) -> np.ndarray:
+        """Nodes within ``depth`` hops of ``center`` (breadth first, at most ``max_nodes``)."""
+        max_nodes = max_nodes or GRAPH_VIZ_PAGE_SIZE
+        seen = {center: 0}
+        queue = deque([center])
+        while queue and len(seen) < max_nodes:
+            node = queue.popleft()
+            if seen[node] >= depth:
+                continue
+            for other in self.neighbors[self.indptr[node]:self.indptr[node + 1]]:
+                other = int(other)
+                if other not in seen:
+                    seen[other] = seen[node] + 1
+                    queue.append(other)
+                    if len(seen) >= max_nodes:
+                        break
+        return np.array(sorted(seen), dtype=np.int64)
+
+    def edges_within(self, nodes: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        mask[nodes] = True
+        return np.flatnonzero(mask[self.src] & mask[self.dst])
+
+    def save(self, path: str):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, ids=self.ids, labels=self.labels, titles=self.titles, x=self.x, y=self.y,
+                 src=self.src, dst=self.dst, rel=self.rel)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GraphSnapshot":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+def compute_layout(lats: np.ndarray, lons: np.ndarray, src: np.ndarray, dst: np.ndarray):
+    """Node coordinates on a ``_CANVAS``-wide plane, computed once per graph version.
+
+    Locations with coordinates are placed geographically (equirectangular projection). The
+    rest are placed by a force-directed layout (networkx) with the geographic nodes pinned, or
+    on a ring around the map when networkx is unavailable or the graph is too large for it.
+    """
+    n = len(lats)
+    x = np.zeros(n, dtype=np.float64)
+    y = np.zeros(n, dtype=np.float64)
+    located = np.isfinite(lats) & np.isfinite(lons)
+    if located.any():
+        mean_lat = math.radians(float(np.mean(lats[located])))
+        gx = lons[located] * math.cos(mean_lat)
+        gy = -lats[located]  # screen y grows downwards
+        span = max(float(np.ptp(gx)), float(np.ptp(gy))) or 1.0
+        x[located] = (gx - gx.min()) / span * _CANVAS
+        y[located] = (gy - gy.min()) / span * _CANVAS
+    floating = np.flatnonzero(~located)
+    if not len(floating):
+        return x.astype(np.float32), y.astype(np.float32)
+
+    center = np.array([x[located].mean(), y[located].mean()]) if located.any() else np.zeros(2)
+    angle = 2 * math.pi * np.arange(len(floating)) / len(floating)
+    radius = _CANVAS * 0.6
+    x[floating] = center[0] + radius * np.cos(angle)
+    y[floating] = center[1] + radius * np.sin(angle)
+    try:
+        import networkx as nx
+    except Exception:
+        nx = None
+    if nx is not None and n <= GRAPH_VIZ_SPRING_MAX:
+        g = nx.Graph()
+        g.add_nodes_from(range(n))
+        g.add_edges_from(zip(src.tolist(), dst.tolist()))
+        fixed = np.flatnonzero(located).tolist() or None
+        pos = nx.spring_layout(g, pos={i: (x[i], y[i]) for i in range(n)}, fixed=fixed, k=_CANVAS / math.sqrt(n),
+                               iterations=50, seed=0, scale=None if fixed else _CANVAS)
+        for i in floating:
+            x[i], y[i] = pos[i]
+    return x.astype(np.float32), y.astype(np.float32)
+
+
+def build_snapshot(client, max_nodes: Optional[int] = None, max_edges: Optional[int] = None) -> GraphSnapshot:
+    """Stream the Location nodes and their relationships from Neo4j and lay them out."""
+    max_nodes = GRAPH_VIZ_MAX_NODES if max_nodes is None else max_nodes
+    max_edges = GRAPH_VIZ_MAX_EDGES if max_edges is None else max_edges
+    query = _NODES_QUERY + (" LIMIT $limit" if max_nodes else "")
+    ids, labels, titles, lats, lons = [], [], [], [], []
+    positions: Dict[str, int] = {}
+    with tracing.span("graph_viz_nodes"):
+        for record in client.stream(query, {"limit": max_nodes}):
+            nid = str(record["id"])
+            positions[nid] = len(ids)
+            ids.append(nid)
+            labels.append(record["name"] or nid)
+            titles.append(record["description"] or "")
+            lats.append(record["lat"] if record["lat"] is not None else np.nan)
+            lons.append(record["lon"] if record["lon"] is not None else np.nan)
+    src, dst, rel = [], [], []
+    with tracing.span("graph_viz_edges"):
+        for record in client.stream(_EDGES_QUERY):
+            a, b = positions.get(str(record["a"])), positions.get(str(record["b"]))
+            if a is None or b is None:
+                continue
+            src.append(a)
+            dst.append(b)
+            rel.append(record["type"] or "")
+            if max_edges and len(src) >= max_edges:
+                break
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    with tracing.span("graph_viz_layout"):
+        x, y = compute_layout(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), src, dst)
+    return GraphSnapshot(
+        ids=np.array(ids, dtype=str), labels=np.array(labels, dtype=str), titles=np.array(titles, dtype=str),
+        x=x, y=y, src=src, dst=dst, rel=np.array(rel, dtype=str),
+    )
+
+
+def get_snapshot(client=None) -> GraphSnapshot:
+    """Return the snapshot for the current graph version.
+
+    Served from memory, else from the on-disk cache, else built from Neo4j (``client`` or a new
+    ``Neo4jClient``) and persisted; older versions' artifacts are removed then.
+    """
+    global _snapshot, _snapshot_version
+    version = graph_version()
+    if _snapshot is not None and _snapshot_version == version:
+        return _snapshot
+    with _snapshot_lock:
+        if _snapshot is not None and _snapshot_version == version:
+            return _snapshot
+        path = os.path.join(_version_dir(version), "snapshot.npz")
+        if os.path.exists(path):
+            snapshot = GraphSnapshot.load(path)
+        else:
+            owned = client is None
+            if owned:
+                from src.neo4j_loader import Neo4jClient
+                client = Neo4jClient()
+            try:
+                snapshot = build_snapshot(client)
+            finally:
+                if owned:
+                    client.close()
+            _prune(keep=_version_dir(version))
+            snapshot.save(path)
+        _snapshot, _snapshot_version = snapshot, version
+        return snapshot
+
+
+def _prune(keep: str):
+    if not os.path.isdir(GRAPH_VIZ_DIR):
+        return
+    for name in os.listdir(GRAPH_VIZ_DIR):
+        path = os.path.join(GRAPH_VIZ_DIR, name)
+        if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(keep):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def render_html(snapshot: GraphSnapshot, nodes: np.ndarray, path: str, highlight: Optional[int] = None,
+                height: str = "700px"):
+    """Write a pyvis page for ``nodes`` at their precomputed positions (no physics in the browser)."""
+    try:
+        from pyvis.network import Network
+    except Exception as e:
+        raise RuntimeError("pyvis is required for visualization. Install via pip: pip install pyvis") from e
+
+    net = Network(height=height, width="100%", bgcolor="#ffffff", font_color="#222222")
+    for i in nodes.tolist():
+        color = "#e4572e" if i == highlight else "#4c78a8"
+        net.add_node(str(snapshot.ids[i]), label=str(snapshot.labels[i]), title=str(snapshot.titles[i]),
+                     x=float(snapshot.x[i]), y=float(snapshot.y[i]), physics=False, color=color)
+    for e in snapshot.edges_within(nodes).tolist():
+        net.add_edge(str(snapshot.ids[snapshot.src[e]]), str(snapshot.ids[snapshot.dst[e]]), title=str(snapshot.rel[e]))
+    net.toggle_physics(False)
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.tmp.html"
+    net.write_html(tmp)
+    os.replace(tmp, path)
+
+
+def export_view(page: int = 0, center: Optional[str] = None, depth: int = 1, page_size: Optional[int] = None,
+                client=None) -> str:
+    """Path of the HTML for one view of the graph, rendered on first request per graph version.
+
+    Without ``center`` the view is overview page ``page`` (nodes ranked by degree); with it, the
+    ``depth``-hop neighbourhood of that node (id or name). Raises KeyError for an unknown node.
+    """
+    page_size = page_size or GRAPH_VIZ_PAGE_SIZE
+    version = graph_version()
+    if center:
+        key = hashlib.sha1(str(center).strip().lower().encode("utf-8")).hexdigest()[:10]
+        name = f"node-{key}-d{depth}-{page_size}.html"
+    else:
+        name = f"page-{page}-{page_size}.html"
+    path = os.path.join(_version_dir(version), name)
+    if os.path.exists(path):
+        tracing.incr("graph_viz_cache_hits")
+        return path
+    snapshot = get_snapshot(client)
+    highlight = None
+    if center:
+        highlight = snapshot.find(center)
+        if highlight is None:
+            raise KeyError(f"Unknown location: {center}")
+        nodes = snapshot.neighborhood(highlight, depth, page_size)
+    else:
+        nodes = snapshot.page(page, page_size)
+    with tracing.span("graph_viz_render"):
+        render_html(snapshot, nodes, path, highlight=highlight)
+    return path
@@ -1,49 +1,114 @@
 import os
 from dotenv import load_dotenv
 from src.embeddings import get_embeddings
+from src.vector_store import get_vector_store
+from src.neo4j_loader import FULLTEXT_INDEX
+from src.text_utils import tokenize
+from src.answer_cache import get_answer_cache
+from src.geo_index import GEO_INDEX_ENABLED, get_geo_index, proximity_search
+from src.graph_replica import GRAPH_REPLICA, get_replica
+from src.bm25_index import lexical_search, reciprocal_rank_fusion
+from src.context_packer import ANSWER_MAX_TOKENS, count_tokens, pack_context, prompt_budget
+from src.data_version import current_version, read_stamps
+from src import tracing
 import openai
 import json
 import threading
 import functools
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
 load_dotenv()
 
+# Per-branch retrieval deadlines (seconds). A branch that misses its deadline is dropped
+# and the answer is generated from whatever context did arrive.
+PINECONE_TIMEOUT = float(os.getenv("PINECONE_TIMEOUT", 8.0))
+NEO4J_TIMEOUT = float(os.getenv("NEO4J_TIMEOUT", 4.0))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 8))
+
+# Graph facts come from the :Location nodes linked by the retrieved docs' ``neo4j_id`` plus
+# their neighbourhood (up to GRAPH_EXPAND_DEPTH hops, GRAPH_EXPAND_FANOUT neighbours per node).
+# The free-text graph search is only used when no retrieved doc carries a link.
+GRAPH_EXPANSION = os.getenv("GRAPH_EXPANSION", "1").lower() not in ("0", "false", "no", "off")
+GRAPH_EXPAND_DEPTH = int(os.getenv("GRAPH_EXPAND_DEPTH", 1))
+GRAPH_EXPAND_FANOUT = int(os.getenv("GRAPH_EXPAND_FANOUT", 5))
+_MAX_EXPAND_DEPTH = 3
+
+# Batch API (answer_queries): queries per embeddings request, default completion concurrency,
+# and retries for rate-limited completions.
+BATCH_EMBED_SIZE = int(os.getenv("BATCH_EMBED_SIZE", 256))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_RETRY_MAX = int(os.getenv("BATCH_RETRY_MAX", 5))
+BATCH_RETRY_BACKOFF = float(os.getenv("BATCH_RETRY_BACKOFF", 1.0))
+
 # Thread-safe cached clients to reduce per-request initialization overhead
-_pinecone_index = None
-_pinecone_lock = threading.Lock()
+_vector_store = None
+_vector_store_stamp = None
+_vector_store_lock = threading.Lock()
 
 _neo4j_driver = None
 _neo4j_lock = threading.Lock()
 
+_retrieval_executor = None
+_retrieval_lock = threading.Lock()
 
-def _get_pinecone_index():
-    """Return a cached Pinecone Index instance (initialize on first call)."""
-    global _pinecone_index
-    if _pinecone_index is not None:
-        return _pinecone_index
-    with _pinecone_lock:
-        if _pinecone_index is not None:
-            return _pinecone_index
-        try:
-            import pinecone
-        except Exception as e:
-            raise RuntimeError("pinecone package is required for pinecone_search") from e
-        api_key = os.getenv("PINECONE_API_KEY")
-        env = os.getenv("PINECONE_ENVIRONMENT")
-        index_name = os.getenv("PINECONE_INDEX_NAME")
-        if not api_key or not index_name:
-            raise RuntimeError("PINECONE_API_KEY and PINECONE_INDEX_NAME must be set for pinecone_search")
-        pinecone.init(api_key=api_key, environment=env)
-        _pinecone_index = pinecone.Index(index_name)
-        return _pinecone_index
+_data_version = current_version()
+
+
+def _get_vector_store():
+    """Return the cached vector store selected by VECTOR_BACKEND (reopened after a docs reload)."""
+    global _vector_store, _vector_store_stamp
+    stamp = read_stamps().get("docs")
+    if _vector_store is not None and _vector_store_stamp == stamp:
+        return _vector_store
+    with _vector_store_lock:
+        if _vector_store is None or _vector_store_stamp != stamp:
+            _vector_store = get_vector_store()
+            _vector_store_stamp = stamp
+        return _vector_store
 
 
 @functools.lru_cache(maxsize=256)
 def pinecone_search(query, top_k=3):
-    index = _get_pinecone_index()
-    q_emb = get_embeddings(query)[0]
+    index = _get_vector_store()
+    with tracing.span("embedding"):
+        q_emb = get_embeddings(query)[0]
+    return _vector_query(index, q_emb, top_k)
+
+
+def doc_search(query, top_k=3, lexical=None):
+    """Docs for the question: BM25 and vector hits merged by reciprocal rank fusion.
+
+    A confident lexical match (see ``BM25_SHORTCIRCUIT_RATIO``) is returned as is, without the
+    embedding call and vector query. Without a BM25 index this is just :func:`pinecone_search`.
+    ``lexical`` is a :func:`lexical_search` result the caller already has for this query.
+    """
+    if lexical is None:
+        with tracing.span("bm25_query"):
+            lexical = lexical_search(query, top_k)
+    lexical, confident = lexical
+    if confident:
+        tracing.incr("bm25_shortcircuit")
+        return lexical
+    try:
+        dense = pinecone_search(query, top_k)
+    except Exception:
+        if not lexical:
+            raise
+        # vector side is down but the keyword index still has an answer
+        tracing.incr("vector_fallback_lexical")
+        return lexical
+    if not lexical:
+        return dense
+    return reciprocal_rank_fusion([dense, lexical], top_k)
+
+
+def _vector_query(index, q_emb, top_k):
     # include_metadata=True so we can display snippets
-    res = index.query(vector=q_emb, top_k=top_k, include_metadata=True)
+    with tracing.span("vector_query"):
+        res = index.query(vector=q_emb, top_k=top_k, include_metadata=True)
     # format results
     hits = []
     for m in res.get('matches', []):
@@ -75,45 +140,767 @@ def _get_neo4j_driver():
         return _neo4j_driver
 
 
+def prewarm():
+    """Initialize the vector store and Neo4j clients ahead of the first query.
+
+    Returns ``{"vector_store": error, "neo4j": error}`` where ``error`` is None for a client
+    that is ready, otherwise the failure message. The geo index (``"geo_index"``) and, with
+    ``GRAPH_REPLICA`` on, the replica (``"graph_replica"``) are built too, so the first
+    queries do not run without them while they build in the background.
+    """
+    status = {}
+    clients = [("vector_store", _get_vector_store), ("neo4j", _get_neo4j_driver)]
+    if GEO_INDEX_ENABLED:
+        clients.append(("geo_index", _require_geo_index))
+    if GRAPH_REPLICA:
+        clients.append(("graph_replica", _require_replica))
+    for name, init in clients:
+        try:
+            init()
+            status[name] = None
+        except Exception as e:
+            status[name] = str(e)
+    return status
+
+
+def _require_geo_index():
+    if get_geo_index(wait=True) is None:
+        raise RuntimeError("geo index could not be built; proximity questions get no nearby locations")
+
+
+def _require_replica():
+    if get_replica(wait=True) is None:
+        raise RuntimeError("graph replica could not be built; graph lookups use Neo4j")
+
+
+def _lucene_query(tokens):
+    """Build an OR query over alphanumeric tokens; longer terms also get a light fuzzy match for typos."""
+    return " OR ".join(f"{t} OR {t}~1" if len(t) > 4 else t for t in tokens)
+
+
 @functools.lru_cache(maxsize=256)
 def neo4j_search(query, limit=3):
+    """Ranked lexical lookup of :Location nodes through the full-text index.
+
+    The question is tokenized (stopwords dropped) so "Tell me about Central Park" matches
+    on "central"/"park". If the index does not exist yet, falls back to token matching on
+    the precomputed lowercase ``search_text`` property. With the in-process graph replica
+    enabled (``GRAPH_REPLICA``) the lookup is answered from it without a round trip.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    replica = get_replica()
+    if replica is not None:
+        with tracing.span("graph_replica_search"):
+            return replica.search(query, limit)
     driver = _get_neo4j_driver()
-    cypher = '''
+    fulltext = '''
+    CALL db.index.fulltext.queryNodes($index, $lucene) YIELD node, score
+    RETURN node.id AS id, node.name AS name, node.description AS description, score
+    ORDER BY score DESC
+    LIMIT $limit
+    '''
+    fallback = '''
     MATCH (l:Location)
-    WHERE toLower(l.name) CONTAINS toLower($query) OR toLower(l.description) CONTAINS toLower($query)
-    RETURN l.id AS id, l.name AS name, l.description AS description
+    WHERE any(t IN $tokens WHERE l.search_text CONTAINS t)
+    WITH l, size([t IN $tokens WHERE l.search_text CONTAINS t]) AS score
+    RETURN l.id AS id, l.name AS name, l.description AS description, toFloat(score) AS score
+    ORDER BY score DESC
     LIMIT $limit
     '''
-    with driver.session() as session:
-        result = session.run(cypher, {"query": query, "limit": limit})
-        data = [r.data() for r in result]
+    params = {"index": FULLTEXT_INDEX, "lucene": _lucene_query(tokens), "tokens": tokens, "limit": limit}
+    with tracing.span("neo4j_query"), driver.session() as session:
+        try:
+            data = [r.data() for r in session.run(_with_timeout(fulltext, NEO4J_TIMEOUT), params)]
+        except Exception as e:
+            message = str(e).lower()
+            if "fulltext" not in message and "index" not in message and "procedure" not in message:
+                raise
+            data = [r.data() for r in session.run(_with_timeout(fallback, NEO4J_TIMEOUT), params)]
     return data
 
-def build_prompt(query, docs, graph):
-    context_docs = "\n".join([f"[doc:{d['id']}] {d['metadata'].get('text_snippet', d['metadata'].get('source',''))}" for d in docs])
-    context_graph = "\n".join([f"[graph:{g['id']}] {g.get('name','')} - {g.get('description','')}" for g in graph])
-    return f"""You are an assistant that answers location/travel questions. Use the provided documents and graph facts to answer and include citations.
 
-Documents:\n{context_docs}\n\nGraph facts:\n{context_graph}\n\nQuestion: {query}\n"""
+_BATCH_FULLTEXT = '''
+UNWIND $queries AS q
+CALL {
+    WITH q
+    CALL db.index.fulltext.queryNodes($index, q.lucene) YIELD node, score
+    RETURN node.id AS id, node.name AS name, node.description AS description, score
+    ORDER BY score DESC
+    LIMIT $limit
+}
+RETURN q.i AS i, id, name, description, score
+'''
+
+_BATCH_FALLBACK = '''
+UNWIND $queries AS q
+CALL {
+    WITH q
+    MATCH (l:Location)
+    WHERE any(t IN q.tokens WHERE l.search_text CONTAINS t)
+    WITH l, size([t IN q.tokens WHERE l.search_text CONTAINS t]) AS score
+    RETURN l.id AS id, l.name AS name, l.description AS description, toFloat(score) AS score
+    ORDER BY score DESC
+    LIMIT $limit
+}
+RETURN q.i AS i, id, name, description, score
+'''
+
+
+def neo4j_search_many(queries, limit=3):
+    """:func:`neo4j_search` for many questions in one session and one round trip.
+
+    All questions go out as a single parameterized ``UNWIND`` query with a per-question
+    subquery, so each keeps its own top ``limit``. Returns one result list per question.
+    """
+    batch = []
+    for i, query in enumerate(queries):
+        tokens = tokenize(query)
+        if tokens:
+            batch.append({"i": i, "lucene": _lucene_query(tokens), "tokens": tokens})
+    results = [[] for _ in queries]
+    if not batch:
+        return results
+    replica = get_replica()
+    if replica is not None:
+        with tracing.span("graph_replica_search"):
+            for q in batch:
+                results[q["i"]] = replica.search(queries[q["i"]], limit)
+        return results
+    driver = _get_neo4j_driver()
+    params = {"index": FULLTEXT_INDEX, "queries": batch, "limit": limit}
+    with tracing.span("neo4j_query_batch"), driver.session() as session:
+        try:
+            records = [r.data() for r in session.run(_with_timeout(_BATCH_FULLTEXT, NEO4J_TIMEOUT), params)]
+        except Exception as e:
+            message = str(e).lower()
+            if "fulltext" not in message and "index" not in message and "procedure" not in message:
+                raise
+            records = [r.data() for r in session.run(_with_timeout(_BATCH_FALLBACK, NEO4J_TIMEOUT), params)]
+    for record in records:
+        i = record.pop("i")
+        results[i].append(record)
+    return results
+
+
+def linked_ids(docs):
+    """``neo4j_id`` links of retrieved docs, in rank order without duplicates."""
+    ids = (str((d.get('metadata') or {}).get('neo4j_id') or "").strip() for d in docs)
+    return tuple(dict.fromkeys(i for i in ids if i))
+
+
+def _expand_cypher(depth):
+    # variable-length bounds cannot be parameters; depth is a clamped int
+    return f'''
+    UNWIND $ids AS seed_id
+    MATCH (s:Location {{id: seed_id}})
+    CALL {{
+        WITH s
+        OPTIONAL MATCH p = (s)-[*1..{depth}]-(n:Location)
+        WHERE n <> s
+        WITH n, min(length(p)) AS hops, head(collect(type(last(relationships(p))))) AS rel
+        WHERE n IS NOT NULL
+        ORDER BY hops
+        LIMIT $fanout
+        RETURN collect({{id: n.id, name: n.name, description: n.description, hops: hops, rel: rel}}) AS neighbors
+    }}
+    RETURN s.id AS id, s.name AS name, s.description AS description, neighbors
+    '''
+
+
+def expand_neighborhoods(ids, depth=None, fanout=None):
+    """Fetch the :Location nodes ``ids`` and their bounded neighbourhoods in one query.
+
+    Seeds are looked up through the ``Location.id`` uniqueness constraint's index, and each
+    seed returns at most ``fanout`` nearest neighbours within ``depth`` hops, so the cost
+    follows the number of ids rather than the size of the graph. Returns
+    ``{seed_id: [seed, neighbour, ...]}``; ids without a node are absent. Served from the
+    graph replica when it is enabled.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+    depth = max(0, min(GRAPH_EXPAND_DEPTH if depth is None else depth, _MAX_EXPAND_DEPTH))
+    fanout = GRAPH_EXPAND_FANOUT if fanout is None else fanout
+    replica = get_replica()
+    if replica is not None:
+        with tracing.span("graph_replica_expand"):
+            return replica.expand(ids, depth, fanout)
+    driver = _get_neo4j_driver()
+    if depth == 0 or fanout <= 0:
+        cypher = '''
+        UNWIND $ids AS seed_id
+        MATCH (s:Location {id: seed_id})
+        RETURN s.id AS id, s.name AS name, s.description AS description, [] AS neighbors
+        '''
+    else:
+        cypher = _expand_cypher(depth)
+    with tracing.span("graph_expand"), driver.session() as session:
+        records = [r.data() for r in session.run(_with_timeout(cypher, NEO4J_TIMEOUT),
+                                                 {"ids": ids, "fanout": fanout})]
+    out = {}
+    for record in records:
+        seed = {"id": record["id"], "name": record.get("name"), "description": record.get("description"), "hops": 0}
+        neighbors = [dict(n, via=record["id"]) for n in record.get("neighbors") or [] if n.get("id") is not None]
+        out[record["id"]] = [seed] + neighbors
+    return out
+
+
+def _merge_neighborhoods(ids, neighborhoods):
+    """Flatten per-seed neighbourhoods in seed order, keeping each node once (at its fewest hops)."""
+    merged = {}
+    for seed_id in ids:
+        for entry in neighborhoods.get(seed_id, []):
+            current = merged.get(entry["id"])
+            if current is None or entry["hops"] < current["hops"]:
+                merged[entry["id"]] = entry
+    return sorted(merged.values(), key=lambda e: e["hops"])
+
+
+@functools.lru_cache(maxsize=256)
+def expand_graph(ids, depth=None, fanout=None):
+    """Graph facts for a tuple of linked ids: the linked nodes first, then their neighbours."""
+    return _merge_neighborhoods(ids, expand_neighborhoods(ids, depth, fanout))
+
+
+def _with_proximity(query, graph):
+    """Put the named place and the locations nearest to it first for "near X" / "within N km of X" questions."""
+    try:
+        with tracing.span("geo_query"):
+            nearby = proximity_search(query)
+    except Exception:
+        tracing.incr("geo_dropped")
+        return graph
+    if not nearby:
+        return graph
+    seen = {g["id"] for g in nearby}
+    return nearby + [g for g in graph if g["id"] not in seen]
+
+
+def _with_timeout(cypher, timeout):
+    """Attach a server-side transaction timeout so an abandoned query is also aborted in Neo4j."""
+    try:
+        from neo4j import Query
+    except Exception:
+        return cypher
+    return Query(cypher, timeout=timeout)
+
+
+def _get_retrieval_executor():
+    """Return the shared thread pool used to fan out retrieval branches."""
+    global _retrieval_executor
+    if _retrieval_executor is not None:
+        return _retrieval_executor
+    with _retrieval_lock:
+        if _retrieval_executor is None:
+            _retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        return _retrieval_executor
+
+
+def _branch_result(name, future, deadline, dropped):
+    """Wait for a retrieval branch until ``deadline``; record it in ``dropped`` on timeout/failure."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FuturesTimeout:
+        # cancel() only helps if the task has not started yet; a running branch finishes
+        # in the background and its result is discarded.
+        future.cancel()
+        dropped[name] = "timeout"
+    except Exception as e:
+        dropped[name] = f"error: {e}"
+    tracing.incr(f"{name}_dropped")
+    return []
+
+
+class _StartMark:
+    """Set by a queued lookup when a worker actually picks it up."""
+
+    __slots__ = ("event", "at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+
+    def wrap(self, fn):
+        def run(*args, **kwargs):
+            self.at = time.monotonic()
+            self.event.set()
+            return fn(*args, **kwargs)
+        return run
+
 
-def answer_query(query):
+def _queued_branch_result(name, future, mark, timeout, queue_deadline, dropped):
+    """:func:`_branch_result` for a lookup that may wait in the pool's queue: its ``timeout``
+    counts from when it starts running; waiting to start is bounded by ``queue_deadline``."""
+    if not mark.event.wait(max(0.0, queue_deadline - time.monotonic())):
+        future.cancel()
+        dropped[name] = "timeout"
+        tracing.incr(f"{name}_dropped")
+        return []
+    return _branch_result(name, future, mark.at + timeout, dropped)
+
+
+def retrieve_context(query, top_k=3, limit=3, pinecone_timeout=None, neo4j_timeout=None, lexical=None):
+    """Run the document (BM25 + embedding + vector query, see :func:`doc_search`) and Neo4j lookups.
+
+    The doc search and the free-text :func:`neo4j_search` start together. With
+    ``GRAPH_EXPANSION`` (default), once the docs arrive the graph facts are instead the nodes
+    linked from their ``neo4j_id`` plus their neighbourhood (:func:`expand_graph`), as long as
+    that still fits the graph deadline; otherwise the speculative search result is used. Both
+    deadlines count from the start of the call, so the stage costs at most the larger budget
+    rather than the sum of both. A branch that times out or fails is dropped instead of
+    failing the whole query. Proximity questions ("what's near Times Square?")
+    additionally get the named place and its nearest locations from the in-memory geo index.
+
+    ``lexical`` is passed on to :func:`doc_search` so a query scored by BM25 already is not
+    scored again.
+
+    Returns a dict with ``docs``, ``graph`` and ``dropped``, where ``dropped`` maps the
+    source name ("pinecone"/"neo4j") to the reason it was left out.
+    """
+    executor = _get_retrieval_executor()
+    pinecone_timeout = PINECONE_TIMEOUT if pinecone_timeout is None else pinecone_timeout
+    neo4j_timeout = NEO4J_TIMEOUT if neo4j_timeout is None else neo4j_timeout
+    started = time.monotonic()
+    graph_deadline = started + neo4j_timeout
+    dropped = {}
+    pinecone_future = executor.submit(tracing.bind_context(doc_search), query, top_k, lexical)
+    # started speculatively alongside the doc search: it is the answer whenever no doc links
+    # to the graph, and the fallback when the expansion cannot finish in time
+    search_future = executor.submit(tracing.bind_context(neo4j_search), query, limit)
+    docs = _branch_result("pinecone", pinecone_future, started + pinecone_timeout, dropped)
+    ids = linked_ids(docs) if GRAPH_EXPANSION else ()
+    graph = None
+    if ids and time.monotonic() < graph_deadline:
+        expand_future = executor.submit(tracing.bind_context(expand_graph), ids)
+        expand_dropped = {}
+        graph = _branch_result("neo4j", expand_future, graph_deadline, expand_dropped)
+        if expand_dropped:
+            graph = None  # fall back to the free-text search within what is left of the deadline
+        else:
+            search_future.cancel()
+    if graph is None:
+        graph = _branch_result("neo4j", search_future, graph_deadline, dropped)
+    graph = _with_proximity(query, graph)
+    tracing.record("retrieval", time.monotonic() - started)
+    return {"docs": docs, "graph": graph, "dropped": dropped}
+
+
+def _graph_line(g):
+    line = f"[graph:{g['id']}] {g.get('name','')} - {g.get('description','')}"
+    if g.get('near') is not None:
+        line += f" ({g['distance_km']} km from [graph:{g['near']}])"
+    elif g.get('via') is not None:
+        line += f" (linked to [graph:{g['via']}]{' by ' + g['rel'] if g.get('rel') else ''})"
+    return line
+
+
+def _doc_line(d):
+    return f"[doc:{d['id']}] {d['metadata'].get('text_snippet', d['metadata'].get('source',''))}"
+
+
+_PROMPT_TEMPLATE = """You are an assistant that answers location/travel questions. Use the provided documents and graph facts to answer and include citations.
+
+{note}Documents:\n{context_docs}\n\nGraph facts:\n{context_graph}\n\nQuestion: {query}\n"""
+
+
+@tracing.traced("build_prompt")
+def build_prompt(query, docs, graph, dropped=None, budget=None):
+    """Prompt with the retrieved context packed into a token budget.
+
+    Duplicate and overlapping entries are removed and the rest ranked and truncated to fit
+    ``budget`` (default: ``CONTEXT_TOKEN_BUDGET``, capped by what the model window leaves after
+    the template, question and ``ANSWER_MAX_TOKENS``). Prompt size and tokens saved are
+    recorded as ``prompt_tokens`` / ``context_tokens_saved``.
+    """
+    note = ""
+    if dropped:
+        sources = ", ".join(sorted(dropped))
+        note = f"Note: context from {sources} was unavailable for this question; answer from the context below.\n\n"
+    fixed = _PROMPT_TEMPLATE.format(note=note, context_docs="", context_graph="", query=query)
+    packed = pack_context(docs, graph, prompt_budget(fixed, budget=budget), _doc_line, _graph_line)
+    prompt = _PROMPT_TEMPLATE.format(note=note, context_docs="\n".join(packed.doc_lines),
+                                     context_graph="\n".join(packed.graph_lines), query=query)
+    tracing.incr("prompt_tokens", count_tokens(prompt))
+    tracing.incr("context_tokens_saved", packed.saved)
+    return prompt
+
+def _chat_messages(prompt):
+    return [
+        {"role":"system","content":"You are a helpful AI assistant."},
+        {"role":"user","content":prompt}
+    ]
+
+
+class AnswerResult:
+    """Everything one answer was built from: the text, the exact docs and graph facts in the
+    prompt, the sources left out, answer-cache status and per-stage timings (seconds).
+
+    ``error`` is only set by :func:`answer_queries`, where one failed question does not raise.
+    """
+
+    __slots__ = ("query", "answer", "docs", "graph", "dropped", "cached", "error",
+                 "ttft", "total_time", "timings", "counters")
+
+    def __init__(self, query, answer=None, docs=None, graph=None, dropped=None, cached=False, error=None,
+                 ttft=None, total_time=None, timings=None, counters=None):
+        self.query = query
+        self.answer = answer
+        self.docs = docs or []
+        self.graph = graph or []
+        self.dropped = dropped or {}
+        self.cached = cached
+        self.error = error
+        self.ttft = ttft
+        self.total_time = total_time
+        self.timings = timings or {}
+        self.counters = counters or {}
+
+    @property
+    def scores(self):
+        """Retrieval score per doc id (vector similarity, BM25 or fused rank score)."""
+        return {d['id']: d.get('score') for d in self.docs}
+
+    def as_dict(self):
+        out = {name: getattr(self, name) for name in self.__slots__}
+        out["scores"] = self.scores
+        return out
+
+    def __repr__(self):
+        return f"AnswerResult(query={self.query!r}, cached={self.cached}, docs={len(self.docs)}, graph={len(self.graph)})"
+
+
+class AnswerStream:
+    """Iterator over answer tokens as the model produces them.
+
+    Timings are measured from the start of the query (retrieval included), so ``ttft`` is the
+    latency the user actually perceives. After iteration ``text`` holds the full answer and
+    ``total_time`` the end-to-end time.
+    """
+
+    def __init__(self, chunks, started, context, cached=False, on_complete=None, llm_started=None, query=None):
+        self._chunks = chunks
+        self.query = query
+        self._parts = []
+        self.started = started
+        self.context = context
+        self.dropped = context["dropped"]
+        self.cached = cached
+        self._on_complete = on_complete
+        self.ttft = None
+        self.total_time = None
+        self._first_token_at = None
+        self._llm_started = llm_started
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            choices = chunk.get('choices') or [{}]
+            token = (choices[0].get('delta') or {}).get('content')
+            if not token:
+                continue
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+                self._first_token_at = time.perf_counter()
+            self._parts.append(token)
+            yield token
+        self.total_time = time.perf_counter() - self.started
+        if self._llm_started is not None:
+            if self._first_token_at is not None:
+                tracing.record("llm_ttft", self._first_token_at - self._llm_started)
+            tracing.record("llm", time.perf_counter() - self._llm_started)
+            # streamed chunks carry one token each
+            tracing.incr("llm_completion_tokens", len(self._parts))
+        tracing.record("answer_total", self.total_time)
+        if self._on_complete is not None and self._parts:
+            self._on_complete(self.text)
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def result(self, request_trace=None):
+        """The finished answer as an :class:`AnswerResult` (call after iterating)."""
+        return AnswerResult(
+            query=self.query, answer=self.text, docs=self.context["docs"], graph=self.context["graph"],
+            dropped=self.dropped, cached=self.cached, ttft=self.ttft, total_time=self.total_time,
+            timings=request_trace.breakdown() if request_trace is not None else {},
+            counters=dict(request_trace.counters) if request_trace is not None else {},
+        )
+
+
+def _answer_key(top_k, limit):
+    """Settings an answer depends on besides the question: cached answers only match on these."""
+    return os.getenv("OPENAI_MODEL"), top_k, limit
+
+
+def _refresh_if_data_changed():
+    """Drop the per-query retrieval caches when a loader has written a new data version."""
+    global _data_version
+    version = current_version()
+    if version != _data_version:
+        _data_version = version
+        pinecone_search.cache_clear()
+        neo4j_search.cache_clear()
+        expand_graph.cache_clear()
+
+
+def stream_answer(query, top_k=3, limit=3):
+    """Retrieve context and stream the completion; returns an :class:`AnswerStream`.
+
+    ``top_k`` docs and ``limit`` free-text graph hits are retrieved (see :func:`retrieve_context`).
+    Near-duplicate questions are answered from the semantic answer cache without retrieval or
+    an LLM call (``AnswerStream.cached`` is then True).
+    """
+    started = time.perf_counter()
     # ensure OpenAI key is set at call-time
     openai.api_key = os.getenv("OPENAI_API_KEY")
     if not openai.api_key:
         raise RuntimeError("OPENAI_API_KEY must be set to call answer_query")
-    docs = pinecone_search(query)
-    graph = neo4j_search(query)
-    prompt = build_prompt(query, docs, graph)
-    response = openai.ChatCompletion.create(
+    _refresh_if_data_changed()
+    cache = get_answer_cache()
+    q_emb = None
+    lexical = None
+    if cache is not None:
+        # scored once here and reused by doc_search
+        with tracing.span("bm25_query"):
+            lexical = lexical_search(query, top_k)
+    # a confident keyword match skips the embedding call, including the answer-cache lookup
+    if cache is not None and not lexical[1]:
+        try:
+            # served from the embedding cache again by pinecone_search on a miss
+            q_emb = get_embeddings(query)[0]
+        except Exception:
+            q_emb = None
+        found = cache.lookup(q_emb, _answer_key(top_k, limit)) if q_emb is not None else None
+        tracing.incr("answer_cache_hits" if found is not None else "answer_cache_misses")
+        if found is not None:
+            hit, _ = found
+            context = {"docs": hit.docs, "graph": hit.graph, "dropped": {}}
+            return AnswerStream([{"choices": [{"delta": {"content": hit.answer}}]}], started, context, cached=True,
+                                query=query)
+    context = retrieve_context(query, top_k=top_k, limit=limit, lexical=lexical)
+    if len(context["dropped"]) == 2:
+        raise RuntimeError(f"All retrieval sources failed: {context['dropped']}")
+    prompt = build_prompt(query, context["docs"], context["graph"], context["dropped"])
+    llm_started = time.perf_counter()
+    chunks = openai.ChatCompletion.create(
         model=os.getenv("OPENAI_MODEL"),
-        messages=[
-            {"role":"system","content":"You are a helpful AI assistant."},
-            {"role":"user","content":prompt}
-        ],
+        messages=_chat_messages(prompt),
         temperature=0.2,
-        max_tokens=400
+        max_tokens=ANSWER_MAX_TOKENS,
+        stream=True,
     )
-    return response['choices'][0]['message']['content']
+    on_complete = None
+    if q_emb is not None and not context["dropped"]:
+        # answers built from partial context are not reused
+        on_complete = lambda text: cache.store(q_emb, query, text, context["docs"], context["graph"],
+                                               _answer_key(top_k, limit))
+    return AnswerStream(chunks, started, context, on_complete=on_complete, llm_started=llm_started, query=query)
+
+
+def answer_query(query, top_k=3, limit=3):
+    """Answer one question; returns an :class:`AnswerResult` with the context and timings used."""
+    with tracing.trace() as request_trace:
+        stream = stream_answer(query, top_k=top_k, limit=limit)
+        for _ in stream:
+            pass
+    return stream.result(request_trace)
+
+class _RateLimitGate:
+    """Shared pause for batch workers: after a 429 nobody sends until the cooldown has passed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+def _retry_after(error, attempt):
+    """Seconds to back off after a rate-limit error: the server's Retry-After if given, else jittered exponential."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        base = BATCH_RETRY_BACKOFF * (2 ** attempt)
+        return base + random.uniform(0, base / 2)
+
+
+def _complete(prompt, gate):
+    """Non-streaming completion that waits out rate limits (shared with other workers via ``gate``)."""
+    from openai.error import RateLimitError
+
+    for attempt in range(BATCH_RETRY_MAX + 1):
+        gate.wait()
+        try:
+            with tracing.span("llm"):
+                resp = openai.ChatCompletion.create(
+                    model=os.getenv("OPENAI_MODEL"),
+                    messages=_chat_messages(prompt),
+                    temperature=0.2,
+                    max_tokens=ANSWER_MAX_TOKENS,
+                )
+        except RateLimitError as e:
+            if attempt == BATCH_RETRY_MAX:
+                raise
+            tracing.incr("llm_rate_limited")
+            gate.pause(_retry_after(e, attempt))
+            continue
+        usage = resp.get('usage') or {}
+        tracing.incr("llm_completion_tokens", usage.get('completion_tokens', 0))
+        return resp['choices'][0]['message']['content']
+
+
+def answer_queries(queries, concurrency=None, top_k=3, limit=3):
+    """Answer many questions, sharing the embedding and retrieval work between them.
+
+    Unique questions are first matched against the BM25 index (confident matches skip the
+    embedding), the rest embedded in batches of ``BATCH_EMBED_SIZE``; vector lookups are
+    fanned out over the retrieval pool, graph facts come from one ``UNWIND`` expansion over
+    all linked ids (:func:`expand_neighborhoods`) plus one free-text query for questions whose
+    docs carry no link (:func:`neo4j_search_many`), each bounded by ``NEO4J_TIMEOUT`` and
+    dropped only for the questions it serves when it fails, and completions run on at most
+    ``concurrency`` workers that back off together when the API rate-limits them.
+
+    Returns one :class:`AnswerResult` per input question, in input order; ``error`` is set
+    (and ``answer`` None) for a question that failed, without affecting the others.
+    """
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    if not openai.api_key:
+        raise RuntimeError("OPENAI_API_KEY must be set to call answer_queries")
+    _refresh_if_data_changed()
+    queries = list(queries)
+    unique = list(dict.fromkeys(queries))
+    items = {q: {"query": q, "answer": None, "docs": [], "graph": [], "dropped": {}, "cached": False, "error": None}
+             for q in unique}
+
+    # 1. keyword hits first; confident ones need no embedding at all. The rest are embedded
+    #    in a few large requests instead of one per question.
+    lexical = {q: lexical_search(q, top_k) for q in unique}
+    to_embed = [q for q in unique if not lexical[q][1]]
+    tracing.incr("bm25_shortcircuit", len(unique) - len(to_embed))
+    embeddings = {}
+    with tracing.span("embedding"):
+        for start in range(0, len(to_embed), BATCH_EMBED_SIZE):
+            chunk = to_embed[start:start + BATCH_EMBED_SIZE]
+            try:
+                embeddings.update(zip(chunk, get_embeddings(chunk)))
+            except Exception as e:
+                for q in chunk:
+                    if not lexical[q][0]:
+                        items[q]["dropped"]["pinecone"] = f"error: {e}"
+
+    cache = get_answer_cache()
+    cache_key = _answer_key(top_k, limit)
+    pending = []
+    for q in unique:
+        found = cache.lookup(embeddings[q], cache_key) if cache is not None and q in embeddings else None
+        if cache is not None:
+            tracing.incr("answer_cache_hits" if found is not None else "answer_cache_misses")
+        if found is not None:
+            hit, _ = found
+            items[q].update(answer=hit.answer, docs=hit.docs, graph=hit.graph, cached=True)
+        else:
+            pending.append(q)
+
+    # 2. vector lookups on the shared pool, then graph facts in one round trip per kind:
+    #    a single expansion over every linked id, free-text search only for the unlinked rest
+    #    Each lookup gets PINECONE_TIMEOUT from when it starts, not from when the batch was
+    #    queued, so questions at the back of a long queue are not starved by the ones ahead.
+    started = time.monotonic()
+    to_query = [q for q in pending if q in embeddings]
+    index = None
+    if to_query:
+        try:
+            index = _get_vector_store()
+        except Exception as e:
+            tracing.incr("pinecone_dropped", len(to_query))
+            for q in to_query:
+                items[q]["dropped"]["pinecone"] = f"error: {e}"
+            to_query = []
+    executor = _get_retrieval_executor()
+    marks = {q: _StartMark() for q in to_query}
+    vector_futures = {q: executor.submit(tracing.bind_context(marks[q].wrap(_vector_query)), index, embeddings[q], top_k)
+                      for q in to_query}
+    # a lookup waits for at most the rounds of PINECONE_TIMEOUT the pool needs to reach it
+    rounds = math.ceil(len(vector_futures) / max(1, RETRIEVAL_WORKERS))
+    queue_deadline = started + rounds * PINECONE_TIMEOUT
+    for q, future in vector_futures.items():
+        items[q]["docs"] = _queued_branch_result("pinecone", future, marks[q], PINECONE_TIMEOUT, queue_deadline,
+                                                 items[q]["dropped"])
+    for q in pending:
+        hits = lexical[q][0]
+        if hits and items[q]["docs"]:
+            items[q]["docs"] = reciprocal_rank_fusion([items[q]["docs"], hits], top_k)
+        elif hits:
+            items[q]["docs"] = hits
+            items[q]["dropped"].pop("pinecone", None)
+    links = {q: linked_ids(items[q]["docs"]) for q in pending} if GRAPH_EXPANSION else {}
+    linked = [q for q in pending if links.get(q)]
+    unlinked = [q for q in pending if not links.get(q)]
+    # the expansion and the free-text search run side by side on the pool, each with
+    # NEO4J_TIMEOUT from when it starts; a failed call drops graph context only for its questions
+    graph_calls = {}
+    if linked:
+        graph_calls["expand"] = (linked, expand_neighborhoods, ([i for q in linked for i in links[q]],))
+    if unlinked:
+        graph_calls["search"] = (unlinked, neo4j_search_many, (unlinked, limit))
+    graph_marks = {name: _StartMark() for name in graph_calls}
+    graph_futures = {name: executor.submit(tracing.bind_context(graph_marks[name].wrap(fn)), *args)
+                     for name, (_, fn, args) in graph_calls.items()}
+    graph_queue_deadline = time.monotonic() + NEO4J_TIMEOUT
+    for name, future in graph_futures.items():
+        questions = graph_calls[name][0]
+        failed = {}
+        result = _queued_branch_result("neo4j", future, graph_marks[name], NEO4J_TIMEOUT, graph_queue_deadline,
+                                       failed)
+        if failed:
+            tracing.incr("neo4j_dropped", len(questions) - 1)  # the first is counted above
+            for q in questions:
+                items[q]["dropped"].update(failed)
+        elif name == "expand":
+            for q in questions:
+                items[q]["graph"] = _merge_neighborhoods(links[q], result)
+        else:
+            for q, graph in zip(questions, result):
+                items[q]["graph"] = graph
+    for q in pending:
+        items[q]["graph"] = _with_proximity(q, items[q]["graph"])
+    tracing.record("retrieval", time.monotonic() - started)
+
+    # 3. completions with bounded concurrency
+    gate = _RateLimitGate()
+
+    def answer(q):
+        item = items[q]
+        if len(item["dropped"]) == 2:
+            raise RuntimeError(f"All retrieval sources failed: {item['dropped']}")
+        text = _complete(build_prompt(q, item["docs"], item["graph"], item["dropped"]), gate)
+        if cache is not None and not item["dropped"] and q in embeddings:
+            cache.store(embeddings[q], q, text, item["docs"], item["graph"], cache_key)
+        return text
+
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, len(pending) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-llm") as pool:
+        futures = {q: pool.submit(tracing.bind_context(answer), q) for q in pending}
+        for q, future in futures.items():
+            try:
+                items[q]["answer"] = future.result()
+            except Exception as e:
+                items[q]["error"] = str(e)
+    return [AnswerResult(**items[q]) for q in queries]
+
 
 if __name__ == "__main__":
-    print(answer_query("Tell me about Central Park"))
+    print(answer_query("Tell me about Central Park").answer)
@@ -1,13 +1,25 @@
 import pandas as pd
 import os
+import random
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Iterator, List, Optional
+from src.data_version import bump as bump_data_version
+from src import tracing
 
 load_dotenv()
 
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+FULLTEXT_INDEX = os.getenv("NEO4J_FULLTEXT_INDEX", "location_text")
+POINT_INDEX = os.getenv("NEO4J_POINT_INDEX", "location_point")
+LOAD_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", 5000))
+LOAD_WORKERS = int(os.getenv("NEO4J_LOAD_WORKERS", 1))
+LOAD_RETRY_MAX = int(os.getenv("NEO4J_RETRY_MAX", 5))
+LOAD_RETRY_BACKOFF = float(os.getenv("NEO4J_RETRY_BACKOFF", 0.5))
 
 
 class Neo4jClient:
@@ -31,13 +43,129 @@ class Neo4jClient:
         with self.driver.session() as session:
             return list(session.run(query, params or {}))
 
+    def stream(self, query: str, params: Optional[dict] = None) -> Iterator:
+        """Yield records as the server sends them instead of materializing the whole result."""
+        with self.driver.session() as session:
+            yield from session.run(query, params or {})
+
+    def write_batch(self, query: str, rows: List[dict], retries: Optional[int] = None) -> int:
+        """Run ``query`` with ``$rows`` in one managed write transaction.
+
+        Safe to call from several threads: each call uses its own session. Transient errors
+        (deadlocks, leader switches, dropped connections) are retried with jittered backoff.
+        """
+        retries = retries or LOAD_RETRY_MAX
+        for attempt in range(1, retries + 1):
+            try:
+                with tracing.span("neo4j_write_batch"), self.driver.session() as session:
+                    execute_write = getattr(session, "execute_write", None) or session.write_transaction
+                    execute_write(lambda tx: tx.run(query, {"rows": rows}).consume())
+                return len(rows)
+            except Exception as e:
+                if attempt == retries or not _is_transient(e):
+                    raise
+                tracing.incr("neo4j_write_retries")
+                wait_s = LOAD_RETRY_BACKOFF * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                print(f"⚠️ Batch write failed on attempt {attempt} ({e}); retrying in {wait_s:.1f}s")
+                time.sleep(wait_s)
+        return 0
+
+
+def _is_transient(error: Exception) -> bool:
+    try:
+        from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+    except Exception:
+        return False
+    return isinstance(error, (TransientError, ServiceUnavailable, SessionExpired))
+
+
+def ensure_search_indexes(client: "Neo4jClient"):
+    """Create the full-text index used by ``hybrid_chat.neo4j_search`` and the point index on
+    ``Location.location`` used for distance queries.
 
-def load_locations(csv_path: str = "data/locations.csv"):
+    Neo4j keeps these indexes up to date on every write, so this only has to run once;
+    it is idempotent and called on every load.
+    """
+    try:
+        client.run(f"CREATE POINT INDEX {POINT_INDEX} IF NOT EXISTS FOR (l:Location) ON (l.location)")
+    except Exception:
+        # Neo4j 4.x indexes point properties with a regular (btree) index
+        try:
+            client.run(f"CREATE INDEX {POINT_INDEX} IF NOT EXISTS FOR (l:Location) ON (l.location)")
+        except Exception:
+            pass
+    try:
+        client.run(
+            f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} IF NOT EXISTS "
+            "FOR (l:Location) ON EACH [l.name, l.description, l.tags]"
+        )
+    except Exception:
+        # Neo4j 4.x procedure syntax
+        try:
+            client.run(
+                "CALL db.index.fulltext.createNodeIndex($name, ['Location'], ['name', 'description', 'tags'])",
+                {"name": FULLTEXT_INDEX},
+            )
+        except Exception:
+            # already exists, or the server has no full-text support; search falls back to search_text
+            pass
+
+
+_MERGE_LOCATIONS = """
+UNWIND $rows AS row
+MERGE (l:Location {id: row.id})
+SET l.name = row.name, l.lat = row.lat, l.lon = row.lon, l.description = row.description, l.tags = row.tags,
+    l.search_text = row.search_text,
+    l.location = CASE WHEN row.has_point THEN point({latitude: row.lat, longitude: row.lon}) ELSE null END
+"""
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    return df[name].fillna("").astype(str)
+
+
+@tracing.traced("neo4j_prepare_rows")
+def prepare_location_rows(df: pd.DataFrame) -> List[dict]:
+    """Coerce a chunk of the locations CSV into UNWIND parameter maps (column-wise, no per-row Python)."""
+    name = _text_column(df, "name")
+    lat = pd.to_numeric(df["lat"], errors="coerce") if "lat" in df else pd.Series([float("nan")] * len(df), index=df.index)
+    lon = pd.to_numeric(df["lon"], errors="coerce") if "lon" in df else pd.Series([float("nan")] * len(df), index=df.index)
+    description = _text_column(df, "description")
+    tags = _text_column(df, "tags")
+    # lowercase search text is computed once here so queries never call toLower() per row
+    search_text = (name + " " + description + " " + tags).str.lower().str.split().str.join(" ")
+    out = pd.DataFrame({
+        "id": _text_column(df, "id"),
+        "name": name,
+        "lat": lat.fillna(0.0).astype(float),
+        "lon": lon.fillna(0.0).astype(float),
+        # only rows with real coordinates get a point (and show up in distance queries)
+        "has_point": lat.between(-90, 90) & lon.between(-180, 180),
+        "description": description,
+        "tags": tags,
+        "search_text": search_text,
+    })
+    return out.to_dict("records")
+
+
+def load_locations(csv_path: str = "data/locations.csv", batch_size: Optional[int] = None, workers: Optional[int] = None,
+                   relations: Optional[bool] = None, similar: Optional[bool] = None):
     """Load locations from CSV into Neo4j.
 
     The CSV should have at least columns: id, name, lat, lon. Optional: description, tags.
+
+    The file is streamed in chunks of ``batch_size`` rows; each chunk is written with a single
+    ``UNWIND $rows ... MERGE`` transaction, optionally from ``workers`` parallel sessions.
+    Transient failures are retried with backoff. Unless ``relations`` is False (default:
+    ``LOCATION_RELATIONS``), NEAR and, with ``similar``, SIMILAR_TO edges are then derived and
+    written (see ``src.graph_relations``). Returns the number of rows written.
     """
-    df = pd.read_csv(csv_path)
+    from src.graph_relations import LOCATION_RELATIONS, derive_relationships
+
+    batch_size = batch_size or LOAD_BATCH_SIZE
+    workers = max(1, workers or LOAD_WORKERS)
     client = Neo4jClient()
 
     # Create uniqueness constraint (syntax varies by Neo4j version)
@@ -50,70 +178,52 @@ def load_locations(csv_path: str = "data/locations.csv"):
         except Exception:
             # Not critical; continue
             pass
+    ensure_search_indexes(client)
 
-    # Use a single session for performance
-    for _, row in df.iterrows():
-        params = {
-            "id": str(row.get('id', '')),
-            "name": row.get('name', ''),
-            "lat": float(row.get('lat') or 0.0),
-            "lon": float(row.get('lon') or 0.0),
-            "description": row.get('description', '') if 'description' in row else '',
-            "tags": row.get('tags', '') if 'tags' in row else ''
-        }
-        client.run(
-            """
-            MERGE (l:Location {id: $id})
-            SET l.name = $name, l.lat = $lat, l.lon = $lon, l.description = $description, l.tags = $tags
-            """,
-            params,
-        )
-
-    client.close()
-    print("✅ Loaded locations into Neo4j successfully!")
-
-
-def visualize_graph(output_html: str = "visualization/neo4j_graph.html", limit: int = 500):
-    """Export a simple interactive HTML visualization of the Location subgraph using pyvis.
-
-    This will query nodes labeled `Location` and relationships between them (if any) and
-    produce an HTML file that can be opened in the browser.
-    """
+    started = time.perf_counter()
+    written = 0
+    chunks = pd.read_csv(csv_path, chunksize=batch_size, dtype={"id": str})
     try:
-        from pyvis.network import Network
-    except Exception as e:
-        raise RuntimeError("pyvis is required for visualization. Install via pip: pip install pyvis") from e
-
-    client = Neo4jClient()
-    # fetch nodes
-    nodes_q = "MATCH (l:Location) RETURN l.id AS id, l.name AS name, l.description AS description LIMIT $limit"
-    rels_q = "MATCH (a:Location)-[r]->(b:Location) RETURN a.id AS a, b.id AS b, type(r) AS type LIMIT $limit"
-    nodes = client.run(nodes_q, {"limit": limit})
-    rels = client.run(rels_q, {"limit": limit})
-
-    net = Network(height="800px", width="100%", bgcolor="#ffffff", font_color="#222222")
-    id_to_label = {}
-    for record in nodes:
-        nid = record['id']
-        label = record.get('name') or str(nid)
-        title = record.get('description') or ''
-        net.add_node(nid, label=label, title=title)
-        id_to_label[nid] = label
-
-    for record in rels:
-        a = record['a']
-        b = record['b']
-        rtype = record.get('type') or ''
-        if a in id_to_label and b in id_to_label:
-            net.add_edge(a, b, title=rtype)
+        if workers == 1:
+            for chunk in chunks:
+                written += client.write_batch(_MERGE_LOCATIONS, prepare_location_rows(chunk))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for chunk in chunks:
+                    pending.add(pool.submit(client.write_batch, _MERGE_LOCATIONS, prepare_location_rows(chunk)))
+                    # bound read-ahead so memory stays at ~2 batches per worker
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        written += sum(f.result() for f in done)
+                written += sum(f.result() for f in pending)
+        if LOCATION_RELATIONS if relations is None else relations:
+            derive_relationships(csv_path, client, similar=similar)
+    finally:
+        client.close()
+    bump_data_version("locations")
+    elapsed = time.perf_counter() - started
+    rate = written / elapsed if elapsed > 0 else float(written)
+    print(f"✅ Loaded {written} locations into Neo4j in {elapsed:.1f}s ({rate:.0f} rows/s)")
+    return written
+
+
+def visualize_graph(output_html: str = "visualization/neo4j_graph.html", limit: int = 500,
+                    center: Optional[str] = None, depth: int = 1):
+    """Export an interactive HTML visualization of the Location subgraph using pyvis.
+
+    The graph is streamed from Neo4j and laid out once per graph version (see ``src.graph_viz``);
+    this copies the overview of the ``limit`` best-connected nodes, or the ``depth``-hop
+    neighbourhood of ``center``, to ``output_html`` so it can be opened in the browser.
+    """
+    from src.graph_viz import export_view
 
+    path = export_view(center=center, depth=depth, page_size=limit)
     # ensure output dir exists
     out_dir = os.path.dirname(output_html)
     if out_dir and not os.path.exists(out_dir):
         os.makedirs(out_dir, exist_ok=True)
-
-    net.show(output_html)
-    client.close()
+    shutil.copyfile(path, output_html)
     print(f"✅ Graph visualization written to {output_html}")
 
 
@@ -125,8 +235,16 @@ if __name__ == "__main__":
     parser.add_argument("--csv", default="data/locations.csv", help="Path to locations CSV")
     parser.add_argument("--visualize", action="store_true", help="Export an interactive HTML visualization")
     parser.add_argument("--out", default="visualization/neo4j_graph.html", help="Visualization output HTML")
+    parser.add_argument("--center", default=None, help="Visualize the neighbourhood of this location id or name")
+    parser.add_argument("--depth", type=int, default=1, help="Hops around --center")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rows per UNWIND transaction")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel writer sessions")
+    parser.add_argument("--no-relations", action="store_true", help="Skip deriving NEAR/SIMILAR_TO relationships")
+    parser.add_argument("--similar", action="store_true", default=None,
+                        help="Also derive SIMILAR_TO relationships from embeddings and tags")
     args = parser.parse_args()
 
-    load_locations(args.csv)
+    load_locations(args.csv, batch_size=args.batch_size, workers=args.workers,
+                   relations=False if args.no_relations else None, similar=args.similar)
     if args.visualize:
-        visualize_graph(args.out)
+        visualize_graph(args.out, center=args.center, depth=args.depth)
@@ -1,11 +1,21 @@
 import os
 import json
+import queue
+import random
+import threading
 import time
+import numpy as np
 import pandas as pd
-from typing import List, Iterable
+from typing import Callable, List, Iterable, Iterator, Optional, Tuple
 from tqdm import tqdm
 from dotenv import load_dotenv
-from src.embeddings import get_embeddings
+from src.embeddings import get_embeddings, EMBEDDING_MODEL
+from src.embedding_scheduler import get_scheduler, token_batches
+from src.upload_manifest import UploadManifest, changed_batches
+from src.data_version import bump as bump_data_version
+from src import tracing
+from src.bm25_index import BM25_ENABLED, BM25_INDEX_PATH, BM25Builder
+from src.vector_store import VECTOR_BACKEND, LOCAL_INDEX_DIR, LocalVectorStore, PineconeVectorStore
 
 load_dotenv()
 
@@ -15,6 +25,11 @@ INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "blue-enigma-index")
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 32))
 RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", 1.0))
 RETRY_MAX = int(os.getenv("RETRY_MAX", 3))
+# 0: one embed worker per request slot the embedding controller may open; the controller
+# decides how many of them actually have a request in flight
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", 4))
+UPLOAD_QUEUE_DEPTH = int(os.getenv("UPLOAD_QUEUE_DEPTH", 8))
 
 
 def chunked(iterable: List, size: int) -> Iterable[List]:
@@ -41,92 +56,371 @@ def create_index_if_missing(pinecone, dim: int):
     return pinecone.Index(INDEX_NAME)
 
 
-def upload_docs(csv_path: str = "data/docs.csv", dry_run: bool = False):
-    """Read CSV, compute embeddings in batches, and upsert to Pinecone.
+def open_vector_store(dim: Optional[int]):
+    """Open the backend selected by VECTOR_BACKEND, creating the Pinecone index if needed."""
+    if VECTOR_BACKEND.lower() == "local":
+        return LocalVectorStore(dim=dim)
+    pinecone = _init_pinecone_if_needed()
+    return PineconeVectorStore(create_index_if_missing(pinecone, dim))
 
-    CSV must contain columns: id, text, metadata (JSON string).
+
+def _parse_metadata(raw: str) -> dict:
+    try:
+        return json.loads(raw)
+    except Exception:
+        return {"source": raw}
+
+
+def read_doc_batches(csv_path: str, batch_size: int = BATCH_SIZE) -> Iterator[Tuple[List[str], List[str], List[dict]]]:
+    """Stream (ids, texts, metadata) batches from the docs CSV without loading it whole."""
+    # the sample CSV escapes quotes inside the metadata JSON with backslashes
+    for chunk in pd.read_csv(csv_path, chunksize=batch_size, dtype={"id": str}, escapechar="\\"):
+        ids = chunk["id"].astype(str).tolist()
+        texts = chunk["text"].astype(str).tolist()
+        metadata = [_parse_metadata(m) for m in chunk["metadata"].astype(str).tolist()]
+        yield ids, texts, metadata
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+
+class _StageStats:
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.retries = 0
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "retries": self.retries,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_sec": round(self.items / elapsed, 2) if elapsed > 0 else None,
+        }
+
+
+class _UploadPipeline:
+    """reader -> [embed queue] -> embed workers -> [upsert queue] -> upsert workers.
+
+    The reader's batches are embedding requests (packed by tokens, up to the provider's
+    per-request item limit); each embedded batch is re-split into ``upsert_rows`` upserts.
+    Both queues are bounded, so a slow stage back-pressures the ones before it and at most
+    ``queue_depth`` batches per queue are held in memory. A failed batch is re-queued by a
+    timer after a jittered delay instead of sleeping in the worker, so the other batches keep
+    flowing. A batch that exhausts RETRY_MAX stops the pipeline and its error is re-raised.
     """
-    df = pd.read_csv(csv_path)
-    texts = df["text"].astype(str).tolist()
-    ids = df["id"].astype(str).tolist()
-    # parse metadata safely
-    metadata = []
-    for m in df["metadata"].astype(str).tolist():
+
+    def __init__(self, batches: Iterable, dry_run: bool, embed_workers: int, upsert_workers: int, queue_depth: int,
+                 on_committed: Optional[Callable[[dict], None]] = None, upsert_rows: int = BATCH_SIZE):
+        self.batches = batches
+        self.upsert_rows = max(1, upsert_rows)
+        self.dry_run = dry_run
+        self.on_committed = on_committed
+        self.embed_workers = max(1, embed_workers)
+        self.upsert_workers = max(1, upsert_workers)
+        self.embed_q: "queue.Queue" = queue.Queue(maxsize=queue_depth)
+        self.upsert_q: "queue.Queue" = queue.Queue(maxsize=queue_depth)
+        self.stats = {"read": _StageStats(), "embed": _StageStats(), "upsert": _StageStats()}
+        self.report_batches: List[dict] = []
+        self.index = None
+        self.total = 0
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._outstanding = 0
+        self._upserts = 0
+        self._reader_done = threading.Event()
+        self._stop = threading.Event()
+
+    # -- bookkeeping -------------------------------------------------------
+    def _finish_batch(self):
+        with self._lock:
+            self._outstanding -= 1
+
+    def _drained(self) -> bool:
+        with self._lock:
+            return self._stop.is_set() or (self._reader_done.is_set() and self._outstanding == 0)
+
+    def _put(self, q: "queue.Queue", item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _retry_later(self, q: "queue.Queue", item: dict, stage: str, error: Exception):
+        item["attempt"] += 1
+        with self._lock:
+            self.stats[stage].retries += 1
+        tracing.incr(f"upload_{stage}_retries")
+        wait = _backoff(item["attempt"] - 1)
+        print(f"⚠️ Batch {item['batch_no']} {stage} failed on attempt {item['attempt'] - 1}: {error}; retrying in {wait:.2f}s")
+        timer = threading.Timer(wait, self._put, args=(q, item))
+        timer.daemon = True
+        timer.start()
+
+    def _fail(self, item: dict, stage: str, error: Exception):
+        with self._lock:
+            self.report_batches.append({"batch_no": item["batch_no"], "ids": item["ids"], "attempts": item["attempt"],
+                                        "success": False, "stage": stage, "error": str(error)})
+            if self.error is None:
+                self.error = error
+        self._stop.set()
+
+    # -- stages ------------------------------------------------------------
+    def _read(self):
+        stats = self.stats["read"]
         try:
-            metadata.append(json.loads(m))
-        except Exception:
-            metadata.append({"source": m})
-
-    # compute embeddings in batches (streaming to avoid high memory use)
-    all_embs = []
-    print("🔢 Computing embeddings in batches...")
-    for batch in chunked(texts, BATCH_SIZE):
-        embs = get_embeddings(batch)
-        all_embs.extend(embs)
-
-    if not all_embs:
-        print("No embeddings generated — nothing to upload.")
+            it = iter(self.batches)
+            batch_no = 0
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    ids, texts, metadata = next(it)
+                except StopIteration:
+                    break
+                stats.busy_seconds += time.perf_counter() - t0
+                tracing.record("upload_read", time.perf_counter() - t0)
+                batch_no += 1
+                stats.batches += 1
+                stats.items += len(ids)
+                with self._lock:
+                    self._outstanding += 1
+                    self.total += len(ids)
+                item = {"batch_no": batch_no, "ids": ids, "texts": texts, "metadata": metadata, "attempt": 1}
+                if not self._put(self.embed_q, item):
+                    break
+        except Exception as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = e
+            self._stop.set()
+        finally:
+            self._reader_done.set()
+
+    def _embed(self):
+        stats = self.stats["embed"]
+        while not self._drained():
+            try:
+                item = self.embed_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            t0 = time.perf_counter()
+            try:
+                with tracing.span("upload_embed"):
+                    # one contiguous float32 block per batch rather than lists of Python floats
+                    item["embeddings"] = np.asarray(get_embeddings(item["texts"]), dtype=np.float32)
+            except Exception as e:
+                if item["attempt"] >= RETRY_MAX:
+                    self._fail(item, "embed", e)
+                else:
+                    self._retry_later(self.embed_q, item, "embed", e)
+                continue
+            finally:
+                with self._lock:
+                    stats.busy_seconds += time.perf_counter() - t0
+            with self._lock:
+                stats.batches += 1
+                stats.items += len(item["ids"])
+            for part in self._split(item):
+                self._put(self.upsert_q, part)
+
+    def _split(self, item: dict) -> List[dict]:
+        """Cut an embedded batch into ``upsert_rows`` upserts, each tracked as its own batch."""
+        n = self.upsert_rows
+        starts = range(0, len(item["ids"]), n) if len(item["ids"]) else [0]
+        with self._lock:
+            self._outstanding += len(starts) - 1
+            first = self._upserts + 1
+            self._upserts += len(starts)
+        return [{"batch_no": first + k, "ids": item["ids"][i:i + n], "texts": item["texts"][i:i + n],
+                 "metadata": item["metadata"][i:i + n], "embeddings": item["embeddings"][i:i + n], "attempt": 1}
+                for k, i in enumerate(starts)]
+
+    def _open_index(self, dim: int):
+        with self._index_lock:
+            if self.index is None:
+                self.index = open_vector_store(dim)
+            return self.index
+
+    def _upsert(self):
+        stats = self.stats["upsert"]
+        while not self._drained():
+            try:
+                item = self.upsert_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            t0 = time.perf_counter()
+            try:
+                if not len(item["embeddings"]):
+                    self._finish_batch()
+                    continue
+                index = self._open_index(len(item["embeddings"][0]))
+                if not self.dry_run:
+                    vectors = list(zip(item["ids"], item["embeddings"], item["metadata"]))
+                    with tracing.span("upload_upsert"):
+                        index.upsert(vectors=vectors)
+                    if self.on_committed is not None:
+                        self.on_committed(item)
+            except Exception as e:
+                if item["attempt"] >= RETRY_MAX:
+                    self._fail(item, "upsert", e)
+                else:
+                    self._retry_later(self.upsert_q, item, "upsert", e)
+                continue
+            finally:
+                with self._lock:
+                    stats.busy_seconds += time.perf_counter() - t0
+            with self._lock:
+                stats.batches += 1
+                stats.items += len(item["ids"])
+                if not self.dry_run:
+                    self.report_batches.append({"batch_no": item["batch_no"], "ids": item["ids"],
+                                                "attempts": item["attempt"], "success": True})
+            if not self.dry_run:
+                print(f"✅ Batch {item['batch_no']}: upserted {len(item['ids'])} vectors (attempt {item['attempt']})")
+            self._finish_batch()
+
+    def run(self) -> float:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._read, name="upload-reader", daemon=True)]
+        threads += [threading.Thread(target=self._embed, name=f"upload-embed-{i}", daemon=True) for i in range(self.embed_workers)]
+        threads += [threading.Thread(target=self._upsert, name=f"upload-upsert-{i}", daemon=True) for i in range(self.upsert_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.report_batches.sort(key=lambda b: b["batch_no"])
+        return time.perf_counter() - started
+
+    def throughput(self, elapsed: float) -> dict:
+        out = {stage: s.as_dict(elapsed) for stage, s in self.stats.items()}
+        out["elapsed_seconds"] = round(elapsed, 3)
+        return out
+
+
+def _save_lexical_index(builder: Optional[BM25Builder]):
+    if builder is None:
         return
+    try:
+        index = builder.build()
+        index.save(BM25_INDEX_PATH)
+        print(f"🔤 BM25 index over {len(index)} docs written to {BM25_INDEX_PATH}")
+    except Exception as e:
+        print(f"⚠️ Failed to write BM25 index: {e}")
 
-    pinecone = _init_pinecone_if_needed()
-    index = create_index_if_missing(pinecone, len(all_embs[0]))
 
-    if dry_run:
-        print(f"Dry run: would upsert {len(ids)} vectors to index {INDEX_NAME}")
+def upload_docs(csv_path: str = "data/docs.csv", dry_run: bool = False,
+                embed_workers: Optional[int] = None, upsert_workers: Optional[int] = None, full: bool = False):
+    """Stream the CSV through embedding and upsert workers into the configured vector store.
+
+    CSV must contain columns: id, text, metadata (JSON string).
+
+    Only ``UPLOAD_QUEUE_DEPTH`` batches are buffered between stages, so memory stays flat
+    regardless of corpus size and embedding overlaps with upserting. Embedding requests are
+    as large as the embedding scheduler allows and as many run at once as its controller
+    admits; upserts are ``BATCH_SIZE`` rows.
+
+    Uploads are incremental: a local manifest (see ``src.upload_manifest``) records what each
+    committed batch wrote, so only new or changed rows are embedded and upserted, ids that
+    disappeared from the CSV are deleted, and a rerun after a crash resumes where the last
+    committed batch left off. ``full=True`` re-uploads every row.
+
+    Every row read (changed or not) also goes into the local BM25 index, which is written to
+    ``BM25_INDEX_PATH`` after a successful, non-dry run.
+    """
+    scope = LOCAL_INDEX_DIR if VECTOR_BACKEND.lower() == "local" else INDEX_NAME
+    manifest = UploadManifest(scope=scope)
+    counters = {}
+    lexical = BM25Builder() if BM25_ENABLED else None
+    batches = read_doc_batches(csv_path, BATCH_SIZE)
+    if lexical is not None:
+        batches = lexical.tap(batches)
+    batches = changed_batches(batches, manifest, EMBEDDING_MODEL, BATCH_SIZE, counters, force=full)
+    # embedding requests are packed to the scheduler's current token budget and the provider's
+    # per-request item limit; BATCH_SIZE only bounds rows per upsert
+    scheduler = get_scheduler()
+    batches = token_batches(batches, scheduler.max_items, lambda: scheduler.batch_tokens)
+    pipeline = _UploadPipeline(
+        batches,
+        dry_run=dry_run,
+        embed_workers=embed_workers or EMBED_WORKERS or scheduler.controller.max_concurrency,
+        upsert_workers=upsert_workers or UPSERT_WORKERS,
+        queue_depth=UPLOAD_QUEUE_DEPTH,
+        on_committed=lambda item: manifest.commit(item["ids"], item["texts"], item["metadata"], EMBEDDING_MODEL),
+        upsert_rows=BATCH_SIZE,
+    )
+    print("🔢 Embedding and uploading changed documents in a streaming pipeline...")
+    elapsed = pipeline.run()
+    index = pipeline.index
+    stale = manifest.stale_ids() if pipeline.error is None else []
+    print(f"🧾 Manifest diff: {counters.get('changed', 0)} new/changed, "
+          f"{counters.get('unchanged', 0)} unchanged, {len(stale)} removed")
+
+    if pipeline.error is None and index is None and not stale:
+        print("No new or changed documents — nothing to upload.")
+        manifest.close()
+        if not dry_run:
+            _save_lexical_index(lexical)
+        return
+
+    if dry_run and pipeline.error is None:
+        print(f"Dry run: would upsert {pipeline.total} vectors and delete {len(stale)} from index {INDEX_NAME}")
+        manifest.close()
         return
 
-    print("📤 Uploading vectors to Pinecone...")
-    # Upsert in batches with retry and capture per-batch status
     report = {
-        "index": INDEX_NAME,
-        "total_vectors": len(ids),
-        "batches": [],
+        "index": scope,
+        "total_vectors": pipeline.total,
+        "skipped_unchanged": counters.get("unchanged", 0),
+        "deleted": [],
+        "batches": pipeline.report_batches,
+        "throughput": pipeline.throughput(elapsed),
         "index_stats": None,
     }
 
-    for batch_no, (id_batch, emb_batch, meta_batch) in enumerate(zip(chunked(ids, BATCH_SIZE), chunked(all_embs, BATCH_SIZE), chunked(metadata, BATCH_SIZE)), start=1):
-        vectors = [(id_batch[j], emb_batch[j], meta_batch[j]) for j in range(len(id_batch))]
-        success = False
-        last_error = None
-        for attempt in range(1, RETRY_MAX + 1):
+    if pipeline.error is None and stale:
+        if index is None:
+            index = open_vector_store(None)
+        for id_batch in chunked(stale, 1000):
             try:
-                res = index.upsert(vectors=vectors)
-                success = True
-                # res may contain upserted_count or similar depending on SDK
-                report_entry = {"batch_no": batch_no, "ids": id_batch, "attempts": attempt, "success": True}
-                report["batches"].append(report_entry)
-                print(f"✅ Batch {batch_no}: upserted {len(id_batch)} vectors (attempt {attempt})")
-                break
+                index.delete(id_batch)
+                manifest.remove(id_batch)
+                report["deleted"].extend(id_batch)
             except Exception as e:
-                last_error = str(e)
-                print(f"⚠️ Batch {batch_no} upsert failed on attempt {attempt}: {e}")
-                if attempt == RETRY_MAX:
-                    report_entry = {"batch_no": batch_no, "ids": id_batch, "attempts": attempt, "success": False, "error": last_error}
-                    report["batches"].append(report_entry)
-                    raise
-                wait = RETRY_BACKOFF * attempt
-                print(f"Retrying batch {batch_no} in {wait}s...")
-                time.sleep(wait)
-
-    # fetch some index stats when possible
-    try:
-        stats = index.describe_index_stats()
-        report["index_stats"] = stats
-        print("📈 Index stats:")
-        # show a compact summary
-        namespaces = stats.get('namespaces', {}) if isinstance(stats, dict) else {}
-        total_vectors = 0
-        for ns, ns_stats in namespaces.items():
-            n_count = ns_stats.get('vector_count', 0)
-            total_vectors += n_count
-            print(f" - namespace '{ns}': {n_count} vectors")
-        if not namespaces and isinstance(stats, dict):
-            # older SDK returns different shape
-            print(stats)
-        else:
-            print(f"Total vectors (from stats): {total_vectors}")
-    except Exception as e:
-        print(f"Could not retrieve index stats: {e}")
+                print(f"⚠️ Failed to delete {len(id_batch)} removed ids: {e}")
+        print(f"🗑️ Deleted {len(report['deleted'])} vectors no longer in {csv_path}")
+    manifest.close()
+
+    if pipeline.error is None:
+        if isinstance(index, LocalVectorStore) and index.ivf_lists:
+            index.build_ivf()
+
+        # fetch some index stats when possible
+        try:
+            stats = index.describe_index_stats()
+            report["index_stats"] = stats
+            print("📈 Index stats:")
+            # show a compact summary
+            namespaces = stats.get('namespaces', {}) if isinstance(stats, dict) else {}
+            total_vectors = 0
+            for ns, ns_stats in namespaces.items():
+                n_count = ns_stats.get('vector_count', 0)
+                total_vectors += n_count
+                print(f" - namespace '{ns}': {n_count} vectors")
+            if not namespaces and isinstance(stats, dict):
+                # older SDK returns different shape
+                print(stats)
+            else:
+                print(f"Total vectors (from stats): {total_vectors}")
+        except Exception as e:
+            print(f"Could not retrieve index stats: {e}")
 
     # write report file by default
     report_path = os.getenv('PINECONE_UPLOAD_REPORT', 'pinecone_upload_report.json')
@@ -137,6 +431,16 @@ def upload_docs(csv_path: str = "data/docs.csv", dry_run: bool = False):
     except Exception as e:
         print(f"Failed to write report: {e}")
 
+    if pipeline.error is not None:
+        raise pipeline.error
+
+    _save_lexical_index(lexical)
+    if pipeline.total or report["deleted"]:
+        bump_data_version("docs")
+
+    t = report["throughput"]
+    print(f"⏱️ {pipeline.total} docs in {t['elapsed_seconds']}s "
+          f"(embed {t['embed']['items_per_sec']}/s, upsert {t['upsert']['items_per_sec']}/s)")
     print("✅ Pinecone upload complete!")
 
 
@@ -147,7 +451,11 @@ if __name__ == "__main__":
     parser.add_argument("--csv", default="data/docs.csv", help="Path to docs CSV")
     parser.add_argument("--dry-run", action="store_true", help="Don't actually upload; just compute embeddings")
     parser.add_argument("--report-path", default=None, help="Path to write JSON report of upserts")
+    parser.add_argument("--embed-workers", type=int, default=None, help="Concurrent embedding workers")
+    parser.add_argument("--upsert-workers", type=int, default=None, help="Concurrent upsert workers")
+    parser.add_argument("--full", action="store_true", help="Ignore the upload manifest and re-upload every row")
     args = parser.parse_args()
     if args.report_path:
         os.environ['PINECONE_UPLOAD_REPORT'] = args.report_path
-    upload_docs(args.csv, dry_run=args.dry_run)
+    upload_docs(args.csv, dry_run=args.dry_run, embed_workers=args.embed_workers, upsert_workers=args.upsert_workers,
+                full=args.full)
@@ -0,0 +1,225 @@
+"""Compact vector storage: float16 / int8 scalar quantization with full-precision rescoring.
+
+Embeddings are held as contiguous NumPy buffers instead of lists of Python floats (8-byte
+floats behind 8-byte pointers plus the list itself, ~32 bytes per dimension). ``float16``
+halves a float32 matrix; ``int8`` stores one byte per dimension plus a float32 scale per row
+(``x ≈ codes * scale`` with ``scale = max|x| / 127``). Approximate search scans the codes and
+rescores the best ``top_k * rescore_factor`` candidates against the full-precision vectors.
+
+Measure what a mode costs on your own vectors with::
+
+    python -m src.quantization --index-dir .cache/vector_index --k 10
+"""
+import os
+import argparse
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODES = ("none", "float16", "int8")
+# quantization of the local vector store's in-memory scan copy ("none" scans the float32 rows)
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+# approximate candidates rescored at full precision, as a multiple of top_k
+QUANT_RESCORE_FACTOR = int(os.getenv("QUANT_RESCORE_FACTOR", 4))
+
+_SCAN_CHUNK = 65536
+
+
+def check_mode(mode: str) -> str:
+    mode = (mode or "none").lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown quantization '{mode}' (expected one of {', '.join(MODES)})")
+    return mode
+
+
+def quantize(matrix: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode rows of ``matrix``; returns ``(codes, scales)`` (``scales`` is None except for int8)."""
+    mode = check_mode(mode)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == "none":
+        return matrix, None
+    if mode == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[..., None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    out = codes.astype(np.float32)
+    if scales is not None:
+        out *= scales[..., None]
+    return out
+
+
+def approximate_scores(codes: np.ndarray, scales: Optional[np.ndarray], q: np.ndarray) -> np.ndarray:
+    """Inner products of ``q`` with every encoded row, decoding one chunk at a time."""
+    q = np.asarray(q, dtype=np.float32)
+    out = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], _SCAN_CHUNK):
+        chunk = codes[start:start + _SCAN_CHUNK]
+        scores = chunk @ q if chunk.dtype == np.float32 else chunk.astype(np.float32) @ q
+        if scales is not None:
+            scores *= scales[start:start + _SCAN_CHUNK]
+        out[start:start + _SCAN_CHUNK] = scores
+    return out
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` largest finite scores, best first."""
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def rescore(candidates: np.ndarray, full: Callable[[np.ndarray], np.ndarray], q: np.ndarray,
+            top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact scores for ``candidates`` (``full(rows)`` returns their float32 vectors); best ``top_k``."""
+    if not len(candidates):
+        return candidates, np.zeros(0, dtype=np.float32)
+    order = np.argsort(candidates)  # sorted reads are kinder to a memory-mapped matrix
+    exact = np.asarray(full(candidates[order]) @ np.asarray(q, dtype=np.float32), dtype=np.float32)
+    best = top_indices(exact, top_k)
+    return candidates[order][best], exact[best]
+
+
+class QuantizedVectors:
+    """Growable encoded copy of a vector matrix, addressed by slot like the float32 file it mirrors."""
+
+    def __init__(self, dim: int, mode: str, capacity: int = 1024):
+        self.dim = dim
+        self.mode = check_mode(mode)
+        dtype = {"none": np.float32, "float16": np.float16, "int8": np.int8}[self.mode]
+        self.codes = np.zeros((capacity, dim), dtype=dtype)
+        self.scales = np.ones(capacity, dtype=np.float32) if self.mode == "int8" else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _reserve(self, capacity: int):
+        if capacity <= self.codes.shape[0]:
+            return
+        capacity = max(capacity, self.codes.shape[0] * 2)
+        codes = np.zeros((capacity, self.dim), dtype=self.codes.dtype)
+        codes[:self.codes.shape[0]] = self.codes
+        self.codes = codes
+        if self.scales is not None:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:self.scales.shape[0]] = self.scales
+            self.scales = scales
+
+    def set(self, slots: Iterable[int], matrix: np.ndarray):
+        slots = np.asarray(list(slots) if not isinstance(slots, np.ndarray) else slots, dtype=np.int64)
+        if not slots.size:
+            return
+        self._reserve(int(slots.max()) + 1)
+        codes, scales = quantize(matrix, self.mode)
+        self.codes[slots] = codes
+        if self.scales is not None:
+            self.scales[slots] = scales
+
+    def scores(self, q: np.ndarray, rows: int, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores for the first ``rows`` slots, or only for ``candidates``."""
+        if candidates is None:
+            codes, scales = self.codes[:rows], None if self.scales is None else self.scales[:rows]
+        else:
+            codes, scales = self.codes[candidates], None if self.scales is None else self.scales[candidates]
+        return approximate_scores(codes, scales, q)
+
+
+def exact_top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> List[np.ndarray]:
+    scores = np.asarray(queries, dtype=np.float32) @ np.asarray(matrix, dtype=np.float32).T
+    return [top_indices(row, k) for row in scores]
+
+
+def recall_at_k(exact: List[np.ndarray], approx: List[np.ndarray]) -> float:
+    """Mean fraction of each exact top-k found in the approximate top-k."""
+    if not exact:
+        return 1.0
+    hits = [len(set(e.tolist()) & set(a.tolist())) / max(1, len(e)) for e, a in zip(exact, approx)]
+    return float(np.mean(hits))
+
+
+def recall_report(matrix: np.ndarray, queries: np.ndarray, k: int = 10, modes: Iterable[str] = ("float16", "int8"),
+                  rescore_factors: Iterable[int] = (1, QUANT_RESCORE_FACTOR)) -> List[dict]:
+    """Recall@k and memory of each mode (with and without rescoring) against exact float32 search.
+
+    ``rescore_factor`` 1 means the ranking comes from the codes alone; larger factors rescore
+    ``k * factor`` candidates at full precision, as :class:`LocalVectorStore` does.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    exact = exact_top_k(matrix, queries, k)
+    report = [{"mode": "none", "rescore_factor": 1, "recall": 1.0,
+               "bytes_per_vector": float(matrix.shape[1] * 4), "memory_mb": round(matrix.nbytes / 1e6, 3)}]
+    full = lambda rows: matrix[rows]
+    for mode in modes:
+        codes, scales = quantize(matrix, mode)
+        nbytes = codes.nbytes + (scales.nbytes if scales is not None else 0)
+        for factor in dict.fromkeys(rescore_factors):
+            approx = []
+            for q in queries:
+                candidates = top_indices(approximate_scores(codes, scales, q), k * factor)
+                approx.append(rescore(candidates, full, q, k)[0] if factor > 1 else candidates)
+            report.append({"mode": mode, "rescore_factor": factor, "recall": round(recall_at_k(exact, approx), 4),
+                           "bytes_per_vector": round(nbytes / max(1, matrix.shape[0]), 1),
+                           "memory_mb": round(nbytes / 1e6, 3)})
+    return report
+
+
+def _load_index_vectors(path: str) -> np.ndarray:
+    from src.vector_store import LocalVectorStore
+
+    store = LocalVectorStore(path, quantization="none")
+    try:
+        slots = np.array(sorted(store._slots.values()), dtype=np.int64)
+        if store._file is None or not slots.size:
+            raise RuntimeError(f"No vectors in the local index at {path}")
+        return np.array(store._file.view(store._size)[slots])
+    finally:
+        store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure recall@k and memory of quantized vector search")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--index-dir", default=None, help="Local vector index to measure (default: LOCAL_INDEX_DIR)")
+    source.add_argument("--vectors", default=None, help=".npy matrix of vectors to measure")
+    source.add_argument("--synthetic", type=int, default=None, help="Use N random unit vectors instead")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension of --synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Query vectors sampled from the data (with noise)")
+    parser.add_argument("--noise", type=float, default=0.5, help="Query noise relative to a unit vector")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, QUANT_RESCORE_FACTOR], help="Rescore factors to try")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        matrix = rng.normal(size=(args.synthetic, args.dim)).astype(np.float32)
+    elif args.vectors:
+        matrix = np.load(args.vectors).astype(np.float32)
+    else:
+        from src.vector_store import LOCAL_INDEX_DIR
+        matrix = _load_index_vectors(args.index_dir or LOCAL_INDEX_DIR)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    # perturbed copies of stored vectors, so queries look like the corpus without matching a row exactly
+    picks = rng.choice(matrix.shape[0], size=min(args.queries, matrix.shape[0]), replace=False)
+    noise = rng.normal(size=(len(picks), matrix.shape[1])).astype(np.float32)
+    queries = matrix[picks] + args.noise * noise / np.sqrt(matrix.shape[1])
+
+    print(f"{matrix.shape[0]} vectors x {matrix.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    print(f"{'mode':<8} {'rescore':>7} {'recall@k':>9} {'bytes/vec':>10} {'MB':>10}")
+    for row in recall_report(matrix, queries, args.k, rescore_factors=args.rescore):
+        print(f"{row['mode']:<8} {row['rescore_factor']:>7} {row['recall']:>9.4f} {row['bytes_per_vector']:>10} {row['memory_mb']:>10}")
+
+
+if __name__ == "__main__":
+    main()
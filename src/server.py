@@ -0,0 +1,222 @@
+"""Async HTTP front-end for the hybrid pipeline.
+
+Identical in-flight questions (after normalization) share one pipeline run. Pipeline runs
+execute on a bounded thread pool; once ``SERVER_WORKERS + SERVER_MAX_QUEUE`` distinct
+questions are admitted, new ones are shed with 503 instead of queueing without bound.
+
+Endpoints:
+  POST /answer   {"query": "..."} -> answer, docs, graph, timings
+  GET  /healthz  liveness
+  GET  /readyz   readiness: pre-warms the vector store and Neo4j clients
+  GET  /metrics  Prometheus exposition of pipeline and server metrics
+
+Run with ``python -m src.server --port 8080``.
+"""
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.hybrid_chat import answer_query, prewarm
+from src.text_utils import tokenize
+from src import tracing
+
+load_dotenv()
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8080))
+# concurrent pipeline runs, and distinct questions allowed to wait for a worker
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 8))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", 32))
+SERVER_REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", 30.0))
+
+
+class Overloaded(Exception):
+    """Raised when admission control sheds a request."""
+
+
+def query_key(query: str) -> str:
+    """Coalescing key: case, whitespace and punctuation differences map to the same question."""
+    return " ".join(tokenize(query, drop_stopwords=False))
+
+
+class SingleFlight:
+    """At most one running computation per key; later callers for the same key join it."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def join(self, key: str, start: Callable):
+        """Return ``(future, shared)``; ``start()`` (returning an awaitable) runs only for a new key.
+
+        Must be called from the event loop thread; lookup and registration happen without an
+        intervening await, so two callers can never both start the same key.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, True
+        future = asyncio.ensure_future(start())
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return future, False
+
+    def _finished(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # mark the exception retrieved even if every waiter has gone away
+            future.exception()
+
+
+def answer_with_trace(query: str) -> dict:
+    """Run the pipeline for one question and collect its answer, context and stage timings."""
+    return answer_query(query).as_dict()
+
+
+class HybridService:
+    """Coalescing, admission control and the worker pool, independent of the HTTP layer."""
+
+    def __init__(self, workers: int = SERVER_WORKERS, max_queue: int = SERVER_MAX_QUEUE,
+                 timeout: float = SERVER_REQUEST_TIMEOUT, answer_fn: Callable = answer_with_trace,
+                 prewarm_fn: Callable = prewarm):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="serve")
+        self.capacity = workers + max_queue
+        self.timeout = timeout
+        self.flights = SingleFlight()
+        self.admitted = 0
+        self.shed = 0
+        self._answer_fn = answer_fn
+        self._prewarm_fn = prewarm_fn
+
+    def _start(self, query: str):
+        if self.admitted >= self.capacity:
+            self.shed += 1
+            tracing.incr("server_shed")
+            raise Overloaded(f"{self.admitted} questions in progress")
+        self.admitted += 1
+        return self._run(query)
+
+    async def _run(self, query: str) -> dict:
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, tracing.bind_context(self._answer_fn), query)
+        finally:
+            self.admitted -= 1
+
+    async def answer(self, query: str) -> dict:
+        """Answer ``query``, sharing the run with identical in-flight questions.
+
+        Raises ValueError for an empty question, :class:`Overloaded` when shed and
+        ``asyncio.TimeoutError`` after ``timeout`` seconds (the shared run keeps going).
+        """
+        key = query_key(query)
+        if not key:
+            raise ValueError("query must contain at least one word")
+        started = time.perf_counter()
+        future, shared = self.flights.join(key, lambda: self._start(query))
+        if shared:
+            tracing.incr("server_coalesced")
+        result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        tracing.record("server_request", time.perf_counter() - started)
+        return dict(result, query=query, coalesced=shared)
+
+    async def readiness(self) -> Dict[str, Optional[str]]:
+        loop = asyncio.get_running_loop()
+        # default pool, so a saturated worker pool does not stall readiness probes
+        return await loop.run_in_executor(None, self._prewarm_fn)
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "inflight_keys": len(self.flights), "capacity": self.capacity,
+                "shed": self.shed, "coalesced": self.flights.coalesced}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def make_app(service: Optional[HybridService] = None):
+    """Build the aiohttp application around ``service`` (a default :class:`HybridService` if omitted)."""
+    try:
+        from aiohttp import web
+    except Exception as e:
+        raise RuntimeError("aiohttp package is required for the HTTP server") from e
+
+    service = service or HybridService()
+
+    async def answer(request):
+        try:
+            body = await request.json()
+            query = body["query"]
+        except Exception:
+            return web.json_response({"error": 'expected JSON body {"query": "..."}'}, status=400)
+        try:
+            result = await service.answer(str(query))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except Overloaded as e:
+            return web.json_response({"error": f"overloaded: {e}"}, status=503, headers={"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            return web.json_response({"error": f"timed out after {service.timeout}s"}, status=504)
+        except Exception as e:
+            return web.json_response({"error": str(e)}, status=500)
+        return web.json_response(result)
+
+    async def healthz(request):
+        return web.json_response({"status": "ok", **service.stats()})
+
+    async def readyz(request):
+        status = await service.readiness()
+        ready = all(error is None for error in status.values())
+        return web.json_response({"ready": ready, "clients": status}, status=200 if ready else 503)
+
+    async def metrics(request):
+        text = tracing.metrics.to_prometheus()
+        text += "# TYPE hybrid_server gauge\n"
+        text += "".join(f'hybrid_server{{stat="{k}"}} {v}\n' for k, v in service.stats().items())
+        return web.Response(text=text, content_type="text/plain")
+
+    async def on_cleanup(app):
+        service.close()
+
+    app = web.Application()
+    app.add_routes([
+        web.post("/answer", answer),
+        web.get("/healthz", healthz),
+        web.get("/readyz", readyz),
+        web.get("/metrics", metrics),
+    ])
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the hybrid pipeline over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--max-queue", type=int, default=SERVER_MAX_QUEUE)
+    parser.add_argument("--prewarm", action="store_true", help="Initialize clients before accepting requests")
+    args = parser.parse_args()
+
+    from aiohttp import web
+
+    if args.prewarm:
+        for name, error in prewarm().items():
+            print(f"{'✅' if error is None else '⚠️'} {name}: {error or 'ready'}")
+    web.run_app(make_app(HybridService(workers=args.workers, max_queue=args.max_queue)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
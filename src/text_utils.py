@@ -0,0 +1,26 @@
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Question filler that carries no retrieval signal ("Tell me about Central Park" -> central, park).
+STOPWORDS = frozenset("""
+a about an and any are as at be but by can could do does for from give had has have how i in is it its
+know me more my of on or please show should tell than that the their there these this those to was
+what when where which who why will with would you your
+""".split())
+
+
+def normalize_text(text) -> str:
+    """Lowercase and collapse whitespace; the form stored for lexical matching."""
+    if text is None:
+        return ""
+    return " ".join(str(text).lower().split())
+
+
+def tokenize(text, drop_stopwords: bool = True) -> List[str]:
+    """Split text into lowercase alphanumeric tokens, optionally dropping stopwords."""
+    tokens = _TOKEN_RE.findall(normalize_text(text))
+    if drop_stopwords:
+        tokens = [t for t in tokens if t not in STOPWORDS]
+    return tokens
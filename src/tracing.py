@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import threading
+import contextvars
+import functools
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING", "1").lower() not in ("0", "false", "no", "off")
+# samples kept per stage for quantiles; older samples are dropped
+TRACING_RESERVOIR = int(os.getenv("TRACING_RESERVOIR", 2048))
+
+_QUANTILES = (0.5, 0.95, 0.99)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """Latency samples for one stage: running count/sum plus a bounded window for quantiles."""
+
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self, reservoir: int = TRACING_RESERVOIR):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=reservoir)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def quantiles(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {f"p{int(q * 100)}": 0.0 for q in _QUANTILES}
+        last = len(ordered) - 1
+        return {f"p{int(q * 100)}": ordered[min(last, int(round(q * last)))] for q in _QUANTILES}
+
+
+class Metrics:
+    """Process-wide stage histograms and event counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = self.histograms[stage] = Histogram()
+            hist.observe(seconds)
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {}
+            for stage, hist in self.histograms.items():
+                entry = {"count": hist.count, "sum": round(hist.total, 6)}
+                entry.update({k: round(v, 6) for k, v in hist.quantiles().items()})
+                stages[stage] = entry
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix: str = "hybrid") -> str:
+        snap = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, entry in sorted(snap["stages"].items()):
+            for q in _QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {entry[f"p{int(q * 100)}"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Spans recorded while this trace is active in the current context (one request)."""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+        self.counters: Dict[str, float] = {}
+
+    def breakdown(self) -> Dict[str, float]:
+        """Total seconds per stage, in first-seen order."""
+        out: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            out[name] = out.get(name, 0.0) + seconds
+        return out
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str):
+    """Time a block as stage ``name``. Returns a shared no-op object when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def record(stage: str, seconds: float):
+    """Record an externally measured duration for ``stage``."""
+    if not TRACING_ENABLED:
+        return
+    metrics.observe(stage, seconds)
+    current = _current_trace.get()
+    if current is not None:
+        current.spans.append((stage, seconds))
+
+
+def incr(name: str, value: float = 1):
+    """Bump an event counter (cache hits/misses, token counts, ...)."""
+    if not TRACING_ENABLED:
+        return
+    metrics.incr(name, value)
+    current = _current_trace.get()
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + value
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of :func:`span`."""
+    def decorator(fn):
+        stage = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class trace:
+    """Context manager collecting the spans of one request::
+
+        with tracing.trace() as t:
+            answer_query(q)
+        t.breakdown()
+    """
+
+    def __enter__(self) -> Trace:
+        self.trace = Trace()
+        self._parent = _current_trace.get()
+        self._token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self._token)
+        if self._parent is not None:
+            # a nested trace (e.g. answer_query inside a traced request) still reports to the outer one
+            self._parent.spans.extend(self.trace.spans)
+            for name, value in self.trace.counters.items():
+                self._parent.counters[name] = self._parent.counters.get(name, 0) + value
+        return False
+
+
+def bind_context(fn):
+    """Wrap ``fn`` so it runs in a copy of the caller's context (keeps the active trace in worker threads)."""
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
+
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_MANIFEST_PATH = os.getenv("UPLOAD_MANIFEST", os.path.join(".cache", "upload_manifest.sqlite3"))
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def fingerprint(text: str, metadata: dict) -> Tuple[str, str]:
+    """Return (text hash, metadata hash) for one document."""
+    return _hash(text), _hash(json.dumps(metadata, sort_keys=True, default=str))
+
+
+class UploadManifest:
+    """Local record of what has been committed to a vector index: id -> (text hash, metadata hash, model).
+
+    Rows are written per batch only after that batch's upsert succeeded, so the manifest is
+    always a safe lower bound of the index contents. Re-running an interrupted upload skips
+    every batch that was already committed. ``scope`` separates manifests for different indexes
+    that share one file.
+    """
+
+    def __init__(self, path: Optional[str] = None, scope: str = ""):
+        self.path = path or UPLOAD_MANIFEST_PATH
+        self.scope = scope
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (scope TEXT, id TEXT, text_hash TEXT, meta_hash TEXT, model TEXT, "
+            "updated_at REAL, PRIMARY KEY (scope, id))"
+        )
+        self._db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)")
+        self._db.commit()
+
+    def diff(self, ids: Sequence[str], texts: Sequence[str], metadata: Sequence[dict], model: str) -> List[bool]:
+        """Mark ``ids`` as present in the input and return, per row, whether it must be (re-)uploaded."""
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO seen (id) VALUES (?)", [(i,) for i in ids])
+            known = {}
+            for start in range(0, len(ids), 500):
+                part = list(ids[start:start + 500])
+                marks = ",".join("?" * len(part))
+                for row in self._db.execute(
+                    f"SELECT id, text_hash, meta_hash, model FROM docs WHERE scope = ? AND id IN ({marks})",
+                    [self.scope, *part],
+                ):
+                    known[row[0]] = row[1:]
+        return [known.get(i) != (*fingerprint(t, m), model) for i, t, m in zip(ids, texts, metadata)]
+
+    def commit(self, ids: Sequence[str], texts: Sequence[str], metadata: Sequence[dict], model: str):
+        """Record a successfully upserted batch (one SQLite transaction per batch)."""
+        now = time.time()
+        rows = [(self.scope, i, *fingerprint(t, m), model, now) for i, t, m in zip(ids, texts, metadata)]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO docs (scope, id, text_hash, meta_hash, model, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def stale_ids(self) -> List[str]:
+        """Ids committed earlier that were not seen in the current input (i.e. removed from the CSV)."""
+        with self._lock:
+            return [r[0] for r in self._db.execute(
+                "SELECT id FROM docs WHERE scope = ? AND id NOT IN (SELECT id FROM seen)", (self.scope,)
+            )]
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            self._db.executemany("DELETE FROM docs WHERE scope = ? AND id = ?", [(self.scope, i) for i in ids])
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM docs WHERE scope = ?", (self.scope,)).fetchone()
+        return n
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def changed_batches(batches: Iterable[Tuple[List[str], List[str], List[dict]]], manifest: UploadManifest,
+                    model: str, batch_size: int, counters: dict,
+                    force: bool = False) -> Iterator[Tuple[List[str], List[str], List[dict]]]:
+    """Filter (ids, texts, metadata) batches down to rows that differ from the manifest.
+
+    Surviving rows are re-packed into full ``batch_size`` batches. ``counters`` receives
+    ``unchanged`` and ``changed`` totals. With ``force`` every row is kept (but still marked
+    as seen, so removed ids are detected).
+    """
+    counters.setdefault("unchanged", 0)
+    counters.setdefault("changed", 0)
+    buf_ids, buf_texts, buf_meta = [], [], []
+    for ids, texts, metadata in batches:
+        for keep, i, t, m in zip(manifest.diff(ids, texts, metadata, model), ids, texts, metadata):
+            if not keep and not force:
+                counters["unchanged"] += 1
+                continue
+            counters["changed"] += 1
+            buf_ids.append(i)
+            buf_texts.append(t)
+            buf_meta.append(m)
+            if len(buf_ids) >= batch_size:
+                yield buf_ids, buf_texts, buf_meta
+                buf_ids, buf_texts, buf_meta = [], [], []
+    if buf_ids:
+        yield buf_ids, buf_texts, buf_meta
@@ -0,0 +1,55 @@
+import os
+from typing import Sequence
+
+import numpy as np
+
+
+class VectorFile:
+    """Growable memory-mapped float32 matrix holding one vector per slot for a given dimension."""
+
+    def __init__(self, path: str, dim: int, initial_capacity: int = 1024):
+        self.path = path
+        self.dim = dim
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(initial_capacity * dim * 4)
+        self.capacity = os.path.getsize(path) // (dim * 4)
+        self._mm = np.memmap(path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+
+    def _remap(self, capacity: int):
+        self._mm.flush()
+        del self._mm
+        self.capacity = capacity
+        self._mm = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _grow(self, min_capacity: int):
+        # another process sharing the file may have grown it already: never shrink it
+        on_disk = os.path.getsize(self.path) // (self.dim * 4)
+        if on_disk >= min_capacity:
+            self._remap(on_disk)
+            return
+        new_capacity = max(min_capacity, self.capacity * 2, on_disk)
+        self._mm.flush()
+        del self._mm
+        with open(self.path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._mm = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def view(self, rows: int) -> np.ndarray:
+        """Return a read-only window over the first ``rows`` slots (no copy)."""
+        return self._mm[:rows]
+
+    def read(self, slot: int) -> np.ndarray:
+        if slot >= self.capacity:
+            # written by another process after this mapping was made
+            self._remap(os.path.getsize(self.path) // (self.dim * 4))
+        return np.array(self._mm[slot])
+
+    def write(self, slot: int, vector: Sequence[float]):
+        if slot >= self.capacity:
+            self._grow(slot + 1)
+        self._mm[slot] = np.asarray(vector, dtype=np.float32)
+
+    def flush(self):
+        self._mm.flush()
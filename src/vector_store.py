@@ -0,0 +1,309 @@
+import os
+import json
+import heapq
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+from src.quantization import (QUANT_RESCORE_FACTOR, VECTOR_QUANTIZATION, QuantizedVectors, check_mode, rescore,
+                              top_indices)
+from src.vector_file import VectorFile
+
+load_dotenv()
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "vector_index"))
+# IVF partitioning for the local backend; 0 keeps exact brute-force search.
+LOCAL_INDEX_IVF_LISTS = int(os.getenv("LOCAL_INDEX_IVF_LISTS", 0))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", 4))
+
+
+class VectorStore:
+    """Interface shared by vector backends. Method names and result shapes mirror ``pinecone.Index``
+    so callers can use either backend unchanged."""
+
+    def upsert(self, vectors: Iterable):
+        raise NotImplementedError
+
+    def query(self, vector: Sequence[float], top_k: int = 3, include_metadata: bool = True) -> dict:
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]):
+        raise NotImplementedError
+
+    def describe_index_stats(self) -> dict:
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    """Thin adapter over a ``pinecone.Index``."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors: Iterable):
+        # the pinecone client serializes plain lists, not numpy rows
+        vectors = [(v[0], v[1].tolist(), *v[2:]) if isinstance(v, tuple) and isinstance(v[1], np.ndarray) else v
+                   for v in vectors]
+        return self.index.upsert(vectors=vectors)
+
+    def query(self, vector: Sequence[float], top_k: int = 3, include_metadata: bool = True) -> dict:
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata)
+
+    def delete(self, ids: Sequence[str]):
+        return self.index.delete(ids=list(ids))
+
+    def describe_index_stats(self) -> dict:
+        return self.index.describe_index_stats()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _as_record(v):
+    if isinstance(v, dict):
+        return str(v["id"]), v["values"], v.get("metadata") or {}
+    vid, values = v[0], v[1]
+    return str(vid), values, (v[2] if len(v) > 2 else {}) or {}
+
+
+class LocalVectorStore(VectorStore):
+    """In-process cosine index: unit-normalized float32 rows in a memory-mapped matrix.
+
+    ``vectors_<dim>.f32`` holds one row per slot; ``ids.sqlite3`` maps slot -> (id, metadata JSON).
+    Queries are a single matrix-vector product over the live rows. With ``ivf_lists`` > 0 the rows
+    are also partitioned by k-means and only the ``nprobe`` closest partitions are scored.
+    With ``quantization`` ("float16"/"int8") the scan runs over an in-memory quantized copy and
+    the best ``top_k * rescore_factor`` candidates are rescored against the float32 rows.
+    """
+
+    def __init__(self, path: Optional[str] = None, dim: Optional[int] = None,
+                 ivf_lists: Optional[int] = None, nprobe: Optional[int] = None,
+                 quantization: Optional[str] = None, rescore_factor: Optional[int] = None):
+        self.path = path or LOCAL_INDEX_DIR
+        self.ivf_lists = LOCAL_INDEX_IVF_LISTS if ivf_lists is None else ivf_lists
+        self.nprobe = nprobe or LOCAL_INDEX_NPROBE
+        self.quantization = check_mode(VECTOR_QUANTIZATION if quantization is None else quantization)
+        self.rescore_factor = max(1, rescore_factor or QUANT_RESCORE_FACTOR)
+        self._codes = None
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(self.path, "ids.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS rows (slot INTEGER PRIMARY KEY, id TEXT UNIQUE, metadata TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM settings WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else dim
+        if row and dim and int(row[0]) != dim:
+            raise RuntimeError(f"Local index at {self.path} has dimension {row[0]}, expected {dim}")
+        self._file = None
+        self._slots: Dict[str, int] = {}
+        self._size = 0
+        self._alive = np.zeros(0, dtype=bool)
+        # min-heap of dead slots below _size, reused lowest first
+        self._free = []
+        self._centroids = None
+        self._assign = None
+        self._ivf_built_at = 0
+        for slot, vid in self._db.execute("SELECT slot, id FROM rows"):
+            self._slots[vid] = slot
+            self._size = max(self._size, slot + 1)
+        if self.dim:
+            self._open(self.dim)
+            self._alive = np.zeros(self._file.capacity, dtype=bool)
+            if self._slots:
+                self._alive[list(self._slots.values())] = True
+            self._free = np.flatnonzero(~self._alive[:self._size]).tolist()
+            if self._codes is not None and self._size:
+                data = self._file.view(self._size)
+                for start in range(0, self._size, 65536):
+                    self._codes.set(np.arange(start, min(start + 65536, self._size)), data[start:start + 65536])
+
+    def _open(self, dim: int):
+        self.dim = dim
+        self._file = VectorFile(os.path.join(self.path, f"vectors_{dim}.f32"), dim)
+        if self.quantization != "none":
+            self._codes = QuantizedVectors(dim, self.quantization, capacity=self._file.capacity)
+        self._db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('dim', ?)", (str(dim),))
+
+    def _free_slot(self) -> int:
+        if self._free:
+            return heapq.heappop(self._free)
+        self._size += 1
+        return self._size - 1
+
+    def upsert(self, vectors: Iterable):
+        records = [_as_record(v) for v in vectors]
+        if not records:
+            return {"upserted_count": 0}
+        with self._lock:
+            matrix = _normalize(np.asarray([r[1] for r in records], dtype=np.float32))
+            if self._file is None:
+                self._open(matrix.shape[1])
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dim}")
+            rows = []
+            for (vid, _, meta), vec in zip(records, matrix):
+                slot = self._slots.get(vid)
+                if slot is None:
+                    slot = self._free_slot()
+                    self._slots[vid] = slot
+                self._file.write(slot, vec)
+                if self._alive.shape[0] < self._file.capacity:
+                    self._alive = np.concatenate([self._alive, np.zeros(self._file.capacity - self._alive.shape[0], dtype=bool)])
+                self._alive[slot] = True
+                if self._centroids is not None:
+                    self._assign_slots(np.array([slot]), vec[None, :])
+                rows.append((slot, vid, json.dumps(meta)))
+            if self._codes is not None:
+                self._codes.set([r[0] for r in rows], matrix)
+            self._file.flush()
+            self._db.executemany("INSERT OR REPLACE INTO rows (slot, id, metadata) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+        return {"upserted_count": len(records)}
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            gone = [self._slots.pop(str(i)) for i in ids if str(i) in self._slots]
+            if gone:
+                self._alive[gone] = False
+                for slot in gone:
+                    heapq.heappush(self._free, slot)
+                self._db.executemany("DELETE FROM rows WHERE slot = ?", [(s,) for s in gone])
+                self._db.commit()
+        return {"deleted_count": len(gone)}
+
+    def _assign_slots(self, slots: np.ndarray, vectors: np.ndarray):
+        if self._assign.shape[0] < self._alive.shape[0]:
+            self._assign = np.concatenate([self._assign, np.full(self._alive.shape[0] - self._assign.shape[0], -1, dtype=np.int32)])
+        self._assign[slots] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, sample_size: int = 50000, seed: int = 0):
+        """Partition live rows with spherical k-means so queries only scan ``nprobe`` partitions."""
+        n_lists = n_lists or self.ivf_lists
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._size])
+            if not n_lists or live.size < n_lists:
+                return
+            data = self._file.view(self._size)
+            rng = np.random.default_rng(seed)
+            sample = data[rng.choice(live, size=min(sample_size, live.size), replace=False)]
+            centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = sample[labels == c]
+                    if members.size:
+                        centroids[c] = members.sum(axis=0)
+                centroids = _normalize(centroids)
+            self._centroids = centroids.astype(np.float32)
+            self._assign = np.full(self._alive.shape[0], -1, dtype=np.int32)
+            for start in range(0, live.size, 65536):
+                part = live[start:start + 65536]
+                self._assign_slots(part, data[part])
+            self._ivf_built_at = live.size
+
+    def _candidates(self, q: np.ndarray, k: int) -> Optional[np.ndarray]:
+        """Live slots in the ``nprobe`` closest partitions, widened to further partitions until
+        they hold at least ``k`` rows; None (scan everything) when that takes all of them."""
+        if not self.ivf_lists:
+            return None
+        live_count = len(self._slots)
+        if self._centroids is None or live_count > 2 * self._ivf_built_at:
+            self.build_ivf()
+        if self._centroids is None:
+            return None
+        assign = self._assign[:self._size]
+        alive = self._alive[:self._size]
+        order = np.argsort(-(self._centroids @ q))
+        # partitions emptied by deletes (or a small nprobe over a sparse index) would otherwise
+        # leave the query with fewer than k results, or none
+        sizes = np.bincount(assign[alive & (assign >= 0)], minlength=len(order))[order]
+        n_probe = max(self.nprobe, int(np.searchsorted(np.cumsum(sizes), min(k, live_count))) + 1)
+        if n_probe >= len(order):
+            return None
+        return np.flatnonzero(np.isin(assign, order[:n_probe]) & alive)
+
+    def query(self, vector: Sequence[float], top_k: int = 3, include_metadata: bool = True) -> dict:
+        with self._lock:
+            if self._file is None or not self._slots:
+                return {"matches": []}
+            q = _normalize(np.asarray(vector, dtype=np.float32))
+            candidates = self._candidates(q, top_k)
+            data = self._file.view(self._size)
+            if self._codes is not None:
+                scores = self._codes.scores(q, self._size, candidates)
+            elif candidates is None:
+                scores = np.asarray(data @ q)
+            else:
+                scores = np.asarray(data[candidates] @ q)
+            if candidates is None:
+                scores[~self._alive[:self._size]] = -np.inf
+                pool = np.arange(self._size)
+            else:
+                pool = candidates
+            if self._codes is not None:
+                shortlist = pool[top_indices(scores, top_k * self.rescore_factor)]
+                slots, exact = rescore(shortlist, lambda rows: data[rows], q, top_k)
+                slots = slots.tolist()
+            else:
+                top = top_indices(scores, top_k)
+                slots, exact = [int(pool[i]) for i in top], scores[top]
+            if not slots:
+                return {"matches": []}
+            marks = ",".join("?" * len(slots))
+            rows = {s: (vid, meta) for s, vid, meta in self._db.execute(f"SELECT slot, id, metadata FROM rows WHERE slot IN ({marks})", slots)}
+        matches = []
+        for score, slot in zip(exact, slots):
+            vid, meta = rows[slot]
+            match = {"id": vid, "score": float(score)}
+            if include_metadata:
+                match["metadata"] = json.loads(meta) if meta else {}
+            matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self) -> dict:
+        with self._lock:
+            count = len(self._slots)
+            return {
+                "dimension": self.dim,
+                "total_vector_count": count,
+                "namespaces": {"": {"vector_count": count}},
+                "ivf_lists": 0 if self._centroids is None else int(self._centroids.shape[0]),
+                "quantization": self.quantization,
+                "scan_bytes": int(self._codes.nbytes) if self._codes is not None else self._size * (self.dim or 0) * 4,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            self._db.close()
+
+
+def get_vector_store(dim: Optional[int] = None, backend: Optional[str] = None) -> VectorStore:
+    """Open the vector backend selected by ``VECTOR_BACKEND`` ("pinecone" or "local").
+
+    ``dim`` is only needed when the index may not exist yet (e.g. during upload).
+    """
+    backend = (backend or VECTOR_BACKEND).lower()
+    if backend == "local":
+        return LocalVectorStore(dim=dim)
+    if backend != "pinecone":
+        raise RuntimeError(f"Unknown VECTOR_BACKEND '{backend}' (expected 'pinecone' or 'local')")
+    try:
+        import pinecone
+    except Exception as e:
+        raise RuntimeError("pinecone package is required for the pinecone vector backend") from e
+    api_key = os.getenv("PINECONE_API_KEY")
+    env = os.getenv("PINECONE_ENVIRONMENT")
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not api_key or not index_name:
+        raise RuntimeError("PINECONE_API_KEY and PINECONE_INDEX_NAME must be set for the pinecone vector backend")
+    pinecone.init(api_key=api_key, environment=env)
+    return PineconeVectorStore(pinecone.Index(index_name))
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Keep on-disk caches and version stamps out of the working tree and off by default."""
+    monkeypatch.setattr("src.data_version.DATA_VERSION_PATH", str(tmp_path / "data_version.json"))
+    monkeypatch.setattr("src.upload_manifest.UPLOAD_MANIFEST_PATH", str(tmp_path / "manifest.sqlite3"))
+    monkeypatch.setattr("src.bm25_index.BM25_INDEX_PATH", str(tmp_path / "bm25_index.npz"))
+    monkeypatch.setattr("src.pinecone_uploader.BM25_INDEX_PATH", str(tmp_path / "bm25_index.npz"))
+    monkeypatch.setattr("src.embedding_cache.EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr("src.answer_cache.ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr("src.graph_replica.GRAPH_REPLICA", False)
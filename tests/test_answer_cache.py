@@ -0,0 +1,81 @@
+import src.hybrid_chat as hc
+from src import data_version
+from src.answer_cache import SemanticAnswerCache
+
+
+def test_semantic_cache_threshold_ttl_and_lru():
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, max_entries=2, version_fn=lambda: "v1")
+    cache.store([1.0, 0.0], "q1", "answer 1", [{"id": "doc1"}], [])
+    hit, similarity = cache.lookup([0.99, 0.05])
+    assert hit.answer == "answer 1" and hit.docs == [{"id": "doc1"}] and 0.99 < similarity < 1.0
+    assert cache.lookup([0.0, 1.0]) is None
+
+    cache.store([0.0, 1.0], "q2", "answer 2", [], [])
+    cache.lookup([1.0, 0.0])  # q1 becomes most recently used
+    cache.store([0.7, 0.7], "q3", "answer 3", [], [])
+    assert cache.lookup([0.0, 1.0]) is None  # q2 evicted
+    assert cache.lookup([1.0, 0.0])[0].answer == "answer 1"
+
+    cache.ttl = -1
+    assert cache.lookup([1.0, 0.0]) is None
+
+
+def test_semantic_cache_matches_only_the_same_key():
+    cache = SemanticAnswerCache(threshold=0.9, version_fn=lambda: "v1")
+    cache.store([1.0, 0.0], "q", "three docs", [], [], key=("gpt", 3, 3))
+    assert cache.lookup([1.0, 0.0], key=("gpt", 5, 3)) is None
+    assert cache.lookup([1.0, 0.0], key=("other", 3, 3)) is None
+    cache.store([1.0, 0.0], "q", "five docs", [], [], key=("gpt", 5, 3))
+    assert cache.lookup([1.0, 0.0], key=("gpt", 5, 3))[0].answer == "five docs"
+    hit, similarity = cache.lookup([1.0, 0.0], key=("gpt", 3, 3))
+    assert hit.answer == "three docs" and similarity > 0.99
+
+
+def test_semantic_cache_invalidated_by_data_version():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0], "q", "a", [], [])
+    assert cache.lookup([1.0, 0.0]) is not None
+    data_version.bump("docs")
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_semantic_cache_replaces_same_question_and_drops_other_dimensions():
+    cache = SemanticAnswerCache(threshold=0.9, max_entries=3, version_fn=lambda: "v1")
+    cache.store([0.0, 1.0], "other", "kept", [], [], key="k")
+    cache.store([1.0, 0.0], "q", "first", [], [], key="k")
+    cache.store([2.0, 0.0], "q", "second", [], [], key="k")
+    cache.store([1.0, 0.0], "q", "other key", [], [], key="k2")
+    assert cache.stats()["entries"] == 3
+    assert cache.lookup([1.0, 0.0], key="k")[0].answer == "second"
+    assert cache.lookup([0.0, 1.0], key="k")[0].answer == "kept"
+
+    assert cache.lookup([1.0, 0.0, 0.0], key="k") is None  # embedding model changed
+    assert cache.stats()["entries"] == 0
+    cache.store([1.0, 0.0, 0.0], "q", "new model", [], [], key="k")
+    assert cache.lookup([1.0, 0.0, 0.0], key="k")[0].answer == "new model"
+
+
+def test_stream_answer_reuses_answer_for_paraphrase(monkeypatch):
+    cache = SemanticAnswerCache(threshold=0.9)
+    monkeypatch.setattr(hc, "get_answer_cache", lambda: cache)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    vectors = {"Tell me about Central Park": [1.0, 0.0], "What is Central Park?": [0.98, 0.1]}
+    monkeypatch.setattr(hc, "get_embeddings", lambda q: [vectors[q]])
+    monkeypatch.setattr(hc, "retrieve_context", lambda query, **kwargs: {"docs": [{"id": "doc1", "metadata": {}}], "graph": [], "dropped": {}})
+    completions = []
+
+    def fake_create(**kwargs):
+        completions.append(kwargs)
+        return iter([{"choices": [{"delta": {"content": "A park."}}]}])
+
+    monkeypatch.setattr(hc.openai.ChatCompletion, "create", fake_create)
+
+    assert hc.answer_query("Tell me about Central Park").answer == "A park."
+    stream = hc.stream_answer("What is Central Park?")
+    assert "".join(stream) == "A park."
+    assert stream.cached and stream.context["docs"][0]["id"] == "doc1"
+    assert len(completions) == 1
+    # a different top_k is a different answer
+    assert "".join(hc.stream_answer("What is Central Park?", top_k=5)) == "A park."
+    assert len(completions) == 2
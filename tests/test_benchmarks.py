@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks import run
+from benchmarks.fakes import LatencyModel, RateLimitError
+
+
+def test_latency_model_rate_limit_and_errors():
+    limited = LatencyModel(rate_limit_rps=2)
+    limited.call()
+    limited.call()
+    with pytest.raises(RateLimitError):
+        limited.call()
+    assert limited.stats() == {"calls": 3, "errors": 0, "rate_limited": 1}
+
+    failing = LatencyModel(error_rate=1.0, seed=1)
+    with pytest.raises(Exception):
+        failing.call()
+    assert failing.errors == 1
+
+
+def test_offline_scenarios_run_end_to_end(tmp_path):
+    answer = run.bench_answer_query(n_queries=5, concurrency=2, workdir=str(tmp_path / "a"))
+    assert answer["errors"] == 0 and answer["items"] == 5
+    assert answer["p50_ms"] is not None and answer["backends"]["chat"]["calls"] == 5
+
+    batch = run.bench_answer_queries(n_queries=5, concurrency=2, workdir=str(tmp_path / "b"))
+    assert batch["errors"] == 0 and batch["backends"]["embedding"]["calls"] == 1
+
+    upload = run.bench_upload_docs(n_docs=300, workdir=str(tmp_path / "u"))
+    assert upload["errors"] == 0
+    assert upload["backends"]["vector_upsert"]["calls"] > 0
+
+    load = run.bench_load_locations(n_locations=250, batch_size=100, workdir=str(tmp_path / "l"))
+    assert load["errors"] == 0
+    assert load["backends"]["neo4j"]["calls"] >= 3
+
+
+def test_compare_flags_throughput_and_tail_regressions():
+    baseline = [{"scenario": "answer_query", "qps": 100.0, "p99_ms": 50.0, "errors": 0}]
+    ok = [{"scenario": "answer_query", "qps": 90.0, "p99_ms": 55.0, "errors": 0}]
+    bad = [{"scenario": "answer_query", "qps": 70.0, "p99_ms": 80.0, "errors": 0}]
+    assert run.compare(ok, baseline, tolerance=0.2) == []
+    regressions = run.compare(bad, baseline, tolerance=0.2)
+    assert len(regressions) == 2 and all("answer_query" in r for r in regressions)
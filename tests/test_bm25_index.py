@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pytest
+
+import src.bm25_index as bm
+import src.hybrid_chat as hc
+from src import tracing
+from src.pinecone_uploader import read_doc_batches
+
+
+@pytest.fixture
+def index():
+    builder = bm.BM25Builder()
+    for _ in builder.tap(read_doc_batches("data/docs.csv", batch_size=2)):
+        pass
+    return builder.build()
+
+
+def test_search_ranks_matching_doc_first(index):
+    hits, ratio, full_match = index.search("Statue of Liberty", top_k=3)
+    assert hits[0]["id"] == "doc2"
+    assert hits[0]["metadata"]["neo4j_id"] == "2"
+    assert full_match and ratio > 1
+    assert index.search("zzz unknown", top_k=3) == ([], 0.0, False)
+
+
+def test_save_load_roundtrip(index, tmp_path):
+    path = str(tmp_path / "idx.npz")
+    index.save(path)
+    loaded = bm.BM25Index.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.search("Empire State Building", 2) == index.search("Empire State Building", 2)
+
+
+def test_string_columns_are_packed_utf8(index, tmp_path):
+    builder = bm.BM25Builder()
+    builder.add(["short", "long-id-\u00e9"], ["caf\u00e9 au lait", "tea"],
+                [{"text_snippet": "x" * 5000, "neo4j_id": "7", "raw": "y" * 5000}, {}])
+    small = builder.build()
+    assert small.doc_ids[1] == "long-id-\u00e9" and small.vocab[0] < small.vocab[1]
+    # only the fields a hit needs are kept, as bytes plus one offset per row (no padding)
+    assert small.metadata.nbytes < 5100
+    assert small.search("café", 1)[0][0]["metadata"] == {"text_snippet": "x" * 5000, "neo4j_id": "7"}
+    assert small.search("tea", 1)[0][0]["metadata"] == {}
+
+    # an index file written before the columns were packed still loads
+    legacy = str(tmp_path / "legacy.npz")
+    np.savez(legacy, doc_ids=np.array(["a", "b"]), metadata=np.array(["{}", "{}"]), vocab=np.array(["x", "y"]),
+             indptr=np.array([0, 1, 2]), postings_doc=np.array([0, 1], dtype=np.int32),
+             postings_tf=np.array([1, 1], dtype=np.uint32), doc_len=np.array([1.0, 1.0], dtype=np.float32))
+    assert bm.BM25Index.load(legacy).search("y", 1)[0][0]["id"] == "b"
+
+
+def test_stream_answer_scores_bm25_once(index, monkeypatch):
+    index.save(bm.BM25_INDEX_PATH)
+    monkeypatch.setattr(bm, "BM25_SHORTCIRCUIT_RATIO", 1.5)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(hc, "get_answer_cache", lambda: object())
+    monkeypatch.setattr(hc, "neo4j_search", lambda query, limit=3: [])
+    monkeypatch.setattr(hc.openai.ChatCompletion, "create",
+                        lambda **kwargs: iter([{"choices": [{"delta": {"content": "ok"}}]}]))
+    searches = []
+    real_search = bm.BM25Index.search
+    monkeypatch.setattr(bm.BM25Index, "search", lambda self, *a: searches.append(a) or real_search(self, *a))
+    stream = hc.stream_answer("Statue of Liberty")
+    assert "".join(stream) == "ok" and stream.context["docs"][0]["id"] == "doc2"
+    assert len(searches) == 1
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "b"}, {"id": "c"}]
+    fused = bm.reciprocal_rank_fusion([dense, lexical], top_k=2, k=60)
+    assert [h["id"] for h in fused] == ["b", "c"]
+
+
+def test_lexical_search_reloads_and_short_circuits(index, monkeypatch):
+    assert bm.lexical_search("Statue of Liberty") == ([], False)
+    index.save(bm.BM25_INDEX_PATH)
+    hits, confident = bm.lexical_search("Statue of Liberty")
+    assert hits[0]["id"] == "doc2" and not confident
+
+    monkeypatch.setattr(bm, "BM25_SHORTCIRCUIT_RATIO", 1.5)
+    assert bm.lexical_search("Statue of Liberty")[1]
+
+
+def test_doc_search_fuses_or_short_circuits(index, monkeypatch):
+    index.save(bm.BM25_INDEX_PATH)
+    calls = []
+
+    def fake_pinecone(query, top_k=3):
+        calls.append(query)
+        return [{"id": "doc5", "score": 0.9, "metadata": {}}, {"id": "doc2", "score": 0.8, "metadata": {}}]
+
+    monkeypatch.setattr(hc, "pinecone_search", fake_pinecone)
+    fused = hc.doc_search("Statue of Liberty", top_k=2)
+    assert [d["id"] for d in fused] == ["doc2", "doc5"]
+    assert calls == ["Statue of Liberty"]
+
+    monkeypatch.setattr(bm, "BM25_SHORTCIRCUIT_RATIO", 1.5)
+    with tracing.trace() as t:
+        docs = hc.doc_search("Statue of Liberty", top_k=2)
+    assert docs[0]["id"] == "doc2" and calls == ["Statue of Liberty"]
+    assert t.counters["bm25_shortcircuit"] == 1
+
+
+def test_doc_search_falls_back_to_lexical_when_vector_fails(index, monkeypatch):
+    index.save(bm.BM25_INDEX_PATH)
+
+    def broken(query, top_k=3):
+        raise RuntimeError("vector store down")
+
+    monkeypatch.setattr(hc, "pinecone_search", broken)
+    assert hc.doc_search("Empire State Building")[0]["id"] == "doc3"
+    with pytest.raises(RuntimeError):
+        hc.doc_search("zzz unknown")
+
+
+def test_upload_docs_writes_the_index(monkeypatch):
+    mod = __import__("src.pinecone_uploader", fromlist=["upload_docs"])
+    monkeypatch.setattr(mod, "get_embeddings", lambda texts: [[0.1, 0.2]] * len(texts))
+
+    class Store:
+        def upsert(self, vectors=None):
+            pass
+
+        def delete(self, ids):
+            pass
+
+        def describe_index_stats(self):
+            return {}
+
+    monkeypatch.setattr(mod, "open_vector_store", lambda dim: Store())
+    mod.upload_docs("data/docs.csv")
+    assert os.path.exists(bm.BM25_INDEX_PATH)
+    assert bm.lexical_search("Central Park")[0][0]["id"] == "doc1"
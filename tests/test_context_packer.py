@@ -0,0 +1,68 @@
+import pytest
+
+import src.context_packer as cp
+import src.hybrid_chat as hc
+from src import tracing
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # deterministic counts whether or not tiktoken is installed
+    monkeypatch.setattr(cp, "_encoding", lambda: None)
+
+
+def _doc(i, text, neo4j_id=None):
+    meta = {"text_snippet": text}
+    if neo4j_id:
+        meta["neo4j_id"] = neo4j_id
+    return {"id": f"doc{i}", "score": 1.0 - i / 10, "metadata": meta}
+
+
+def test_pack_context_deduplicates_overlapping_entries():
+    docs = [
+        _doc(1, "Central Park is a large public park in New York City", "1"),
+        _doc(2, "Central Park is a large public park in New York City!"),
+        _doc(3, "The Statue of Liberty was a gift from France", "2"),
+        _doc(1, "Central Park again"),
+    ]
+    graph = [
+        {"id": "1", "name": "Central Park", "description": "Large public park in New York City", "hops": 0},
+        {"id": "2", "name": "Statue of Liberty", "description": "Iconic national monument in NYC", "hops": 0},
+    ]
+    packed = cp.pack_context(docs, graph, 1000, hc._doc_line, hc._graph_line)
+    assert packed.doc_lines == [
+        "[doc:doc1] Central Park is a large public park in New York City",
+        "[doc:doc3] The Statue of Liberty was a gift from France",
+    ]
+    assert packed.graph_lines == ["[graph:2] Statue of Liberty - Iconic national monument in NYC"]
+    assert packed.deduplicated == 3 and packed.saved > 0
+
+
+def test_pack_context_truncates_to_budget_and_keeps_citations():
+    docs = [_doc(i, " ".join(["w%dx%d" % (i, j) for j in range(60)])) for i in range(4)]
+    graph = [{"id": str(i), "name": f"Place {i}", "description": "x " * 40, "hops": 1, "via": "0"} for i in range(3)]
+    packed = cp.pack_context(docs, graph, 200, hc._doc_line, hc._graph_line)
+
+    assert packed.tokens_after <= 200
+    assert packed.tokens_before > packed.tokens_after
+    assert packed.truncated == 1 and packed.dropped > 0
+    assert packed.doc_lines[0].startswith("[doc:doc0] w0x0")
+    assert all(line.startswith("[doc:doc") for line in packed.doc_lines)
+    assert any(line.endswith("…") for line in packed.doc_lines + packed.graph_lines)
+
+
+def test_prompt_budget_leaves_room_for_the_answer(monkeypatch):
+    monkeypatch.setattr(cp, "MODEL_CONTEXT_WINDOW", 1000)
+    monkeypatch.setattr(cp, "CONTEXT_TOKEN_BUDGET", 5000)
+    assert cp.prompt_budget("x" * 400, max_output_tokens=300) == 1000 - 300 - 100
+    assert cp.prompt_budget("x" * 400, max_output_tokens=300, budget=50) == 50
+
+
+def test_build_prompt_reports_tokens():
+    docs = [_doc(1, "Central Park is a large urban park", "1")] * 3
+    graph = [{"id": "1", "name": "Central Park", "description": "Large public park in New York City"}]
+    with tracing.trace() as t:
+        prompt = hc.build_prompt("Tell me about Central Park", docs, graph)
+    assert prompt.count("[doc:doc1]") == 1 and "[graph:1] Central Park" in prompt
+    assert t.counters["prompt_tokens"] == cp.count_tokens(prompt)
+    assert t.counters["context_tokens_saved"] > 0
@@ -0,0 +1,65 @@
+import src.embeddings as emb
+from src.embedding_cache import EmbeddingCache
+
+
+def test_cache_roundtrip_and_eviction(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2, memory_items=0)
+    cache.put_many("m", ["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    found = cache.get_many("m", ["a", "x", "b"])
+    assert sorted(found) == [0, 2]
+    assert found[2].tolist() == [0.0, 1.0]
+    assert cache.get_many("other-model", ["a"]) == {}
+
+    cache.put_many("m", ["c"], [[0.5, 0.5]])
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    cache.close()
+
+    # persisted across instances
+    reopened = EmbeddingCache(str(tmp_path), max_entries=2)
+    assert reopened.get_many("m", ["c"])[0].tolist() == [0.5, 0.5]
+
+
+def test_get_embeddings_only_sends_misses(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path))
+    monkeypatch.setattr(emb, "get_embedding_cache", lambda: cache)
+    sent = []
+
+    def fake_create(model=None, input=None):
+        sent.append(list(input))
+        return {"data": [{"embedding": [float(len(t)), 1.0]} for t in input]}
+
+    monkeypatch.setattr(emb.openai.Embedding, "create", fake_create)
+
+    first = emb.get_embeddings(["hi", "there", "hi"])
+    assert sent == [["hi", "there"]]
+    assert first == [[2.0, 1.0], [5.0, 1.0], [2.0, 1.0]]
+
+    second = emb.get_embeddings(["there", "new"])
+    assert sent[-1] == ["new"]
+    assert second == [[5.0, 1.0], [3.0, 1.0]]
+    assert cache.stats()["hits"] >= 1
+
+
+def test_instances_sharing_a_directory_never_share_slots(tmp_path):
+    a = EmbeddingCache(str(tmp_path), memory_items=0)
+    b = EmbeddingCache(str(tmp_path), memory_items=0)
+    vectors = {t: [float(i), 1.0] for i, t in enumerate("wxyzuv")}
+    for cache, text in zip([a, b, a, b, a, b], "wxyzuv"):
+        cache.put_many("m", [text], [vectors[text]])
+    for cache in (a, b):
+        found = cache.get_many("m", list("wxyzuv"))
+        assert [found[i].tolist() for i in range(6)] == [vectors[t] for t in "wxyzuv"]
+    a.close()
+    b.close()
+
+
+def test_memory_hits_refresh_last_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2, memory_items=10)
+    cache.put_many("m", ["old"], [[1.0, 0.0]])
+    cache.put_many("m", ["new"], [[0.0, 1.0]])
+    assert 0 in cache.get_many("m", ["old"])  # served from memory
+    cache.put_many("m", ["third"], [[0.5, 0.5]])
+    cache._memory.clear()
+    assert sorted(cache.get_many("m", ["old", "new", "third"])) == [0, 2]
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+import src.context_packer as cp
+import src.embedding_scheduler as es
+from src import tracing
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # ~4 characters per token whether or not tiktoken is installed
+    monkeypatch.setattr(cp, "_encoding", lambda: None)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+class _RateLimited(Exception):
+    http_status = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+
+
+def test_token_bucket_and_limiter_pace_requests():
+    clock = _Clock()
+    limiter = es.RateLimiter(rpm=60, tpm=600, clock=clock, sleep=clock.sleep)
+    # buckets hold 10 seconds of allowance: 10 requests / 100 tokens
+    for _ in range(10):
+        assert limiter.acquire(5) == 0.0
+    assert limiter.acquire(5) == pytest.approx(1.0)
+    assert limiter.acquire(100) == pytest.approx(4.5)  # the token bucket is the binding one now
+    limiter.pause(30)
+    assert limiter.acquire(1) == pytest.approx(30)
+
+
+def test_controller_is_aimd():
+    c = es.AdaptiveController(batch_tokens=1000, concurrency=2, max_batch_tokens=4000, min_batch_tokens=200,
+                              max_concurrency=4, target_latency=1.0)
+    c.on_success(0.1)
+    c.on_success(0.1)
+    assert c.batch_tokens == 1200 and c.concurrency == 3
+    c.on_success(5.0)
+    assert c.batch_tokens == 900
+    c.on_rate_limit()
+    assert c.batch_tokens == 450 and c.concurrency == 1
+    for _ in range(10):
+        c.on_rate_limit()
+    assert c.batch_tokens == 200 and c.concurrency == 1
+
+
+def _scheduler(clock, batch_tokens=100, max_input_tokens=50):
+    limiter = es.RateLimiter(rpm=0, tpm=0, clock=clock, sleep=clock.sleep)
+    controller = es.AdaptiveController(batch_tokens=batch_tokens, concurrency=2, max_batch_tokens=batch_tokens,
+                                       min_batch_tokens=max_input_tokens, target_latency=60)
+    return es.EmbeddingScheduler(limiter, controller, max_input_tokens=max_input_tokens, max_items=8)
+
+
+def test_scheduler_packs_by_tokens_and_averages_long_inputs():
+    requests = []
+
+    def request(model, inputs):
+        requests.append(list(inputs))
+        return [[float(len(t)), 1.0] for t in inputs], None
+
+    texts = ["a" * 80] * 4 + ["w " * 150]  # 20 tokens each, then a 75-token text
+    with tracing.trace() as t:
+        vectors = _scheduler(_Clock()).embed(texts, "m", request)
+
+    assert all(sum(cp.count_tokens(x) for x in r) <= 100 for r in requests)
+    assert sum(len(r) for r in requests) == 6  # the long text went out as two chunks
+    assert vectors[0] == [80.0, 1.0]
+    long_vec = np.asarray(vectors[4])
+    assert np.linalg.norm(long_vec) == pytest.approx(1.0)
+    assert t.counters["embedding_chunked_inputs"] == 1
+    assert t.counters["embedding_tokens"] == sum(cp.count_tokens(x) for r in requests for x in r)
+
+
+def test_scheduler_retries_429_after_retry_after():
+    clock = _Clock()
+    sched = _scheduler(clock)
+    calls = []
+
+    def request(model, inputs):
+        calls.append(len(inputs))
+        if len(calls) == 1:
+            raise _RateLimited(retry_after=2)
+        return [[1.0]] * len(inputs), 3
+
+    assert sched.embed(["x", "y"], "m", request) == [[1.0], [1.0]]
+    assert calls == [2, 2] and clock.slept == [2.0]
+    # halved on the 429, then one additive step each for the fast retry
+    assert sched.controller.batch_tokens == 75 and sched.controller.concurrency == 2
+
+    def broken(model, inputs):
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        sched.embed(["x"], "m", broken)
+
+
+def test_token_batches_cap_rows_and_tokens():
+    rows = ([f"id{i}" for i in range(6)], ["a" * 40] * 5 + ["b" * 400], [{}] * 6)
+    out = list(es.token_batches([rows], max_rows=4, max_tokens=lambda: 30))
+    assert [b[0] for b in out] == [["id0", "id1", "id2"], ["id3", "id4"], ["id5"]]
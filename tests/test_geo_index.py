@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+
+import src.geo_index as geo
+from src.data_version import StampedSnapshot, bump
+from src.geo_index import GeoIndex, haversine_km, parse_proximity, proximity_search
+
+
+def _random_index(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(40.0, 41.5, n)
+    lons = np.concatenate([rng.uniform(-74.5, -73.0, n - 50), rng.uniform(179.9, 180.0, 50)])
+    return GeoIndex([str(i) for i in range(n)], [f"Place {i}" for i in range(n)], lats, lons, cell_deg=0.05), lats, lons
+
+
+def test_radius_and_nearest_match_brute_force():
+    index, lats, lons = _random_index()
+    for lat, lon, km in [(40.75, -73.98, 3.0), (41.0, -73.5, 12.5), (40.5, 179.99, 20.0)]:
+        brute = haversine_km(lat, lon, lats, lons)
+        expected = {str(i) for i in np.flatnonzero(brute <= km)}
+        hits = index.radius(lat, lon, km)
+        assert {index.ids[p] for p, _ in hits} == expected
+        assert [d for _, d in hits] == sorted(d for _, d in hits)
+
+        nearest = index.nearest(lat, lon, 7)
+        assert [index.ids[p] for p, _ in nearest] == [str(i) for i in np.argsort(brute, kind="stable")[:7]]
+
+
+def test_antimeridian_neighbours_are_found():
+    index = GeoIndex(["a", "b", "c"], ["West", "East", "Far"], [0.0, 0.0, 0.0], [179.99, -179.99, 90.0])
+    assert [index.ids[p] for p, _ in index.radius(0.0, 179.99, 5.0)] == ["a", "b"]
+
+
+def test_parse_proximity():
+    assert parse_proximity("What's near Times Square?") == {"place": "Times Square", "radius_km": None}
+    assert parse_proximity("museums within 500 m of the Empire State Building") == {
+        "place": "Empire State Building", "radius_km": 0.5}
+    assert parse_proximity("anything within 2 miles from Central Park")["radius_km"] == 2 * 1.609344
+    assert parse_proximity("Tell me about Central Park") is None
+    assert parse_proximity("what is near the?") is None
+
+
+def test_proximity_search_from_locations_csv():
+    index = GeoIndex.from_csv("data/locations.csv")
+    facts = proximity_search("What's near Times Square?", k=2, index=index)
+    assert [f["name"] for f in facts] == ["Times Square", "Empire State Building", "Central Park"]
+    assert facts[0]["hops"] == 0 and facts[1]["near"] == "4"
+    assert 1.0 < facts[1]["distance_km"] < 1.3
+
+    within = proximity_search("within 2 km of times square", index=index)
+    assert [f["name"] for f in within] == ["Times Square", "Empire State Building"]
+    assert proximity_search("near Atlantis", index=index) == []
+
+
+def test_find_place_needs_exact_name_or_two_shared_tokens():
+    index = GeoIndex(["1", "2", "3"], ["Central Park", "Central Park Zoo", "Park Avenue"], [0.0, 0.1, 0.2], [0.0] * 3)
+    assert index.find_place("central park") == 0
+    assert index.find_place("the zoo in central park") == 1
+    assert index.find_place("park") is None
+    assert index.find_place("Grand Central") is None
+
+
+def test_geo_index_rebuilds_in_background_and_serves_previous(monkeypatch):
+    first = GeoIndex(["a"], ["A"], [0.0], [0.0])
+    second = GeoIndex(["b"], ["B"], [1.0], [1.0])
+    builds, release = [first, second], threading.Event()
+
+    def build(previous):
+        release.wait(5)
+        return builds.pop(0)
+
+    monkeypatch.setattr(geo, "GEO_INDEX_ENABLED", True)
+    monkeypatch.setattr(geo, "_snapshot", StampedSnapshot("locations", build, "Geo index"))
+    assert geo.get_geo_index() is None  # first build runs off the request path
+    release.set()
+    assert geo.get_geo_index(wait=True) is first
+
+    release.clear()
+    bump("locations")
+    assert geo.get_geo_index() is first  # old snapshot while the new one builds
+    release.set()
+    assert geo.get_geo_index(wait=True) is second and geo.get_geo_index() is second
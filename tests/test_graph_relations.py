@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+import src.graph_relations as gr
+from src.geo_index import GeoIndex, cell_deg_for_radius, haversine_km
+
+
+def _brute_near(index, radius_km, k):
+    proposed = set()
+    for i in range(len(index)):
+        d = haversine_km(index.lats[i], index.lons[i], index.lats, index.lons)
+        d[i] = np.inf
+        order = [j for j in np.argsort(d, kind="stable")[:k] if d[j] <= radius_km]
+        proposed.update((min(i, j), max(i, j)) for j in order)
+    edges = sorted(proposed)
+    dist = {e: haversine_km(index.lats[e[0]], index.lons[e[0]], index.lats[[e[1]]], index.lons[[e[1]]])[0]
+            for e in edges}
+    # keep an edge only if it is among the k shortest at both of its endpoints
+    best = {}
+    for pos, e in enumerate(edges):
+        for node in e:
+            best.setdefault(node, []).append((dist[e], pos))
+    top = {node: {pos for _, pos in sorted(v)[:k]} for node, v in best.items()}
+    return {e for pos, e in enumerate(edges) if pos in top[e[0]] and pos in top[e[1]]}
+
+
+def test_near_pairs_match_brute_force(monkeypatch):
+    rng = np.random.default_rng(0)
+    n = 400
+    lats = np.concatenate([40.7 + rng.normal(scale=0.05, size=n - 4), [0.0, 0.001, 10.0, 60.0]])
+    # points across the antimeridian
+    lons = np.concatenate([-74.0 + rng.normal(scale=0.05, size=n - 4), [179.999, -179.999, 0.0, 25.0]])
+    index = GeoIndex([str(i) for i in range(n)], [""] * n, lats, lons, cell_deg=0.02)
+
+    a, b, dist = gr.near_pairs(index, radius_km=3.0, max_per_node=4)
+    assert np.all(a < b) and np.all(dist <= 3.0)
+    assert set(zip(a.tolist(), b.tolist())) == _brute_near(index, 3.0, 4)
+    assert np.bincount(np.concatenate([a, b])).max() <= 4
+    # small distance tiles and a radius-sized grid give the same edges
+    monkeypatch.setattr(gr, "_NEAR_BLOCK", 7)
+    regrid = GeoIndex(index.ids, index.names, index.lats, index.lons, cell_deg=cell_deg_for_radius(3.0))
+    ra, rb, _ = gr.near_pairs(regrid, radius_km=3.0, max_per_node=4)
+    assert {tuple(sorted((regrid.ids[i], regrid.ids[j]))) for i, j in zip(ra.tolist(), rb.tolist())} == \
+        {tuple(sorted((index.ids[i], index.ids[j]))) for i, j in zip(a.tolist(), b.tolist())}
+    for i, j, d in zip(a[:20], b[:20], dist[:20]):
+        assert np.isclose(d, haversine_km(index.lats[i], index.lons[i], index.lats[[j]], index.lons[[j]])[0])
+    # the antimeridian pair is ~0.2 km apart
+    far = {index.ids[i] for i in (a.tolist() + b.tolist())}
+    assert {str(n - 4), str(n - 3)} <= far and str(n - 2) not in far
+
+
+def test_similar_pairs_blend_embeddings_and_tags(monkeypatch):
+    vectors = np.array([[1.0, 0.0], [0.98, 0.2], [0.0, 1.0], [0.1, 0.99], [-1.0, 0.0]])
+    tags = ["park, nature", "park", "museum art", "art", ""]
+    a, b, score, cos, jac = gr.similar_pairs(vectors, tags, max_per_node=1, min_score=0.7, tag_weight=0.5)
+    edges = dict(zip(zip(a.tolist(), b.tolist()), score.tolist()))
+    assert set(edges) == {(0, 1), (2, 3)}
+    assert np.allclose(jac, 0.5)
+    assert np.allclose(score, 0.5 * cos + 0.25)
+    # column tiles give the same neighbours as one full block
+    monkeypatch.setattr(gr, "_BLOCK_COLS", 2)
+    tiled = gr.similar_pairs(vectors, tags, max_per_node=1, min_score=0.7, tag_weight=0.5)
+    assert all(np.allclose(x, y) for x, y in zip(tiled, (a, b, score, cos, jac)))
+    assert gr.tag_overlap(gr._tag_bits(tags), np.array([0, 4]), np.array([1, 4])).tolist() == [0.5, 0.0]
+
+
+class _Client:
+    def __init__(self):
+        self.writes, self.runs = [], []
+
+    def run(self, query, params=None):
+        self.runs.append(query)
+        return []
+
+    def write_batch(self, query, rows, retries=None):
+        assert "UNWIND $rows" in query
+        self.writes.append((query, rows))
+        return len(rows)
+
+
+def test_derive_relationships_bulk_writes_and_drops_stale(tmp_path, monkeypatch):
+    csv_path = tmp_path / "locations.csv"
+    pd.DataFrame({
+        "id": ["a", "b", "c", "d"],
+        "name": ["A", "B", "C", "D"],
+        "lat": [40.0, 40.001, 40.002, 45.0],
+        "lon": [-74.0, -74.0, -74.0, -74.0],
+        "description": ["", "", "", ""],
+        "tags": ["park", "park", "museum", "park"],
+    }).to_csv(csv_path, index=False)
+    monkeypatch.setattr("src.embeddings.get_embeddings", lambda texts: [[1.0, 0.0]] * len(texts))
+    monkeypatch.setattr(gr, "NEAR_MAX_PER_NODE", 2)
+    client = _Client()
+
+    counts = gr.derive_relationships(str(csv_path), client, similar=True, batch_size=1)
+    near = [row for q, rows in client.writes if ":NEAR" in q for row in rows]
+    assert counts["NEAR"] == len(near) == 3  # a, b, c pairwise; d is 500 km away
+    assert {(r["a"], r["b"]) for r in near} == {("a", "b"), ("a", "c"), ("b", "c")}
+    assert all(0.1 < r["distance_km"] < 0.23 for r in near)
+    monkeypatch.setattr(gr, "NEAR_MAX_PER_NODE", 1)
+    index = gr.near_index(str(csv_path))
+    assert np.isclose(index.cell_deg, gr.NEAR_RADIUS_KM / 111.32)
+    a, b, _ = gr.near_pairs(index)
+    assert len(a) == 1 and np.bincount(np.concatenate([a, b])).max() == 1  # b cannot keep both
+    similar = [row for q, rows in client.writes if ":SIMILAR_TO" in q for row in rows]
+    assert counts["SIMILAR_TO"] == len(similar) and {"a", "b", "d"} >= {similar[0]["a"], similar[0]["b"]}
+    assert len({r["version"] for r in near + similar}) == 1
+    assert sum("r.version <> $version" in q for q in client.runs) == 2
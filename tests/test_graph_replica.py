@@ -0,0 +1,167 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import src.graph_replica as gr
+import src.hybrid_chat as hc
+from src.data_version import bump
+
+
+def _replica():
+    nodes = [
+        ("1", "Central Park", "Large public park in New York City", "park"),
+        ("2", "Statue of Liberty", "Iconic national monument in NYC", "monument"),
+        ("3", "Bryant Park", "Park behind the library", "park"),
+        ("4", "Times Square", "Busy plaza", "plaza"),
+        ("5", "Isolated", "", ""),
+    ]
+    edges = [("1", "3", "NEAR", 1.2), ("3", "4", "NEAR", 0.4), ("1", "4", "SIMILAR_TO", 0.1),
+             ("2", "9", "NEAR", 1.0)]  # 9 is unknown and skipped
+    return gr.GraphReplica(nodes, edges, source="test")
+
+
+def test_replica_is_compact():
+    replica = _replica()
+    assert replica.stats()["nodes"] == 5 and replica.n_edges == 3
+    assert replica.indptr.tolist() == [0, 2, 2, 4, 6, 6]
+    assert not hasattr(replica.records[0], "__dict__")
+    other = gr.GraphReplica([("x", "Central Park", "", "park")], [])
+    assert other.records[0].name is replica.records[0].name  # interned
+
+
+def test_search_ranks_name_matches_first():
+    replica = _replica()
+    hits = replica.search("Tell me about Central Park", limit=3)
+    assert [h["id"] for h in hits] == ["1", "3"]
+    assert hits[0]["score"] > hits[1]["score"] and set(hits[0]) == {"id", "name", "description", "score"}
+    assert replica.search("library", limit=3)[0]["name"] == "Bryant Park"
+    assert replica.search("nothing matches") == []
+
+
+def test_expand_matches_cypher_shape():
+    replica = _replica()
+    out = replica.expand(["1", "missing", "5"], depth=2, fanout=5)
+    assert set(out) == {"1", "5"}
+    assert out["1"][0] == {"id": "1", "name": "Central Park", "description": "Large public park in New York City", "hops": 0}
+    # closest first within a hop, whatever the relationship type
+    assert [(n["id"], n["hops"], n["rel"], n["via"]) for n in out["1"][1:]] == [
+        ("4", 1, "SIMILAR_TO", "1"), ("3", 1, "NEAR", "1")]
+    assert [n["id"] for n in replica.expand(["2"], depth=3, fanout=5)["2"]] == ["2"]
+    assert len(replica.expand(["3"], depth=2, fanout=1)["3"]) == 2
+    assert replica.expand(["3"], depth=0, fanout=5)["3"][1:] == []
+
+
+class _Session:
+    def __init__(self, results):
+        self.results = results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query):
+        return self.results["edges" if "-[r]->" in query else "nodes"]
+
+
+class _Driver:
+    def __init__(self, results):
+        self.results = results
+
+    def session(self):
+        return _Session(self.results)
+
+
+def test_from_neo4j_and_incremental_refresh(tmp_path, monkeypatch):
+    driver = _Driver({
+        "nodes": [{"id": "a", "name": "A", "description": "", "tags": None},
+                  {"id": "b", "name": "B", "description": "", "tags": "x"}],
+        "edges": [{"a": "a", "b": "b", "type": "NEAR", "weight": 0.5}],
+    })
+    monkeypatch.setattr(gr, "GRAPH_REPLICA", True)
+    monkeypatch.setattr(gr, "GRAPH_REPLICA_SOURCE", "neo4j")
+    monkeypatch.setattr(gr, "_snapshot", gr._new_snapshot())
+    monkeypatch.setattr(hc, "_get_neo4j_driver", lambda: driver)
+
+    first = gr.get_replica(wait=True)
+    assert first.source == "neo4j" and first.n_edges == 1 and first.get("a").tags == ""
+    assert gr.get_replica() is first
+
+    driver.results["nodes"][1] = {"id": "b", "name": "B2", "description": "", "tags": "x"}
+    bump("locations")
+    second = gr.get_replica(wait=True)
+    assert second is not first and second.get("b").name == "B2"
+    assert second.get("a") is first.get("a") and second.reused == 1
+
+
+def test_csv_replica_and_hybrid_chat_skip_neo4j(tmp_path, monkeypatch):
+    csv_path = tmp_path / "locations.csv"
+    pd.DataFrame({
+        "id": ["1", "2", "3"],
+        "name": ["Central Park", "Bryant Park", "Far Away"],
+        "lat": [40.7850, 40.7536, 10.0],
+        "lon": [-73.9682, -73.9832, 10.0],
+        "description": ["park", "park", ""],
+    }).to_csv(csv_path, index=False)
+    monkeypatch.setattr(gr, "GRAPH_REPLICA", True)
+    monkeypatch.setattr(gr, "GRAPH_REPLICA_SOURCE", "csv")
+    monkeypatch.setattr(gr, "LOCATIONS_CSV", str(csv_path))
+    monkeypatch.setattr(gr, "_snapshot", gr._new_snapshot())
+    monkeypatch.setattr("src.graph_relations.NEAR_RADIUS_KM", 5.0)
+    monkeypatch.setattr(hc, "_get_neo4j_driver", lambda: pytest.fail("Neo4j not expected"))
+    hc.neo4j_search.cache_clear()
+    assert gr.get_replica(wait=True) is not None
+
+    assert [h["id"] for h in hc.neo4j_search("Bryant Park", limit=2)] == ["2", "1"]
+    assert hc.neo4j_search_many(["central park", "the"], limit=1) == [[hc.neo4j_search("central park", limit=1)[0]], []]
+    expanded = hc.expand_neighborhoods(["1", "3"], depth=1, fanout=3)
+    assert [(n["id"], n["rel"]) for n in expanded["1"][1:]] == [("2", "NEAR")]
+    assert expanded["3"][1:] == []
+    hc.neo4j_search.cache_clear()
+
+
+def test_replica_failure_falls_back_to_neo4j(tmp_path, monkeypatch):
+    monkeypatch.setattr(gr, "GRAPH_REPLICA", True)
+    monkeypatch.setattr(gr, "GRAPH_REPLICA_SOURCE", "csv")
+    monkeypatch.setattr(gr, "LOCATIONS_CSV", str(tmp_path / "locations.csv"))
+    monkeypatch.setattr(gr, "GRAPH_REPLICA_RETRY_SECONDS", 60.0)
+    monkeypatch.setattr(gr, "_snapshot", gr._new_snapshot())
+    builds = []
+    real_build = gr._build_replica
+    monkeypatch.setattr(gr, "_build_replica", lambda prev: builds.append(1) or real_build(prev))
+
+    assert gr.get_replica(wait=True) is None and len(builds) == 1
+    monkeypatch.setattr(hc, "GRAPH_REPLICA", True)
+    assert hc.prewarm()["graph_replica"]
+    assert gr.get_replica(wait=True) is None and len(builds) == 1  # backing off, no rebuild per call
+
+    pd.DataFrame({"id": ["1"], "name": ["A"], "lat": [1.0], "lon": [2.0],
+                  "description": [""]}).to_csv(tmp_path / "locations.csv", index=False)
+    gr._snapshot.retry_seconds = 0.0  # the retry delay has passed
+    replica = gr.get_replica(wait=True)
+    assert replica is not None and len(replica) == 1 and len(builds) == 2
+    assert gr.get_replica() is replica and len(builds) == 2
+
+
+def test_replica_rebuilds_in_background_and_serves_previous(monkeypatch):
+    first, second = _replica(), _replica()
+    built, release = [first, second], threading.Event()
+
+    def build(previous):
+        release.wait(5)
+        return built.pop(0)
+
+    monkeypatch.setattr(gr, "GRAPH_REPLICA", True)
+    monkeypatch.setattr(gr, "_build_replica", build)
+    monkeypatch.setattr(gr, "_snapshot", gr._new_snapshot())
+    assert gr.get_replica() is None  # Neo4j serves until the first build is done
+    release.set()
+    assert gr.get_replica(wait=True) is first
+
+    release.clear()
+    bump("locations")
+    assert gr.get_replica() is first
+    release.set()
+    assert gr.get_replica(wait=True) is second
@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+
+import src.graph_viz as gv
+from src.data_version import bump
+
+
+class _StreamingClient:
+    def __init__(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+        self.queries = 0
+
+    def stream(self, query, params=None):
+        self.queries += 1
+        rows = self.nodes if "MATCH (l:Location)" in query else self.edges
+        for row in rows:
+            yield row
+
+    def close(self):
+        pass
+
+
+def _client():
+    nodes = [
+        {"id": "1", "name": "Central Park", "description": "Park", "lat": 40.78, "lon": -73.96},
+        {"id": "2", "name": "Statue of Liberty", "description": "", "lat": 40.69, "lon": -74.04},
+        {"id": "3", "name": "Times Square", "description": "", "lat": 40.76, "lon": -73.99},
+        {"id": "4", "name": "Somewhere", "description": "", "lat": None, "lon": None},
+    ]
+    edges = [
+        {"a": "1", "b": "3", "type": "NEAR"},
+        {"a": "3", "b": "4", "type": "NEAR"},
+        {"a": "1", "b": "99", "type": "NEAR"},  # outside the snapshot
+    ]
+    return _StreamingClient(nodes, edges)
+
+
+@pytest.fixture(autouse=True)
+def viz_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(gv, "GRAPH_VIZ_DIR", str(tmp_path / "graph_viz"))
+    monkeypatch.setattr(gv, "_snapshot", None)
+    monkeypatch.setattr(gv, "_snapshot_version", None)
+
+
+def test_build_snapshot_streams_and_lays_out_once():
+    snap = gv.build_snapshot(_client())
+    assert list(snap.ids) == ["1", "2", "3", "4"]
+    assert len(snap.src) == 2 and list(snap.rel) == ["NEAR", "NEAR"]
+    assert np.isfinite(snap.x).all() and np.isfinite(snap.y).all()
+    # geographic placement: Central Park is east and north of the Statue of Liberty
+    assert snap.x[0] > snap.x[1] and snap.y[0] < snap.y[1]
+
+
+def test_pages_and_neighbourhoods():
+    snap = gv.build_snapshot(_client())
+    assert snap.pages(page_size=3) == 2
+    # Times Square has the most links, so it leads the first page
+    assert list(snap.page(0, page_size=1)) == [2]
+    assert sorted(np.concatenate([snap.page(0, 3), snap.page(1, 3)]).tolist()) == [0, 1, 2, 3]
+
+    center = snap.find("central park")
+    assert center == 0 and snap.find("1") == 0 and snap.find("nowhere") is None
+    assert snap.neighborhood(center, depth=1).tolist() == [0, 2]
+    assert snap.neighborhood(center, depth=2).tolist() == [0, 2, 3]
+    assert snap.edges_within(np.array([0, 2])).tolist() == [0]
+
+
+def test_snapshot_is_cached_per_graph_version():
+    client = _client()
+    first = gv.get_snapshot(client)
+    assert gv.get_snapshot(client) is first and client.queries == 2
+
+    # a new process reuses the persisted snapshot without touching Neo4j
+    gv._snapshot = None
+    reloaded = gv.get_snapshot(client)
+    assert client.queries == 2 and list(reloaded.ids) == list(first.ids)
+    old_dir = gv._version_dir(gv.graph_version())
+
+    bump("locations")
+    gv.get_snapshot(client)
+    assert client.queries == 4
+    assert not os.path.exists(old_dir)
+
+
+def test_export_view_renders_once(monkeypatch):
+    rendered = []
+
+    def fake_render(snapshot, nodes, path, highlight=None, height="700px"):
+        rendered.append((nodes.tolist(), highlight))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("<html></html>")
+
+    monkeypatch.setattr(gv, "render_html", fake_render)
+    client = _client()
+    path = gv.export_view(center="Times Square", client=client)
+    assert gv.export_view(center="times square", client=client) == path
+    assert rendered == [([0, 2, 3], 2)]
+
+    gv.export_view(page=0, page_size=2, client=client)
+    assert rendered[-1] == ([0, 2], None)
+    with pytest.raises(KeyError):
+        gv.export_view(center="Atlantis", client=client)
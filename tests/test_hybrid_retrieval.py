@@ -0,0 +1,345 @@
+import time
+
+import pytest
+
+import src.hybrid_chat as hc
+from src.data_version import bump
+
+
+def test_retrieve_context_drops_slow_branch(monkeypatch):
+    docs = [{"id": "doc1", "score": 0.9, "metadata": {"text_snippet": "snippet"}}]
+
+    def slow_neo4j(query, limit=3):
+        time.sleep(0.5)
+        return [{"id": "1", "name": "Late", "description": "too slow"}]
+
+    monkeypatch.setattr(hc, "pinecone_search", lambda query, top_k=3: docs)
+    monkeypatch.setattr(hc, "neo4j_search", slow_neo4j)
+
+    start = time.monotonic()
+    ctx = hc.retrieve_context("q", pinecone_timeout=1.0, neo4j_timeout=0.05)
+    assert time.monotonic() - start < 0.4
+    assert ctx["docs"] == docs
+    assert ctx["graph"] == []
+    assert ctx["dropped"] == {"neo4j": "timeout"}
+
+
+def test_retrieve_context_records_errors(monkeypatch):
+    def broken(query, top_k=3):
+        raise RuntimeError("no index")
+
+    monkeypatch.setattr(hc, "pinecone_search", broken)
+    monkeypatch.setattr(hc, "neo4j_search", lambda query, limit=3: [{"id": "1", "name": "A", "description": ""}])
+
+    ctx = hc.retrieve_context("q")
+    assert ctx["docs"] == []
+    assert ctx["graph"][0]["id"] == "1"
+    assert "no index" in ctx["dropped"]["pinecone"]
+    assert "pinecone" in hc.build_prompt("q", ctx["docs"], ctx["graph"], ctx["dropped"])
+
+
+class _FakeRecord:
+    def __init__(self, data):
+        self._data = data
+
+    def data(self):
+        return self._data
+
+
+class _FakeSession:
+    def __init__(self, calls, rows):
+        self.calls = calls
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, params=None):
+        self.calls.append((getattr(query, "text", query), params))
+        return [_FakeRecord(r) for r in self.rows]
+
+
+class _FakeDriver:
+    def __init__(self, rows):
+        self.calls = []
+        self.rows = rows
+
+    def session(self):
+        return _FakeSession(self.calls, self.rows)
+
+
+def test_neo4j_search_uses_fulltext_tokens(monkeypatch):
+    driver = _FakeDriver([{"id": "1", "name": "Central Park", "description": "park", "score": 2.5}])
+    monkeypatch.setattr(hc, "_get_neo4j_driver", lambda: driver)
+    hc.neo4j_search.cache_clear()
+
+    hits = hc.neo4j_search("Tell me about Central Park", limit=2)
+    assert hits[0]["name"] == "Central Park"
+    cypher, params = driver.calls[0]
+    assert "db.index.fulltext.queryNodes" in cypher
+    assert params["tokens"] == ["central", "park"]
+    assert params["limit"] == 2
+    assert hc.neo4j_search("what is the") == []
+    hc.neo4j_search.cache_clear()
+
+
+def test_stream_answer_yields_tokens_and_timings(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    retrievals = []
+    docs = [{"id": "doc1", "score": 0.9, "metadata": {"text_snippet": "A park"}}]
+
+    def fake_retrieve(query, top_k=3, limit=3, lexical=None):
+        retrievals.append((top_k, limit))
+        return {"docs": docs[:top_k], "graph": [], "dropped": {}}
+
+    monkeypatch.setattr(hc, "retrieve_context", fake_retrieve)
+    calls = {}
+
+    def fake_create(**kwargs):
+        calls.update(kwargs)
+        return iter([
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            {"choices": [{"delta": {"content": "Central "}}]},
+            {"choices": [{"delta": {"content": "Park."}}]},
+            {"choices": [{"delta": {}}]},
+        ])
+
+    monkeypatch.setattr(hc.openai.ChatCompletion, "create", fake_create)
+
+    stream = hc.stream_answer("Tell me about Central Park")
+    assert list(stream) == ["Central ", "Park."]
+    assert calls["stream"] is True
+    assert stream.text == "Central Park."
+    assert 0 <= stream.ttft <= stream.total_time
+
+    result = hc.answer_query("Tell me about Central Park", top_k=5, limit=2)
+    assert retrievals[-1] == (5, 2)
+    assert result.answer == "Central Park." and not result.cached
+    assert result.docs == docs and result.scores == {"doc1": 0.9}
+    assert "build_prompt" in result.timings and result.counters["prompt_tokens"] > 0
+    assert result.as_dict()["answer"] == "Central Park."
+
+
+def test_answer_queries_batches_work_and_keeps_order(monkeypatch):
+    from openai.error import RateLimitError
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(hc, "BATCH_RETRY_BACKOFF", 0.01)
+    embed_calls = []
+
+    def fake_embeddings(texts):
+        embed_calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    class _Index:
+        def query(self, vector=None, top_k=3, include_metadata=True):
+            return {"matches": [{"id": f"doc{int(vector[0])}", "score": 1.0, "metadata": {"text_snippet": "s"}}]}
+
+    driver = _FakeDriver([
+        {"i": 0, "id": "1", "name": "Central Park", "description": "park", "score": 2.0},
+        {"i": 1, "id": "2", "name": "Louvre", "description": "museum", "score": 1.0},
+    ])
+    monkeypatch.setattr(hc, "get_embeddings", fake_embeddings)
+    monkeypatch.setattr(hc, "_get_vector_store", lambda: _Index())
+    monkeypatch.setattr(hc, "_get_neo4j_driver", lambda: driver)
+
+    attempts = {"n": 0}
+
+    def fake_create(messages=None, **kwargs):
+        prompt = messages[-1]["content"]
+        if "Louvre" in prompt and attempts["n"] == 0:
+            attempts["n"] += 1
+            raise RateLimitError("slow down", headers={"retry-after": "0.01"})
+        if "broken" in prompt:
+            raise RuntimeError("model exploded")
+        return {"choices": [{"message": {"content": prompt.split("Question: ")[1].strip()}}]}
+
+    monkeypatch.setattr(hc.openai.ChatCompletion, "create", fake_create)
+
+    queries = ["Central Park", "Louvre museum", "broken question", "Central Park"]
+    results = hc.answer_queries(queries, concurrency=2)
+
+    assert [r.query for r in results] == queries
+    assert embed_calls == [["Central Park", "Louvre museum", "broken question"]]
+    assert len(driver.calls) == 1 and "UNWIND $queries" in driver.calls[0][0]
+    assert results[0].answer == "Central Park" and results[0].graph[0]["name"] == "Central Park"
+    assert results[1].answer == "Louvre museum" and attempts["n"] == 1
+    assert results[1].docs[0]["id"] == "doc13"
+    assert results[2].answer is None and "model exploded" in results[2].error
+    assert results[3].as_dict() == results[0].as_dict()
+
+
+def test_retrieve_context_expands_linked_ids(monkeypatch):
+    docs = [
+        {"id": "doc1", "score": 0.9, "metadata": {"text_snippet": "a", "neo4j_id": "1"}},
+        {"id": "doc2", "score": 0.8, "metadata": {"text_snippet": "b", "neo4j_id": "2"}},
+        {"id": "doc3", "score": 0.7, "metadata": {"text_snippet": "c", "neo4j_id": "1"}},
+    ]
+    driver = _FakeDriver([
+        {"id": "1", "name": "Central Park", "description": "park",
+         "neighbors": [{"id": "3", "name": "Met", "description": "museum", "hops": 1, "rel": "NEAR"},
+                       {"id": "2", "name": "Zoo", "description": "zoo", "hops": 1, "rel": "NEAR"}]},
+        {"id": "2", "name": "Zoo", "description": "zoo", "neighbors": []},
+    ])
+    monkeypatch.setattr(hc, "pinecone_search", lambda query, top_k=3: docs)
+    # the free-text search starts speculatively, but linked ids take precedence
+    monkeypatch.setattr(hc, "neo4j_search", lambda query, limit=3: [{"id": "9", "name": "Text hit", "description": ""}])
+    monkeypatch.setattr(hc, "_get_neo4j_driver", lambda: driver)
+    hc.expand_graph.cache_clear()
+
+    ctx = hc.retrieve_context("Tell me about Central Park")
+    hc.expand_graph.cache_clear()
+
+    assert ctx["dropped"] == {}
+    assert [g["id"] for g in ctx["graph"]] == ["1", "2", "3"]
+    assert ctx["graph"][1]["hops"] == 0 and ctx["graph"][2]["via"] == "1"
+    cypher, params = driver.calls[0]
+    assert "UNWIND $ids" in cypher and "*1..1" in cypher
+    assert params == {"ids": ["1", "2"], "fanout": hc.GRAPH_EXPAND_FANOUT}
+    prompt = hc.build_prompt("q", ctx["docs"], ctx["graph"])
+    assert "[graph:3] Met - museum (linked to [graph:1] by NEAR)" in prompt
+
+
+def test_retrieve_context_falls_back_to_text_search_without_links(monkeypatch):
+    monkeypatch.setattr(hc, "pinecone_search", lambda query, top_k=3: [{"id": "doc1", "metadata": {}}])
+    monkeypatch.setattr(hc, "neo4j_search", lambda query, limit=3: [{"id": "9", "name": "B", "description": ""}])
+    monkeypatch.setattr(hc, "expand_graph", lambda ids: pytest.fail("nothing to expand"))
+
+    assert hc.retrieve_context("q")["graph"][0]["id"] == "9"
+
+
+def test_retrieve_context_graph_runs_alongside_docs(monkeypatch):
+    linked = [{"id": "doc1", "metadata": {"neo4j_id": "1"}}]
+
+    def slow_docs(query, top_k=3):
+        time.sleep(0.2)
+        return linked
+
+    def slow_search(query, limit=3):
+        time.sleep(0.15)
+        return [{"id": "9", "name": "Text hit", "description": ""}]
+
+    monkeypatch.setattr(hc, "pinecone_search", slow_docs)
+    monkeypatch.setattr(hc, "neo4j_search", slow_search)
+    monkeypatch.setattr(hc, "expand_graph", lambda ids: time.sleep(1.0))
+
+    # docs (0.2 s) and graph (0.3 s budget) overlap: total is the larger budget, not the sum
+    start = time.monotonic()
+    ctx = hc.retrieve_context("q", pinecone_timeout=1.0, neo4j_timeout=0.3)
+    assert time.monotonic() - start < 0.45
+    assert ctx["docs"] == linked and ctx["graph"][0]["id"] == "9" and ctx["dropped"] == {}
+
+    def broken_expand(ids):
+        raise RuntimeError("expand failed")
+
+    monkeypatch.setattr(hc, "expand_graph", broken_expand)
+    monkeypatch.setattr(hc, "pinecone_search", lambda query, top_k=3: linked)
+    assert hc.retrieve_context("q")["graph"][0]["id"] == "9"
+
+
+def test_retrieve_context_adds_nearby_locations(monkeypatch):
+    from src.geo_index import GeoIndex
+
+    index = GeoIndex.from_csv("data/locations.csv")
+    monkeypatch.setattr("src.geo_index.get_geo_index", lambda: index)
+    monkeypatch.setattr(hc, "pinecone_search", lambda query, top_k=3: [])
+    monkeypatch.setattr(hc, "neo4j_search", lambda query, limit=3: [{"id": "4", "name": "Times Square", "description": ""}])
+
+    ctx = hc.retrieve_context("What's near Times Square?")
+    ids = [g["id"] for g in ctx["graph"]]
+    assert ids[:2] == ["4", "3"] and ids.count("4") == 1
+    assert "km from [graph:4])" in hc.build_prompt("q", [], ctx["graph"])
+
+
+def _batch_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(hc, "get_embeddings", lambda texts: [[float(i)] for i, _ in enumerate(texts)])
+    monkeypatch.setattr(hc, "lexical_search", lambda q, k: ([], False))
+    monkeypatch.setattr(hc, "neo4j_search_many", lambda qs, limit=3: [[] for _ in qs])
+    monkeypatch.setattr(hc.openai.ChatCompletion, "create",
+                        lambda messages=None, **kw: {"choices": [{"message": {"content": "ok"}}]})
+
+
+def test_answer_queries_deadline_counts_from_lookup_start(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    _batch_env(monkeypatch)
+
+    class _SlowIndex:
+        def query(self, vector=None, top_k=3, include_metadata=True):
+            time.sleep(0.05)
+            return {"matches": [{"id": f"doc{int(vector[0])}", "score": 1.0, "metadata": {}}]}
+
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(hc, "_retrieval_executor", pool)
+    monkeypatch.setattr(hc, "RETRIEVAL_WORKERS", 2)
+    monkeypatch.setattr(hc, "PINECONE_TIMEOUT", 0.2)
+    monkeypatch.setattr(hc, "_get_vector_store", lambda: _SlowIndex())
+
+    # 20 lookups of 50 ms on 2 workers take ~0.5 s, well past one shared 0.2 s deadline
+    results = hc.answer_queries([f"question {i}" for i in range(20)], concurrency=4)
+    assert all(r.docs and "pinecone" not in r.dropped for r in results)
+    pool.shutdown()
+
+
+def test_answer_queries_survives_vector_store_failure(monkeypatch):
+    _batch_env(monkeypatch)
+
+    def broken():
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(hc, "_get_vector_store", broken)
+    results = hc.answer_queries(["a question", "another question"])
+    assert all("index unavailable" in r.dropped["pinecone"] and r.answer == "ok" for r in results)
+
+
+def test_vector_store_reopened_after_docs_reload(monkeypatch):
+    opened = []
+    monkeypatch.setattr(hc, "get_vector_store", lambda: opened.append(object()) or opened[-1])
+    monkeypatch.setattr(hc, "_vector_store", None)
+    monkeypatch.setattr(hc, "_vector_store_stamp", None)
+
+    first = hc._get_vector_store()
+    assert hc._get_vector_store() is first and len(opened) == 1
+    bump("locations")
+    assert hc._get_vector_store() is first
+    bump("docs")
+    assert hc._get_vector_store() is not first and len(opened) == 2
+
+
+def test_answer_queries_graph_failures_only_drop_affected_questions(monkeypatch):
+    _batch_env(monkeypatch)
+    linked_doc = {"id": "doc0", "score": 1.0, "metadata": {"neo4j_id": "1"}}
+    plain_doc = {"id": "doc1", "score": 1.0, "metadata": {}}
+
+    class _Index:
+        def query(self, vector=None, top_k=3, include_metadata=True):
+            return {"matches": [linked_doc if vector[0] == 0 else plain_doc]}
+
+    def slow_search(qs, limit=3):
+        time.sleep(1.0)
+        return [[] for _ in qs]
+
+    monkeypatch.setattr(hc, "_get_vector_store", lambda: _Index())
+    monkeypatch.setattr(hc, "expand_neighborhoods",
+                        lambda ids: {"1": [{"id": "1", "name": "Central Park", "description": "park", "hops": 0}]})
+    monkeypatch.setattr(hc, "neo4j_search_many", slow_search)
+    monkeypatch.setattr(hc, "NEO4J_TIMEOUT", 0.1)
+
+    start = time.monotonic()
+    linked, unlinked = hc.answer_queries(["linked question", "unlinked question"])
+    assert time.monotonic() - start < 0.8
+    assert linked.graph and linked.graph[0]["name"] == "Central Park" and "neo4j" not in linked.dropped
+    assert unlinked.dropped == {"neo4j": "timeout"} and unlinked.answer == "ok"
+
+    def broken_expand(ids):
+        raise RuntimeError("graph down")
+
+    monkeypatch.setattr(hc, "expand_neighborhoods", broken_expand)
+    monkeypatch.setattr(hc, "neo4j_search_many", lambda qs, limit=3: [[{"id": "2", "name": "Louvre"}] for _ in qs])
+    linked, unlinked = hc.answer_queries(["linked question", "unlinked question"])
+    assert linked.dropped == {"neo4j": "error: graph down"}
+    assert unlinked.graph[0]["name"] == "Louvre" and not unlinked.dropped
@@ -1,3 +1,60 @@
+import pandas as pd
+
+import src.neo4j_loader as loader
+
+
 # Simple smoke test for Neo4j loader (requires running Neo4j and loaded data)
 def test_placeholder():
     assert True
+
+
+def test_prepare_location_rows_coerces_columns():
+    df = pd.DataFrame({
+        "id": ["1", "2"],
+        "name": ["Central  Park", None],
+        "lat": ["40.7", "bad"],
+        "lon": [-73.9, None],
+        "tags": ["Park", None],
+    })
+    rows = loader.prepare_location_rows(df)
+    assert rows[0] == {
+        "id": "1", "name": "Central  Park", "lat": 40.7, "lon": -73.9,
+        "description": "", "tags": "Park", "search_text": "central park park", "has_point": True,
+    }
+    assert rows[1]["lat"] == 0.0 and rows[1]["lon"] == 0.0 and rows[1]["name"] == ""
+    assert rows[1]["has_point"] is False
+
+
+class _FakeClient:
+    def __init__(self):
+        self.batches = []
+
+    def run(self, query, params=None):
+        return []
+
+    def write_batch(self, query, rows, retries=None):
+        assert "UNWIND $rows" in query
+        self.batches.append(rows)
+        return len(rows)
+
+    def close(self):
+        pass
+
+
+def test_load_locations_writes_unwind_batches(tmp_path, monkeypatch):
+    csv_path = tmp_path / "locations.csv"
+    pd.DataFrame({
+        "id": [str(i) for i in range(5)],
+        "name": [f"Place {i}" for i in range(5)],
+        "lat": [1.0] * 5,
+        "lon": [2.0] * 5,
+    }).to_csv(csv_path, index=False)
+    client = _FakeClient()
+    monkeypatch.setattr(loader, "Neo4jClient", lambda: client)
+
+    assert loader.load_locations(str(csv_path), batch_size=2, relations=False) == 5
+    assert [len(b) for b in client.batches] == [2, 2, 1]
+
+    client.batches.clear()
+    assert loader.load_locations(str(csv_path), batch_size=2, workers=3, relations=False) == 5
+    assert sorted(r["id"] for b in client.batches for r in b) == ["0", "1", "2", "3", "4"]
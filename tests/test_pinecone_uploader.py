@@ -44,6 +44,7 @@ def test_upload_docs_dry_run(tmp_path, monkeypatch):
     fake_pc = FakePinecone()
 
     monkeypatch.setattr('src.pinecone_uploader._init_pinecone_if_needed', lambda: fake_pc)
+    monkeypatch.setenv('PINECONE_UPLOAD_REPORT', str(tmp_path / 'report.json'))
 
     # call upload_docs in dry-run and real mode to verify behavior
     # dry-run should not call upsert
@@ -51,3 +52,138 @@ def test_upload_docs_dry_run(tmp_path, monkeypatch):
 
     # now run without dry-run to exercise upsert (monkeypatched Index.upsert asserts)
     mod.upload_docs(str(csv_path), dry_run=False)
+
+
+def test_upload_pipeline_retries_and_reports_throughput(tmp_path, monkeypatch):
+    df = pd.DataFrame({
+        'id': [f'd{i}' for i in range(7)],
+        'text': [f'text {i}' for i in range(7)],
+        'metadata': [json.dumps({'source': 's'})] * 7,
+    })
+    csv_path = tmp_path / 'docs.csv'
+    df.to_csv(csv_path, index=False)
+    report_path = tmp_path / 'report.json'
+
+    mod = importlib.import_module('src.pinecone_uploader')
+    monkeypatch.setattr(mod, 'BATCH_SIZE', 3)
+    monkeypatch.setattr(mod, 'RETRY_BACKOFF', 0.01)
+    monkeypatch.setattr(mod, 'get_embeddings', lambda texts: [[0.1, 0.2]] * len(texts))
+    monkeypatch.setenv('PINECONE_UPLOAD_REPORT', str(report_path))
+
+    class FlakyStore:
+        def __init__(self):
+            self.upserted = []
+            self.failed_once = False
+
+        def upsert(self, vectors=None):
+            if not self.failed_once:
+                self.failed_once = True
+                raise RuntimeError('429 rate limited')
+            self.upserted.extend(v[0] for v in vectors)
+
+        def describe_index_stats(self):
+            return {'namespaces': {'': {'vector_count': len(self.upserted)}}}
+
+    store = FlakyStore()
+    monkeypatch.setattr(mod, 'open_vector_store', lambda dim: store)
+
+    mod.upload_docs(str(csv_path), embed_workers=2, upsert_workers=2)
+
+    assert sorted(store.upserted) == sorted(df['id'])
+    report = json.loads(report_path.read_text())
+    assert [b['batch_no'] for b in report['batches']] == [1, 2, 3]
+    assert all(b['success'] for b in report['batches'])
+    assert report['throughput']['upsert']['retries'] == 1
+    assert report['throughput']['embed']['items'] == 7
+
+
+def test_upload_is_incremental_and_deletes_removed_ids(tmp_path, monkeypatch):
+    mod = importlib.import_module('src.pinecone_uploader')
+    monkeypatch.setattr(mod, 'BATCH_SIZE', 2)
+    monkeypatch.setenv('PINECONE_UPLOAD_REPORT', str(tmp_path / 'report.json'))
+    embedded = []
+
+    def fake_embeddings(texts):
+        embedded.extend(texts)
+        return [[0.1, 0.2]] * len(texts)
+
+    monkeypatch.setattr(mod, 'get_embeddings', fake_embeddings)
+
+    class Store:
+        def __init__(self):
+            self.vectors = {}
+
+        def upsert(self, vectors=None):
+            self.vectors.update({v[0]: v for v in vectors})
+
+        def delete(self, ids):
+            for i in ids:
+                self.vectors.pop(i, None)
+
+        def describe_index_stats(self):
+            return {'namespaces': {'': {'vector_count': len(self.vectors)}}}
+
+    store = Store()
+    monkeypatch.setattr(mod, 'open_vector_store', lambda dim: store)
+
+    csv_path = tmp_path / 'docs.csv'
+    meta = json.dumps({'source': 's'})
+    pd.DataFrame({'id': ['a', 'b', 'c'], 'text': ['one', 'two', 'three'], 'metadata': [meta] * 3}).to_csv(csv_path, index=False)
+    mod.upload_docs(str(csv_path))
+    assert sorted(store.vectors) == ['a', 'b', 'c']
+
+    # unchanged input: nothing is embedded again
+    embedded.clear()
+    mod.upload_docs(str(csv_path))
+    assert embedded == []
+
+    # 'b' changes text, 'c' is removed, 'd' is new
+    pd.DataFrame({'id': ['a', 'b', 'd'], 'text': ['one', 'two!', 'four'], 'metadata': [meta] * 3}).to_csv(csv_path, index=False)
+    mod.upload_docs(str(csv_path))
+    assert sorted(embedded) == ['four', 'two!']
+    assert sorted(store.vectors) == ['a', 'b', 'd']
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert report['deleted'] == ['c']
+    assert report['skipped_unchanged'] == 1
+
+
+def test_embed_requests_are_not_capped_at_upsert_batch_size(tmp_path, monkeypatch):
+    mod = importlib.import_module('src.pinecone_uploader')
+    monkeypatch.setattr(mod, 'BATCH_SIZE', 2)
+    monkeypatch.setattr(mod, 'EMBED_WORKERS', 0)
+    monkeypatch.setenv('PINECONE_UPLOAD_REPORT', str(tmp_path / 'report.json'))
+    requests = []
+    monkeypatch.setattr(mod, 'get_embeddings', lambda texts: requests.append(len(texts)) or [[0.1, 0.2]] * len(texts))
+    workers = []
+    real_pipeline = mod._UploadPipeline
+
+    def pipeline(*args, **kwargs):
+        workers.append(kwargs['embed_workers'])
+        return real_pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(mod, '_UploadPipeline', pipeline)
+
+    class Store:
+        def __init__(self):
+            self.upserts = []
+
+        def upsert(self, vectors=None):
+            self.upserts.append([v[0] for v in vectors])
+
+        def describe_index_stats(self):
+            return {}
+
+    store = Store()
+    monkeypatch.setattr(mod, 'open_vector_store', lambda dim: store)
+    csv_path = tmp_path / 'docs.csv'
+    pd.DataFrame({'id': [f'd{i}' for i in range(7)], 'text': ['short'] * 7,
+                  'metadata': [json.dumps({'source': 's'})] * 7}).to_csv(csv_path, index=False)
+    mod.upload_docs(str(csv_path))
+
+    # one embedding request for the short docs, re-split into BATCH_SIZE upserts
+    assert requests == [7]
+    assert sorted(len(u) for u in store.upserts) == [1, 2, 2, 2]
+    assert sorted(i for u in store.upserts for i in u) == [f'd{i}' for i in range(7)]
+    assert workers == [mod.get_scheduler().controller.max_concurrency]
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert [b['batch_no'] for b in report['batches']] == [1, 2, 3, 4]
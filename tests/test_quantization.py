@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import src.quantization as qz
+from src.vector_store import LocalVectorStore, PineconeVectorStore
+
+
+def _unit(rng, n, dim):
+    m = rng.normal(size=(n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def test_quantize_roundtrip_and_size():
+    rng = np.random.default_rng(0)
+    m = _unit(rng, 50, 64)
+    codes, scales = qz.quantize(m, "int8")
+    assert codes.dtype == np.int8 and codes.nbytes == m.nbytes // 4
+    assert np.abs(qz.dequantize(codes, scales) - m).max() < 0.01
+    half, none = qz.quantize(m, "float16")
+    assert none is None and np.abs(half.astype(np.float32) - m).max() < 1e-3
+    with pytest.raises(ValueError):
+        qz.quantize(m, "int4")
+
+
+def test_recall_report_rescoring_recovers_exact_ranking():
+    rng = np.random.default_rng(1)
+    m = _unit(rng, 2000, 32)
+    queries = m[:50] + 0.1 * rng.normal(size=(50, 32)).astype(np.float32)
+    rows = {(r["mode"], r["rescore_factor"]): r for r in qz.recall_report(m, queries, k=10, rescore_factors=(1, 4))}
+    assert rows[("none", 1)]["recall"] == 1.0
+    assert rows[("float16", 1)]["recall"] > 0.95
+    assert rows[("int8", 4)]["recall"] >= rows[("int8", 1)]["recall"]
+    assert rows[("int8", 4)]["recall"] > 0.98
+    assert rows[("int8", 1)]["memory_mb"] < rows[("none", 1)]["memory_mb"] / 3
+
+
+def test_local_store_quantized_search_matches_exact(tmp_path):
+    rng = np.random.default_rng(2)
+    vecs = _unit(rng, 500, 16)
+    exact = LocalVectorStore(str(tmp_path / "exact"))
+    quant = LocalVectorStore(str(tmp_path / "int8"), quantization="int8", rescore_factor=4)
+    for store in (exact, quant):
+        store.upsert(vectors=[(f"v{i}", v) for i, v in enumerate(vecs)])
+    quant.delete(["v3"])
+    exact.delete(["v3"])
+
+    for q in vecs[:20]:
+        a = exact.query(vector=q.tolist(), top_k=5)["matches"]
+        b = quant.query(vector=q.tolist(), top_k=5)["matches"]
+        assert [m["id"] for m in a] == [m["id"] for m in b]
+        # reported scores are the full-precision ones
+        assert np.allclose([m["score"] for m in a], [m["score"] for m in b], atol=1e-6)
+    stats = quant.describe_index_stats()
+    assert stats["quantization"] == "int8" and stats["scan_bytes"] < exact.describe_index_stats()["scan_bytes"]
+    quant.close()
+
+    # the quantized copy is rebuilt from the float32 file on reopen
+    reopened = LocalVectorStore(str(tmp_path / "int8"), quantization="float16")
+    assert reopened.query(vector=vecs[7].tolist(), top_k=1)["matches"][0]["id"] == "v7"
+    assert "v3" not in [m["id"] for m in reopened.query(vector=vecs[3].tolist(), top_k=3)["matches"]]
+
+
+def test_pinecone_adapter_sends_lists():
+    sent = {}
+
+    class Index:
+        def upsert(self, vectors):
+            sent["vectors"] = vectors
+
+    PineconeVectorStore(Index()).upsert([("a", np.array([0.5, 0.25], dtype=np.float32), {"k": 1})])
+    assert sent["vectors"] == [("a", [0.5, 0.25], {"k": 1})]
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.server import HybridService, Overloaded, make_app, query_key
+
+
+def _service(answer_fn, **kwargs):
+    return HybridService(answer_fn=answer_fn, prewarm_fn=lambda: {"vector_store": None, "neo4j": None}, **kwargs)
+
+
+def test_identical_questions_share_one_run():
+    release = threading.Event()
+    calls = []
+
+    def slow_answer(query):
+        calls.append(query)
+        release.wait(2)
+        return {"answer": f"answer to {query}"}
+
+    service = _service(slow_answer, workers=2, max_queue=0)
+
+    async def scenario():
+        tasks = [asyncio.create_task(service.answer(q))
+                 for q in ["Tell me about Central Park", "tell me about central park?", "  TELL me about Central   Park"]]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(scenario())
+    service.close()
+    assert len(calls) == 1
+    assert [r["coalesced"] for r in results] == [False, True, True]
+    assert all(r["answer"] == "answer to Tell me about Central Park" for r in results)
+    assert service.stats()["coalesced"] == 2 and service.admitted == 0
+    assert query_key("Central Park!") == query_key("central park")
+
+
+def test_distinct_questions_beyond_capacity_are_shed():
+    release = threading.Event()
+    service = _service(lambda q: release.wait(2) and {"answer": q}, workers=1, max_queue=1)
+
+    async def scenario():
+        first = asyncio.create_task(service.answer("one"))
+        second = asyncio.create_task(service.answer("two"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Overloaded):
+            await service.answer("three")
+        # joining an admitted question is still allowed
+        joined = asyncio.create_task(service.answer("two"))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(first, second, joined)
+
+    results = asyncio.run(scenario())
+    service.close()
+    assert [r["answer"] for r in results] == ["one", "two", "two"]
+    assert service.shed == 1
+
+
+def test_http_endpoints():
+    from aiohttp.test_utils import TestClient, TestServer
+
+    def answer(query):
+        if "fail" in query:
+            raise RuntimeError("backend down")
+        return {"answer": "ok", "docs": [], "graph": []}
+
+    async def scenario():
+        async with TestClient(TestServer(make_app(_service(answer)))) as client:
+            ok = await client.post("/answer", json={"query": "Central Park"})
+            assert ok.status == 200 and (await ok.json())["answer"] == "ok"
+            assert (await client.post("/answer", json={"query": "?!"})).status == 400
+            assert (await client.post("/answer", data="not json")).status == 400
+            failed = await client.post("/answer", json={"query": "please fail"})
+            assert failed.status == 500 and "backend down" in (await failed.json())["error"]
+            ready = await client.get("/readyz")
+            assert ready.status == 200 and (await ready.json())["ready"] is True
+            assert (await client.get("/healthz")).status == 200
+            assert "hybrid_server" in await (await client.get("/metrics")).text()
+
+    asyncio.run(scenario())
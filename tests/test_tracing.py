@@ -0,0 +1,47 @@
+import src.tracing as tracing
+
+
+def test_spans_feed_histograms_and_request_trace(monkeypatch):
+    metrics = tracing.Metrics()
+    monkeypatch.setattr(tracing, "metrics", metrics)
+
+    with tracing.trace() as t:
+        with tracing.span("embedding"):
+            pass
+        tracing.record("llm", 0.25)
+        tracing.record("llm", 0.75)
+        tracing.incr("embedding_cache_hits", 2)
+
+    assert list(t.breakdown()) == ["embedding", "llm"]
+    assert t.breakdown()["llm"] == 1.0
+    assert t.counters == {"embedding_cache_hits": 2}
+
+    snap = metrics.snapshot()
+    assert snap["stages"]["llm"]["count"] == 2
+    assert snap["stages"]["llm"]["p99"] == 0.75
+    text = metrics.to_prometheus()
+    assert 'hybrid_stage_seconds{stage="llm",quantile="0.5"}' in text
+    assert 'hybrid_events_total{event="embedding_cache_hits"} 2' in text
+
+
+def test_disabled_tracing_is_a_noop(monkeypatch):
+    metrics = tracing.Metrics()
+    monkeypatch.setattr(tracing, "metrics", metrics)
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+
+    assert tracing.span("x") is tracing.span("y")
+    with tracing.span("x"):
+        pass
+    tracing.incr("hits")
+    assert metrics.snapshot() == {"stages": {}, "counters": {}}
+
+
+def test_nested_trace_reports_to_outer(monkeypatch):
+    monkeypatch.setattr(tracing, "metrics", tracing.Metrics())
+    with tracing.trace() as outer:
+        tracing.incr("hits")
+        with tracing.trace() as inner:
+            tracing.record("llm", 0.5)
+            tracing.incr("hits")
+    assert inner.breakdown() == {"llm": 0.5} and inner.counters == {"hits": 1}
+    assert outer.breakdown() == {"llm": 0.5} and outer.counters == {"hits": 2}
@@ -0,0 +1,76 @@
+import numpy as np
+
+from src.vector_store import LocalVectorStore
+
+
+def test_local_store_upsert_query_delete(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.upsert(vectors=[
+        ("a", [1.0, 0.0, 0.0], {"text_snippet": "alpha"}),
+        ("b", [0.0, 1.0, 0.0], {"text_snippet": "beta"}),
+        {"id": "c", "values": [0.7, 0.7, 0.0], "metadata": {"text_snippet": "gamma"}},
+    ])
+    res = store.query(vector=[1.0, 0.1, 0.0], top_k=2, include_metadata=True)
+    assert [m["id"] for m in res["matches"]] == ["a", "c"]
+    assert res["matches"][0]["metadata"]["text_snippet"] == "alpha"
+
+    store.delete(["a"])
+    assert store.query(vector=[1.0, 0.0, 0.0], top_k=1)["matches"][0]["id"] == "c"
+    assert store.describe_index_stats()["total_vector_count"] == 2
+
+    # upserting an existing id overwrites it in place
+    store.upsert(vectors=[("b", [1.0, 0.0, 0.0], {"text_snippet": "beta2"})])
+    assert store.query(vector=[1.0, 0.0, 0.0], top_k=1)["matches"][0]["metadata"]["text_snippet"] == "beta2"
+    store.close()
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert reopened.describe_index_stats()["total_vector_count"] == 2
+    assert reopened.query(vector=[0.7, 0.7, 0.0], top_k=1)["matches"][0]["id"] == "c"
+
+
+def test_local_store_ivf_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(1)
+    vecs = rng.normal(size=(400, 8)).astype(np.float32)
+    store = LocalVectorStore(str(tmp_path), ivf_lists=8, nprobe=8)
+    store.upsert(vectors=[(f"v{i}", v.tolist()) for i, v in enumerate(vecs)])
+    store.build_ivf()
+    assert store.describe_index_stats()["ivf_lists"] == 8
+    # probing every partition must reproduce exact search
+    res = store.query(vector=vecs[17].tolist(), top_k=3)
+    assert res["matches"][0]["id"] == "v17"
+
+
+def test_local_store_ivf_widens_probe_past_empty_lists(tmp_path):
+    rng = np.random.default_rng(2)
+    vecs = rng.normal(size=(400, 8)).astype(np.float32)
+    store = LocalVectorStore(str(tmp_path), ivf_lists=8, nprobe=1)
+    store.upsert(vectors=[(f"v{i}", v.tolist()) for i, v in enumerate(vecs)])
+    store.build_ivf()
+    # empty the partition closest to the query (and leave a second one with a single row)
+    q = vecs[17] / np.linalg.norm(vecs[17])
+    order = np.argsort(-(store._centroids @ q))
+    assign = store._assign[:400]
+    emptied = [f"v{i}" for i in np.flatnonzero(assign == order[0])]
+    emptied += [f"v{i}" for i in np.flatnonzero(assign == order[1])[1:]]
+    store.delete(emptied)
+
+    res = store.query(vector=vecs[17].tolist(), top_k=5)
+    assert len(res["matches"]) == 5
+    # asking for every live row widens to all lists, i.e. a flat scan
+    live = 400 - len(emptied)
+    assert len(store.query(vector=vecs[17].tolist(), top_k=live)["matches"]) == live
+
+
+def test_local_store_reuses_deleted_slots_lowest_first(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.upsert(vectors=[(f"v{i}", [1.0, float(i)]) for i in range(6)])
+    store.delete(["v4", "v1"])
+    store.upsert(vectors=[("x", [0.0, 1.0]), ("y", [1.0, 1.0]), ("z", [1.0, -1.0])])
+    assert [store._slots[k] for k in ("x", "y", "z")] == [1, 4, 6]
+    store.delete(["v2"])
+    store.close()
+
+    reopened = LocalVectorStore(str(tmp_path))
+    reopened.upsert(vectors=[("w", [2.0, 1.0])])
+    assert reopened._slots["w"] == 2
+    assert reopened.query(vector=[0.0, 1.0], top_k=1)["matches"][0]["id"] == "x"